@@ -0,0 +1,90 @@
+import pytest
+from cases import CASES, MATRIX_REQUEST
+from fastapi.testclient import TestClient
+
+from tocomo import encoding
+from tocomo.app import RESULT_CACHE, app, encode_json
+from tocomo.batch import run_model_sm1_batch
+from tocomo.matrix import RunMatrix, compute_matrix
+from tocomo.reactions import run_model_sm1
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "cached"])
+@pytest.mark.parametrize("detail", ["values", "steps"])
+def test_run_matrix(benchmark, client, detail, cached):
+    def post():
+        response = client.post(
+            "/api/run_matrix", json={**MATRIX_REQUEST, "detail": detail}
+        )
+        assert response.status_code == 200
+
+    benchmark.pedantic(
+        post,
+        setup=None if cached else RESULT_CACHE.clear,
+        rounds=10,
+        warmup_rounds=1,
+    )
+
+
+def test_run_reaction(benchmark, client):
+    body = {m.value: v for m, v in CASES["very high NO2"].items()}
+    benchmark.pedantic(
+        client.post,
+        args=("/api/run_reaction",),
+        kwargs={"json": body},
+        setup=RESULT_CACHE.clear,
+        rounds=20,
+        warmup_rounds=1,
+    )
+
+
+# Scenarios solved one request at a time or in a single batch request
+SCENARIOS = [
+    {m.value: v * (1 + i / 100) for m, v in initial.items()}
+    for i in range(15)
+    for initial in CASES.values()
+]
+
+
+@pytest.mark.parametrize("batched", [False, True], ids=["single", "batch"])
+def test_run_reaction_scenarios(benchmark, client, batched):
+    def post():
+        if batched:
+            client.post("/api/run_reaction/batch", json={"scenarios": SCENARIOS})
+        else:
+            for body in SCENARIOS:
+                client.post("/api/run_reaction", json=body)
+
+    benchmark.pedantic(post, setup=RESULT_CACHE.clear, rounds=5, warmup_rounds=1)
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    def solve(initial):
+        batch = run_model_sm1_batch(initial)
+        return [batch.result(row) for row in range(len(batch))]
+
+    return compute_matrix(RunMatrix.model_validate(MATRIX_REQUEST), solve)
+
+
+@pytest.mark.parametrize("detail", ["final", "steps"])
+def test_serialize_json(benchmark, matrix, detail):
+    benchmark(lambda: encode_json(matrix.result_data(detail)))
+
+
+def test_serialize_result(benchmark):
+    result = run_model_sm1(CASES["very high NO2"])
+    benchmark(lambda: encode_json(result.content()))
+
+
+def test_serialize_binary(benchmark, matrix):
+    benchmark(
+        encoding.encode,
+        {"x": matrix.x, "y": matrix.y, "z": matrix.values, "final": matrix.final},
+    )
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from cases import CASES
+
+from tocomo.batch import run_model_sm1_batch, to_array
+from tocomo.reactions import MOLECULES, M, REACTIONS, SolverMode, run_model_sm1
+
+
+@pytest.mark.parametrize("reaction", REACTIONS, ids=lambda r: f"reaction {r.index}")
+def test_reaction_do(benchmark, reaction):
+    def do():
+        concentrations = {**{m: 0.0 for m in MOLECULES}, **CASES["form defaults"]}
+        return reaction.do(concentrations)
+
+    benchmark(do)
+
+
+@pytest.mark.parametrize("mode", list(SolverMode))
+@pytest.mark.parametrize("case", list(CASES))
+def test_run_model_sm1(benchmark, case, mode):
+    benchmark(run_model_sm1, CASES[case], mode=mode)
+
+
+def test_run_model_sm1_batch(benchmark):
+    # The default 20 by 20 matrix
+    axis = np.arange(0.5, 10.5, 0.5)
+    initial = to_array(
+        [
+            {**CASES["form defaults"], M.NO2: row, M.O2: column}
+            for row in axis
+            for column in axis
+        ]
+    )
+    benchmark(run_model_sm1_batch, initial)
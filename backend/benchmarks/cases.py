@@ -0,0 +1,23 @@
+"""Initial concentrations shared by the benchmarks."""
+
+from __future__ import annotations
+
+from tocomo.reactions import M, Molecule
+
+CASES: dict[str, dict[Molecule, float]] = {
+    "form defaults": {M.H2O: 30, M.O2: 30, M.SO2: 10, M.NO2: 20},
+    "high NO2": {M.H2O: 1000, M.O2: 1000, M.SO2: 10, M.NO2: 1000},
+    "very high NO2": {M.H2O: 1e6, M.O2: 1e6, M.SO2: 10, M.NO2: 1e6},
+    "NO cycling": {M.H2O: 1000, M.O2: 1000, M.SO2: 10, M.NO: 1000},
+    "NO2 limited eq 1": {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1},
+    "H2S rich": {M.H2O: 30, M.O2: 30, M.SO2: 10, M.NO2: 20, M.H2S: 5},
+    "H2S excess": {M.H2O: 30, M.O2: 30, M.SO2: 10, M.NO2: 20, M.H2S: 100},
+}
+
+MATRIX_REQUEST = {
+    "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+    "pipeInputs": {"inner_diameter": 30, "drop_out_length": 1000, "flowrate": 20},
+    "columnValue": "o2",
+    "rowValue": "no2",
+    "valueValue": "corrosion_rate",
+}
@@ -0,0 +1,94 @@
+"""
+Time a cold start of the backend: importing the app in a fresh interpreter,
+and starting the production server until it answers its first request.
+
+Run with `python benchmarks/cold_start.py` from the backend directory, which
+has gunicorn.conf.py. Pass --workers to compare web worker counts.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.error import URLError
+
+SRC = os.path.join(os.path.dirname(__file__), os.pardir, "src")
+
+
+def environment(**variables: str) -> dict[str, str]:
+    env = dict(os.environ, **variables)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC, env.get("PYTHONPATH")]))
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port: int = s.getsockname()[1]
+        return port
+
+
+def time_import() -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import tocomo.app"], env=environment(), check=True
+    )
+    return time.perf_counter() - start
+
+
+def time_server(workers: int) -> tuple[float, float]:
+    """Seconds until the first response, and until a graceful shutdown"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/form_config"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "tocomo.app:app"],
+        env=environment(
+            TOCOMO_BIND=f"127.0.0.1:{port}", TOCOMO_WEB_WORKERS=str(workers)
+        ),
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    response.read()
+                break
+            except (URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError("the server exited") from None
+                time.sleep(0.01)
+        ready = time.perf_counter() - start
+    finally:
+        stopping = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        server.wait(60)
+    return ready, time.perf_counter() - stopping
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    imports = [time_import() for _ in range(args.repeat)]
+    print(f"{'import tocomo.app':<24}{statistics.median(imports) * 1e3:>10.0f} ms")
+    print(f"{'workers':<10}{'first response [ms]':>24}{'shutdown [ms]':>16}")
+    for workers in args.workers:
+        ready, stopped = zip(*(time_server(workers) for _ in range(args.repeat)))
+        print(
+            f"{workers:<10}{statistics.median(ready) * 1e3:>24.0f}"
+            f"{statistics.median(stopped) * 1e3:>16.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare compressing run_matrix responses for the default 20×20 grid: the size
+of the payload, and the time from sending the request until the client has
+decoded the response, for each detail and content coding. Solver results are
+cached after the first request, so the times are those of serializing,
+compressing and decoding. The time the payload takes to transfer is added for
+each --mbps given.
+
+Run with `python benchmarks/compression.py` from the backend directory. br and
+zstd are only compared if brotli and zstandard are installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+from cases import MATRIX_REQUEST
+from fastapi.testclient import TestClient
+
+from tocomo.app import app
+from tocomo.compression import CODECS, CompressionMiddleware, CompressionSettings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--mbps", type=float, nargs="+", default=[10.0, 100.0])
+    parser.add_argument(
+        "--level",
+        action="append",
+        default=[],
+        metavar="CODING:LEVEL",
+        help="compress with another level than the default, may be repeated",
+    )
+    args = parser.parse_args()
+    levels = {name: codec.default_level for name, codec in CODECS.items()}
+    levels.update((c, int(level)) for c, level in (s.split(":") for s in args.level))
+
+    settings = CompressionSettings(levels, min_size=0)
+    with TestClient(CompressionMiddleware(app, settings)) as client:
+        print(
+            f"{'detail':<8}{'coding':<10}{'bytes':>10}{'ratio':>8}{'local [ms]':>12}"
+            + "".join(f"{f'{mbps:g} Mbit/s [ms]':>20}" for mbps in args.mbps)
+        )
+        for detail in ("values", "final", "steps"):
+            body = {**MATRIX_REQUEST, "detail": detail}
+            identity = 0
+            for coding in ("identity", *levels):
+                headers = {"Accept-Encoding": coding}
+                client.post("/api/run_matrix", json=body, headers=headers)
+                times = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    response = client.post(
+                        "/api/run_matrix", json=body, headers=headers
+                    )
+                    response.read()
+                    times.append(time.perf_counter() - start)
+                size = int(response.headers["content-length"])
+                identity = identity or size
+                local = statistics.median(times)
+                name = coding if coding == "identity" else f"{coding}:{levels[coding]}"
+                print(
+                    f"{detail:<8}{name:<10}{size:>10}{identity / size:>8.1f}"
+                    f"{local * 1e3:>12.1f}"
+                    + "".join(
+                        f"{(local + size * 8 / (mbps * 1e6)) * 1e3:>20.1f}"
+                        for mbps in args.mbps
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
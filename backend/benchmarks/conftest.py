@@ -0,0 +1,21 @@
+"""
+Benchmarks run with pytest-benchmark, see the README for how to store and
+compare against a baseline.
+"""
+
+import pytest
+from pytest_benchmark.utils import parse_compare_fail
+
+# Fail a comparison against a stored baseline when the mean time of any
+# benchmark has increased by more than this, unless
+# --benchmark-compare-fail is given
+REGRESSION_THRESHOLD = "mean:15%"
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config: pytest.Config) -> None:
+    if config.getoption("benchmark_compare"):
+        if not config.getoption("benchmark_compare_fail"):
+            config.option.benchmark_compare_fail = [
+                parse_compare_fail(REGRESSION_THRESHOLD)
+            ]
@@ -0,0 +1,29 @@
+"""
+Compare the number of steps and wall time of the iterative and event-jump
+solver modes on inputs where NO₂ is repeatedly regenerated.
+
+Run with `python benchmarks/solver_modes.py` from the backend directory.
+"""
+
+from __future__ import annotations
+
+import timeit
+
+from cases import CASES
+
+from tocomo.reactions import SolverMode, run_model_sm1
+
+
+def main() -> None:
+    print(f"{'case':<20}{'mode':<12}{'steps':>8}{'time [µs]':>12}")
+    for name, initial in CASES.items():
+        for mode in SolverMode:
+            steps = len(run_model_sm1(initial, mode=mode).steps)
+            number, total = timeit.Timer(
+                lambda: run_model_sm1(initial, mode=mode)  # noqa: B023
+            ).autorange()
+            print(f"{name:<20}{mode:<12}{steps:>8}{total / number * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Production server settings, which gunicorn reads from the working directory
+when started with
+
+    gunicorn tocomo.app:app
+
+The app is imported once in the master process before the workers are forked
+from it, so the reactions, the form configuration and any lookup table are
+only loaded once and shared by the workers, page for page, until written to.
+Each worker runs its own solver pool, which by default gets an equal share of
+the CPUs. Those are the CPUs of the container's quota, not of its node, see
+tocomo.pool.available_cpus. Every worker keeps its own caches, so there are at
+most MAX_WORKERS of them unless TOCOMO_WEB_WORKERS says otherwise.
+
+Requests go to whichever worker is free, so with more than one worker,
+background jobs and added reaction sets are only found again if they are
+stored where every worker sees them, see TOCOMO_JOB_DB and
+TOCOMO_REACTION_SET_DIR. Metrics, the result cache and the grids kept for
+incremental updates stay per worker.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+from tocomo.pool import available_cpus
+
+# Read .env before the defaults below, which it should be able to override
+load_dotenv()
+
+MAX_WORKERS = 4
+
+cpus = available_cpus()
+
+bind = os.environ.get("TOCOMO_BIND", "0.0.0.0:5005")
+workers = int(os.environ.get("TOCOMO_WEB_WORKERS", min(cpus, MAX_WORKERS)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Seconds workers get to finish the requests in flight after SIGTERM, and
+# before a worker that stops responding is restarted
+graceful_timeout = int(os.environ.get("TOCOMO_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("TOCOMO_WORKER_TIMEOUT", 120))
+
+os.environ.setdefault("TOCOMO_SOLVER_WORKERS", str(max(1, cpus // workers)))
+
+# Where workers must share what they store, see above
+SHARED = ("TOCOMO_JOB_DB", "TOCOMO_REACTION_SET_DIR")
+
+
+def on_starting(server):  # type: ignore[no-untyped-def]
+    unshared = [name for name in SHARED if not os.environ.get(name)]
+    if workers > 1 and unshared:
+        server.log.warning(
+            "%s unset with %d workers: each worker keeps its own jobs and "
+            "reaction sets, and requests for those of another worker get 404",
+            " and ".join(unshared),
+            workers,
+        )
+
+
+def post_fork(server, worker):  # type: ignore[no-untyped-def]
+    from tocomo.app import JOB_QUEUE
+
+    JOB_QUEUE.store.reopen()
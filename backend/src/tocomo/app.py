@@ -1,30 +1,145 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Annotated, Any
+import logging
+import os
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from functools import partial
+from typing import Annotated, Any, TypeVar
 
 import numpy as np
+import numpy.typing as npt
+import orjson
+import pandas as pd
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import (
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-from pydantic import BaseModel, Field
-
-from tocomo.corrosion_calc import (
-    corrosion_rate_H2SO4,
-    corrosion_rate_HNO3,
-    surface_area,
+from fastapi.responses import ORJSONResponse, RedirectResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from tocomo import encoding
+from tocomo.batch import BatchResult
+from tocomo.cache import CacheStats, ResultCache
+from tocomo.compression import CompressionMiddleware, CompressionSettings
+from tocomo.http_cache import CachePolicy, etag, matches, source_key
+from tocomo.incremental import (
+    GridHistory,
+    RunMatrixUpdate,
+    matrix_changes,
+    update_matrix,
+)
+from tocomo.jobs import Job, JobContext, JobQueue, JobStatus
+from tocomo.lookup import LookupTable
+from tocomo.matrix import (
+    Detail,
+    Matrix,
+    RunMatrix,
+    RunMatrixCell,
+    RunMatrixStream,
+    compute_matrix,
+    iter_matrix_rows,
 )
+from tocomo.metrics import (
+    CONTENT_TYPE,
+    Gauge,
+    Registry,
+    RequestMetrics,
+    RequestMetricsMiddleware,
+    SolverMetrics,
+)
+from tocomo.pool import SolverPool
+from tocomo.reaction_sets import ReactionSet, ReactionSetInfo, ReactionSets
 from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    DEFAULT_LIMITS,
+    MOLECULE_INDEX,
     MOLECULE_TEXT,
+    MOLECULES,
     REACTIONS,
+    CompiledReactions,
     Molecule,
     Result,
-    run_model_sm1,
+    SolverLimits,
+    SolverStatus,
+)
+from tocomo.scenarios import (
+    CSV,
+    PARQUET,
+    ReactionBatch,
+    read_table,
+    solve_scenarios,
+    table_content,
+    write_table,
 )
+from tocomo.sweep import PipeInput, Sweep, SweepResult, compute_sweep
+from tocomo.trace import LoggingTracer, Tracer
 
 load_dotenv()  # take environment variables from .env.
-app = FastAPI()
+
+SOLVER_POOL = SolverPool.from_env()
+JOB_QUEUE = JobQueue.from_env()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    yield
+    JOB_QUEUE.shutdown()
+    SOLVER_POOL.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Set TOCOMO_TRACE to log every reaction step taken by the solvers
+TRACER: Tracer | None = None
+if os.environ.get("TOCOMO_TRACE"):
+    logging.basicConfig()
+    logging.getLogger("tocomo.trace").setLevel(logging.DEBUG)
+    TRACER = LoggingTracer()
+
+RESULT_CACHE = ResultCache.from_env()
+SOLVER_LIMITS = SolverLimits.from_env()
+LOOKUP_TABLE = LookupTable.from_env(COMPILED_REACTIONS, SOLVER_LIMITS)
+REACTION_SETS = ReactionSets.from_env()
+GRID_HISTORY = GridHistory.from_env()
+CACHE_POLICY = CachePolicy.from_env()
+COMPRESSION = CompressionSettings.from_env()
+
+# What solver responses depend on besides their request, see solver_etag
+SOLVER_KEY = etag(source_key(), SOLVER_LIMITS, RESULT_CACHE.decimals)
+
+METRICS = Registry()
+# Set TOCOMO_SLOW_SOLVE_STEPS to log solves taking more steps than this
+SOLVER_METRICS = SolverMetrics(
+    METRICS, slow_steps=int(os.environ.get("TOCOMO_SLOW_SOLVE_STEPS", 100))
+)
+REQUEST_METRICS = RequestMetrics(METRICS)
+
+
+def cache_stat(field: str) -> Callable[[], float]:
+    return lambda: float(getattr(RESULT_CACHE.stats(), field))
+
+
+for field in ("hits", "misses", "size"):
+    METRICS.register(
+        Gauge(
+            f"tocomo_result_cache_{field}", f"Result cache {field}", cache_stat(field)
+        )
+    )
+
+# The solvers behind the result cache, which are only called on cache misses
+SOLVE = SOLVER_METRICS.solver(SOLVER_POOL.run_model_sm1)
+SOLVE_BATCH = SOLVER_METRICS.batch_solver(SOLVER_POOL.run_model_sm1_batch)
 
 origins = [
     "http://localhost:3000",
@@ -100,11 +215,70 @@ FORM_CONFIG = FormConfig(
     reactions={x.index: str(x) for x in REACTIONS},
     reaction_order=[x.index for x in REACTIONS],
 )
+FORM_CONFIG_JSON = FORM_CONFIG.model_dump_json(by_alias=True).encode()
+FORM_CONFIG_ETAG = etag(FORM_CONFIG_JSON)
+
+
+@app.get("/api/form_config", response_model=FormConfig)
+async def get_config(request: Request) -> Response:
+    if matches(request, FORM_CONFIG_ETAG):
+        return CACHE_POLICY.not_modified(FORM_CONFIG_ETAG, public=True)
+    return Response(
+        FORM_CONFIG_JSON,
+        media_type="application/json",
+        headers=CACHE_POLICY.headers(FORM_CONFIG_ETAG, public=True),
+    )
+
+
+def reaction_set(key: str | None) -> CompiledReactions:
+    """The reaction set with the given key, or the default reactions for None"""
+    if (reactions := REACTION_SETS.get(key)) is None:
+        raise HTTPException(404, "No such reaction set, add it first")
+    return reactions
+
+
+def solver_limits(reactions: CompiledReactions) -> SolverLimits:
+    """
+    The limits to solve `reactions` with: SOLVER_LIMITS, but always with a
+    step limit for added reaction sets, whose reactions may cycle forever
+    """
+    if reactions is COMPILED_REACTIONS or SOLVER_LIMITS.max_steps is not None:
+        return SOLVER_LIMITS
+    return replace(SOLVER_LIMITS, max_steps=DEFAULT_LIMITS.max_steps)
+
+
+def check_request_size(data: RunMatrix) -> None:
+    """Reject grids too large to be solved within a request with a 422"""
+    try:
+        data.check_request_size()
+    except ValueError as e:
+        raise HTTPException(422, str(e)) from None
+
+
+@app.post("/api/reaction_sets", responses={422: {}})
+async def add_reaction_set(data: ReactionSet) -> ReactionSetInfo:
+    """
+    Compile a set of reactions, in priority order, for use by the solver
+    endpoints. Pass the returned id as reactionSet to solve with it. Adding
+    the same active reactions in the same order again returns the same id.
+    """
+    return ReactionSetInfo.of(REACTION_SETS.add(data))
+
+
+@app.get("/api/reaction_sets")
+async def list_reaction_sets() -> list[ReactionSetInfo]:
+    """The default reactions followed by the added reaction sets"""
+    return [ReactionSetInfo.of(reactions) for reactions in REACTION_SETS.all()]
 
 
-@app.get("/api/form_config")
-async def get_config() -> FormConfig:
-    return FORM_CONFIG
+@app.get("/api/reaction_sets/{reaction_set_id}", responses={404: {}})
+async def get_reaction_set(reaction_set_id: str) -> ReactionSetInfo:
+    return ReactionSetInfo.of(reaction_set(reaction_set_id))
+
+
+@app.get("/api/cache_stats")
+async def cache_stats() -> CacheStats:
+    return RESULT_CACHE.stats()
 
 
 @app.get("/api/hello")
@@ -120,6 +294,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Set TOCOMO_COMPRESSION to compress responses, see CompressionSettings
+if COMPRESSION.levels:
+    app.add_middleware(CompressionMiddleware, settings=COMPRESSION)
+app.add_middleware(RequestMetricsMiddleware, metrics=REQUEST_METRICS)
+
+
+@app.get("/metrics", response_class=Response)
+async def metrics() -> Response:
+    """Solver, cache and request metrics in the Prometheus text format"""
+    return Response(METRICS.render(), media_type=CONTENT_TYPE)
 
 
 class PipeInputs(BaseModel):
@@ -128,14 +312,6 @@ class PipeInputs(BaseModel):
     flowrate: float
 
 
-class RunMatrix(BaseModel):
-    row: Molecule = Field(alias="rowValue")
-    column: Molecule = Field(alias="columnValue")
-    value: str = Field(alias="valueValue")
-    inputs: dict[Molecule, float]
-    pipe_inputs: dict[str, float] = Field(default_factory=dict, alias="pipeInputs")
-
-
 class Concentrations(BaseModel):
     h2o: float = Field(default=0)
     o2: float = Field(default=0)
@@ -154,92 +330,672 @@ class RunReactionResult(BaseModel):
     final: Concentrations
     change: Concentrations
     steps: list[Any] = []
+    status: SolverStatus = SolverStatus.CONVERGED
+
+
+class Step(BaseModel):
+    posterior: dict[Molecule, float]
+    multiplier: float
+    reaction_index: Annotated[int, Field(serialization_alias="reactionIndex")]
+
+
+class ResultContent(BaseModel):
+    """The form of Result.content, for the API documentation"""
+
+    initial: dict[Molecule, float]
+    final: dict[Molecule, float]
+    aggregated: dict[Molecule, float]
+    steps: list[Step]
+    status: SolverStatus
+
+
+# Positions in concentration vectors of the fields of Concentrations
+CONCENTRATION_FIELDS = [
+    (name, MOLECULE_INDEX[Molecule(name)]) for name in Concentrations.model_fields
+]
+
 
+def concentrations_content(vector: list[float]) -> dict[str, float]:
+    return {name: vector[i] for name, i in CONCENTRATION_FIELDS}
 
-@app.post("/api/run_reaction")
-async def run_reaction(input_concs: Concentrations) -> RunReactionResult:
-    result = run_model_sm1(
-        {Molecule[k.upper()]: v for k, v in input_concs.model_dump().items()}
+
+def encode_json(content: Any) -> bytes:
+    """JSON of `content`, which may contain numpy arrays and enum keys"""
+    return orjson.dumps(
+        content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
     )
-    keys = set(result.final.keys()).union(set(result.initial.keys()))
-    change = {k: result.final.get(k, 0) - result.initial.get(k, 0) for k in keys}
-    steps = []
-    for step in result.steps:
-        steps.append(
-            {
-                "Index": str(step.reaction_index),
-                "Reaction": FORM_CONFIG.reactions[step.reaction_index],
-                "Multiplier": step.multiplier,
-                **{MOLECULE_TEXT[m]: c for m, c in step.posterior.items()},
-            }
+
+
+def solver_etag(request: Request, *parts: object) -> str:
+    """
+    Entity tag of a solver response, from the endpoint and the `parts` of
+    the request it depends on. Responses are computed deterministically from
+    these, so a matching If-None-Match is answered without solving.
+    """
+    return etag(SOLVER_KEY, request.url.path, *parts)
+
+
+def public(request: Request) -> bool:
+    """
+    Whether shared caches may store the solver response to `request`. Those
+    to GET requests are identified by their URL, while caches cannot tell
+    POST requests apart by their body.
+    """
+    return request.method == "GET"
+
+
+def solver_headers(
+    request: Request, tag: str, statuses: Iterable[SolverStatus]
+) -> dict[str, str]:
+    """
+    Caching headers of a solver response. Solves cut short by the time budget
+    depend on the machine's load, so responses with any are not tagged.
+    """
+    if any(status == SolverStatus.TIME_BUDGET for status in statuses):
+        return CACHE_POLICY.headers(None)
+    return CACHE_POLICY.headers(tag, public(request))
+
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+def query_json(model: type[Model]) -> Callable[[str], Model]:
+    """
+    Dependency reading a request body of type `model` from the JSON in the
+    data query parameter, for the GET variants of the solver endpoints
+    """
+
+    def parse(data: Annotated[str, Query(description="The request as JSON")]) -> Model:
+        try:
+            return model.model_validate_json(data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors()) from None
+
+    return parse
+
+
+@app.post(
+    "/api/run_reaction",
+    response_model=RunReactionResult,
+    responses={304: {}, 404: {}},
+)
+async def run_reaction(
+    input_concs: Concentrations,
+    request: Request,
+    reaction_set_id: Annotated[str | None, Query(alias="reactionSet")] = None,
+) -> Response:
+    reactions = reaction_set(reaction_set_id)
+    tag = solver_etag(request, reactions.key, input_concs.model_dump_json())
+    if matches(request, tag):
+        return CACHE_POLICY.not_modified(tag, public(request))
+    result = await run_in_threadpool(
+        RESULT_CACHE.run_model_sm1,
+        {Molecule[k.upper()]: v for k, v in input_concs.model_dump().items()},
+        TRACER,
+        reactions,
+        solver=SOLVE,
+        limits=solver_limits(reactions),
+    )
+    names = {r.index: str(r.reaction) for r in reactions.reactions}
+    columns = [MOLECULE_TEXT[m] for m in MOLECULES]
+    steps = [
+        {
+            "Index": str(index),
+            "Reaction": names[index],
+            "Multiplier": multiplier,
+            **dict(zip(columns, posterior)),
+        }
+        for index, multiplier, posterior in zip(
+            result.reaction_indices.tolist(),
+            result.multipliers.tolist(),
+            result.posteriors.tolist(),
         )
+    ]
+
+    return ORJSONResponse(
+        {
+            "initial": concentrations_content(result.initial_vector.tolist()),
+            "final": concentrations_content(result.final_vector.tolist()),
+            "change": concentrations_content(
+                (result.final_vector - result.initial_vector).tolist()
+            ),
+            "steps": steps,
+            "status": result.status,
+        },
+        headers=solver_headers(request, tag, [result.status]),
+    )
 
-    return RunReactionResult(
-        initial=Concentrations.model_validate(result.initial),
-        final=Concentrations.model_validate(result.final),
-        change=Concentrations.model_validate(change),
-        steps=steps,
+
+@app.get(
+    "/api/run_reaction",
+    response_model=RunReactionResult,
+    responses={304: {}, 404: {}, 422: {}},
+)
+async def get_run_reaction(
+    input_concs: Annotated[Concentrations, Depends(query_json(Concentrations))],
+    request: Request,
+    reaction_set_id: Annotated[str | None, Query(alias="reactionSet")] = None,
+) -> Response:
+    """run_reaction, with the concentrations as JSON in the data parameter"""
+    return await run_reaction(input_concs, request, reaction_set_id)
+
+
+async def scenario_table(
+    frame: pd.DataFrame,
+    pipe_inputs: dict[PipeInput, float],
+    reactions: CompiledReactions,
+    request: Request,
+) -> dict[str, Any] | Response:
+    # The time budget applies to the whole request, not to each chunk
+    limits = solver_limits(reactions)
+    deadline = limits.deadline()
+
+    def solve(initial: npt.NDArray[np.float64]) -> BatchResult:
+        return SOLVE_BATCH(initial, reactions, TRACER, limits, deadline)
+
+    try:
+        table = await run_in_threadpool(solve_scenarios, frame, solve, pipe_inputs)
+    except ValueError as e:
+        raise HTTPException(422, str(e)) from None
+
+    accept = request.headers.get("accept", "")
+    for media_type in (CSV, PARQUET):
+        if media_type in accept:
+            try:
+                content = await run_in_threadpool(write_table, table, media_type)
+            except ImportError:
+                raise HTTPException(406, "Writing Parquet needs pyarrow") from None
+            return Response(content, media_type=media_type, headers={"Vary": "Accept"})
+    return ORJSONResponse(table_content(table))
+
+
+@app.post(
+    "/api/run_reaction/batch",
+    response_model=None,
+    responses={200: {"content": {CSV: {}, PARQUET: {}}}, 404: {}, 406: {}},
+)
+async def run_reaction_batch(
+    data: ReactionBatch, request: Request, response: Response
+) -> dict[str, Any] | Response:
+    """
+    Solve many scenarios at once, giving a table with a column per output
+    and a row per scenario: the solver status, the final concentration and
+    change of each molecule, and the corrosion rates, which are null for
+    scenarios without pipe inputs. Send `Accept: text/csv` or
+    `Accept: application/vnd.apache.parquet` to get the table in that format.
+    """
+    reactions = reaction_set(data.reaction_set)
+    response.headers["Vary"] = "Accept"
+    return await scenario_table(data.frame(), data.pipe_inputs, reactions, request)
+
+
+@app.post(
+    "/api/run_reaction/batch/upload",
+    response_model=None,
+    responses={200: {"content": {CSV: {}, PARQUET: {}}}, 404: {}, 406: {}, 415: {}},
+)
+async def run_reaction_batch_upload(
+    file: UploadFile,
+    request: Request,
+    response: Response,
+    reaction_set_id: Annotated[str | None, Query(alias="reactionSet")] = None,
+) -> dict[str, Any] | Response:
+    """
+    Solve the scenarios in an uploaded CSV or Parquet file, with a column per
+    molecule or pipe input, see run_reaction_batch
+    """
+    reactions = reaction_set(reaction_set_id)
+    parquet = file.content_type == PARQUET or (file.filename or "").endswith(".parquet")
+    content = await file.read()
+    try:
+        frame = await run_in_threadpool(
+            read_table, content, PARQUET if parquet else CSV
+        )
+    except ImportError:
+        raise HTTPException(415, "Reading Parquet needs pyarrow") from None
+    except ValueError as e:
+        raise HTTPException(422, str(e)) from None
+    response.headers["Vary"] = "Accept"
+    return await scenario_table(frame, {}, reactions, request)
+
+
+def lookup_table(data: RunMatrix, reactions: CompiledReactions) -> LookupTable | None:
+    """The lookup table, if the grid of `data` can be interpolated from it"""
+    if (
+        LOOKUP_TABLE is not None
+        and LOOKUP_TABLE.reactions == reactions.key
+        and LOOKUP_TABLE.covers(data)
+    ):
+        return LOOKUP_TABLE
+    return None
+
+
+@app.post(
+    "/api/run_matrix",
+    response_model=None,
+    responses={200: {"content": {encoding.MEDIA_TYPE: {}}}, 304: {}, 404: {}},
+)
+async def run_matrix(data: RunMatrix, request: Request) -> Response:
+    """
+    Solve a grid of concentrations. Send `Accept: application/vnd.tocomo.matrix`
+    to get the plot and final concentrations as binary arrays, see
+    tocomo.encoding. Grids covered by the lookup table are interpolated from
+    it instead of solved. Cells whose solve stopped at the step or time limit
+    are listed as [row, column] pairs in "partial", or marked in its binary
+    array, which is only included if there are any.
+    """
+    check_request_size(data)
+    reactions = reaction_set(data.reaction_set)
+    binary = encoding.accepts(request.headers.get("accept"))
+    table = lookup_table(data, reactions)
+    tag = solver_etag(
+        request,
+        reactions.key,
+        None if table is None else table.key(),
+        binary,
+        data.model_dump_json(),
     )
+    if matches(request, tag):
+        return CACHE_POLICY.not_modified(tag, public(request), vary="Accept")
+    if table is not None:
+        matrix = await run_in_threadpool(table.matrix, data)
+    else:
+        matrix = await run_in_threadpool(
+            compute_matrix,
+            data,
+            partial(
+                RESULT_CACHE.run_model_sm1_batch,
+                tracer=TRACER,
+                reactions=reactions,
+                solver=SOLVE_BATCH,
+                limits=solver_limits(reactions),
+            ),
+        )
+
+    headers = {
+        "Vary": "Accept",
+        **solver_headers(
+            request,
+            tag,
+            (r.status for row in matrix.results for r in row if r is not None),
+        ),
+    }
+    if binary:
+        arrays: dict[str, npt.NDArray[Any]] = {
+            "x": matrix.x,
+            "y": matrix.y,
+            "z": matrix.values,
+        }
+        if data.refine is not None:
+            arrays["computed"] = matrix.computed
+        if (stopped := matrix.partial).any():
+            arrays["partial"] = stopped
+        if data.detail != Detail.VALUES:
+            arrays["final"] = matrix.final
+        return Response(
+            encoding.encode(
+                arrays,
+                {
+                    "molecules": list(MOLECULES),
+                    "layout": {"grid": "bottom to top"},
+                },
+            ),
+            media_type=encoding.MEDIA_TYPE,
+            headers=headers,
+        )
 
+    return ORJSONResponse(matrix_content(data, matrix), headers=headers)
 
-@app.post("/api/run_matrix")
-async def run_matrix(data: RunMatrix) -> dict[str, Any]:
-    xrange = np.arange(0.5, 10.5, 0.5)
-    yrange = np.arange(0.5, 10.5, 0.5)
-    values = np.empty(shape=(len(yrange), len(xrange)), dtype=np.float64)
-
-    value_key: Molecule | str = data.value
-    for m in Molecule.__members__.values():
-        if m.value == data.value:
-            value_key = m
-            break
-
-    initial_concentrations = {**{m: 0.0 for m in M.__members__.values()}, **data.inputs}
-
-    results: list[list[Result]] = []
-    for yindex, yvalue in enumerate(yrange):
-        results.append([])
-        for xindex, xvalue in enumerate(xrange):
-            result = run_model_sm1(
-                {**initial_concentrations, data.row: yvalue, data.column: xvalue}
-            )
-
-            if isinstance(value_key, Molecule):
-                values[yindex, xindex] = result.final[value_key]
-            else:
-                area = surface_area(
-                    data.pipe_inputs["inner_diameter"],
-                    data.pipe_inputs["drop_out_length"],
-                )
-                flowrate = data.pipe_inputs["flowrate"]
-
-                h2so4_corrosion = corrosion_rate_H2SO4(
-                    area, flowrate, result.final[M.H2SO4]
-                )
-                hno3_corrosion = corrosion_rate_HNO3(
-                    area, flowrate, result.final[M.HNO3]
-                )
-                corrosion_rate = h2so4_corrosion + hno3_corrosion
-
-                values[yindex, xindex] = {
-                    "H2SO4_corrosion": h2so4_corrosion,
-                    "HNO3_corrosion": hno3_corrosion,
-                    "corrosion_rate": corrosion_rate,
-                }[value_key]
-
-            results[yindex].append(result)
 
-    return {
+@app.get(
+    "/api/run_matrix",
+    response_model=None,
+    responses={200: {"content": {encoding.MEDIA_TYPE: {}}}, 304: {}, 404: {}, 422: {}},
+)
+async def get_run_matrix(
+    data: Annotated[RunMatrix, Depends(query_json(RunMatrix))], request: Request
+) -> Response:
+    """
+    run_matrix, with the request as JSON in the data parameter, so that the
+    response can be stored by the browser and shared caches
+    """
+    return await run_matrix(data, request)
+
+
+def matrix_content(data: RunMatrix, matrix: Matrix) -> dict[str, Any]:
+    content: dict[str, Any] = {
         "plot": {
-            "z": values.tolist(),
-            "x": xrange.tolist(),
-            "y": yrange.tolist(),
+            "z": matrix.values.tolist(),
+            "x": matrix.x.tolist(),
+            "y": matrix.y.tolist(),
         },
         "layout": {
             "grid": "bottom to top",
         },
-        "resultData": results,
     }
+    if (result_data := matrix.result_data(data.detail)) is not None:
+        content["resultData"] = result_data
+    if data.refine is not None:
+        content["computed"] = matrix.computed.tolist()
+    if (stopped := matrix.partial).any():
+        content["partial"] = np.argwhere(stopped).tolist()
+    return content
+
+
+@app.post("/api/run_matrix/incremental", response_model=None, responses={404: {}})
+async def run_matrix_incremental(data: RunMatrixUpdate) -> Response:
+    """
+    Solve a grid like run_matrix, and return its gridId. Pass that as
+    previousGrid with the next request to only solve the cells affected by
+    what changed since, and get the cells whose value changed as "changes"
+    with their rows, columns and z instead of the whole plot. "reused" is the
+    number of cells that did not need to be solved again. Without a known
+    previous grid with the same axes, the whole plot is returned as by
+    run_matrix.
+    """
+    check_request_size(data)
+    reactions = reaction_set(data.reaction_set)
+    solve = partial(
+        RESULT_CACHE.run_model_sm1_batch,
+        tracer=TRACER,
+        reactions=reactions,
+        solver=SOLVE_BATCH,
+        limits=solver_limits(reactions),
+    )
+    if (previous := GRID_HISTORY.get(data.previous_grid)) is None:
+        matrix = await run_in_threadpool(compute_matrix, data, solve)
+        reused = 0
+    else:
+        matrix, cells = await run_in_threadpool(
+            update_matrix, previous, data, solve, reactions, SOLVER_LIMITS.tolerance
+        )
+        reused = int(cells.sum())
+
+    grid_id = GRID_HISTORY.put(data, matrix, reactions)
+    if (
+        previous is not None
+        and (changes := matrix_changes(previous.matrix, matrix, data.detail))
+        is not None
+    ):
+        return ORJSONResponse(
+            {
+                "gridId": grid_id,
+                "previousGrid": data.previous_grid,
+                "changes": changes,
+                "reused": reused,
+            }
+        )
+    return ORJSONResponse(
+        {**matrix_content(data, matrix), "gridId": grid_id, "reused": reused}
+    )
+
+
+@app.post(
+    "/api/run_matrix/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"application/x-ndjson": {}, "text/event-stream": {}}},
+        304: {},
+        404: {},
+    },
+)
+async def run_matrix_stream(data: RunMatrixStream, request: Request) -> Response:
+    """
+    Solve a grid of concentrations, sending each row as soon as it is done.
+    The first message has type "grid" and the points along each axis, every
+    following message has type "row" with the row's index and values,
+    resultData unless detail is values, and the columns of cells whose solve
+    stopped at the step or time limit as partial if there are any. Messages
+    are newline-delimited JSON, or server-sent events if the Accept header
+    asks for text/event-stream.
+    Grids covered by the lookup table are interpolated from it, and all their
+    rows sent at once.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    check_request_size(data)
+    reactions = reaction_set(data.reaction_set)
+    table = lookup_table(data, reactions)
+    tag = solver_etag(
+        request,
+        reactions.key,
+        None if table is None else table.key(),
+        sse,
+        data.model_dump_json(),
+    )
+    if matches(request, tag):
+        return CACHE_POLICY.not_modified(tag, public(request), vary="Accept")
+
+    def encode_message(message: dict[str, Any]) -> str:
+        content = encode_json(message).decode()
+        if sse:
+            return f"event: {message['type']}\ndata: {content}\n\n"
+        return content + "\n"
+
+    grid = encode_message(
+        {
+            "type": "grid",
+            "x": data.column_range.values().tolist(),
+            "y": data.row_range.values().tolist(),
+            "layout": {"grid": "bottom to top"},
+        }
+    )
+    if table is not None:
+        matrix = await run_in_threadpool(table.matrix, data)
+        rows = [
+            encode_message({"type": "row", "row": row, "z": values.tolist()})
+            for row, values in enumerate(matrix.values)
+        ]
+        return Response(
+            "".join([grid, *rows]),
+            media_type=media_type,
+            headers={"Vary": "Accept", **CACHE_POLICY.headers(tag, public(request))},
+        )
+
+    def messages() -> Iterator[str]:
+        yield grid
+        solve = partial(
+            RESULT_CACHE.run_model_sm1_batch,
+            tracer=TRACER,
+            reactions=reactions,
+            solver=SOLVE_BATCH,
+            limits=solver_limits(reactions),
+        )
+        for row in iter_matrix_rows(data, solve):
+            message: dict[str, Any] = {
+                "type": "row",
+                "row": row.index,
+                "z": row.values.tolist(),
+            }
+            if (result_data := row.result_data(data.detail)) is not None:
+                message["resultData"] = result_data
+            if (stopped := row.partial).any():
+                message["partial"] = np.flatnonzero(stopped).tolist()
+            yield encode_message(message)
+
+    # Rows are sent before it is known whether the time budget cut any of
+    # their solves short, so they can only be tagged if there is none
+    headers = CACHE_POLICY.headers(
+        tag if SOLVER_LIMITS.time_budget is None else None, public(request)
+    )
+    # Starlette iterates synchronous generators in its thread pool. Proxies
+    # such as the frontend's nginx would otherwise buffer the rows.
+    return StreamingResponse(
+        messages(),
+        media_type=media_type,
+        headers={"Vary": "Accept", "X-Accel-Buffering": "no", **headers},
+    )
+
+
+@app.get(
+    "/api/run_matrix/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"application/x-ndjson": {}, "text/event-stream": {}}},
+        304: {},
+        404: {},
+        422: {},
+    },
+)
+async def get_run_matrix_stream(
+    data: Annotated[RunMatrixStream, Depends(query_json(RunMatrixStream))],
+    request: Request,
+) -> Response:
+    """run_matrix_stream, with the request as JSON in the data parameter"""
+    return await run_matrix_stream(data, request)
+
+
+@app.post(
+    "/api/run_matrix/cell",
+    response_model=ResultContent,
+    responses={304: {}, 404: {}},
+)
+async def run_matrix_cell(data: RunMatrixCell, request: Request) -> Response:
+    reactions = reaction_set(data.reaction_set)
+    tag = solver_etag(request, reactions.key, data.model_dump_json())
+    if matches(request, tag):
+        return CACHE_POLICY.not_modified(tag, public(request))
+    result: Result = await run_in_threadpool(
+        RESULT_CACHE.run_model_sm1,
+        data.cell_concentrations(data.row_index, data.column_index),
+        TRACER,
+        reactions,
+        solver=SOLVE,
+        limits=solver_limits(reactions),
+    )
+    return ORJSONResponse(
+        result.content(), headers=solver_headers(request, tag, [result.status])
+    )
+
+
+@app.get(
+    "/api/run_matrix/cell",
+    response_model=ResultContent,
+    responses={304: {}, 404: {}, 422: {}},
+)
+async def get_run_matrix_cell(
+    data: Annotated[RunMatrixCell, Depends(query_json(RunMatrixCell))],
+    request: Request,
+) -> Response:
+    """run_matrix_cell, with the request as JSON in the data parameter"""
+    return await run_matrix_cell(data, request)
+
+
+def solve_final(
+    initial: npt.NDArray[np.float64],
+    reactions: CompiledReactions = COMPILED_REACTIONS,
+    deadline: float | None = None,
+) -> npt.NDArray[np.float64]:
+    limits = solver_limits(reactions)
+    return SOLVE_BATCH(initial, reactions, TRACER, limits, deadline).final
+
+
+@app.post(
+    "/api/sweep",
+    response_model=None,
+    responses={200: {"content": {encoding.MEDIA_TYPE: {}}}, 404: {}},
+)
+async def sweep(
+    data: Sweep, request: Request, response: Response
+) -> dict[str, Any] | Response:
+    """
+    Solve every combination of points along the axes, or a Latin hypercube
+    sample of them. Supports the same binary encoding as run_matrix, with
+    arrays named "axes/<name>" and "outputs/<name>".
+    """
+    reactions = reaction_set(data.reaction_set)
+    # The time budget applies to the whole sweep, not to each chunk
+    deadline = solver_limits(reactions).deadline()
+    solve = partial(solve_final, reactions=reactions, deadline=deadline)
+    result: SweepResult = await run_in_threadpool(compute_sweep, data, solve)
+
+    response.headers["Vary"] = "Accept"
+    if encoding.accepts(request.headers.get("accept")):
+        arrays = {
+            **{f"axes/{name}": values for name, values in result.axes.items()},
+            **{f"outputs/{name}": values for name, values in result.outputs.items()},
+        }
+        return Response(
+            encoding.encode(arrays, {"sampling": result.sampling}),
+            media_type=encoding.MEDIA_TYPE,
+            headers={"Vary": "Accept"},
+        )
+
+    return ORJSONResponse(sweep_content(result))
+
+
+def sweep_content(result: SweepResult) -> dict[str, Any]:
+    return {
+        "sampling": result.sampling,
+        "axes": {name: values.tolist() for name, values in result.axes.items()},
+        "outputs": {name: values.tolist() for name, values in result.outputs.items()},
+    }
+
+
+@app.post("/api/jobs/run_matrix", status_code=202, responses={404: {}})
+async def submit_matrix_job(data: RunMatrix) -> Job:
+    """Solve a matrix in the background, see run_matrix"""
+    reactions = reaction_set(data.reaction_set)
+
+    def run(context: JobContext) -> bytes:
+        solve = partial(
+            RESULT_CACHE.run_model_sm1_batch,
+            tracer=TRACER,
+            reactions=reactions,
+            solver=SOLVE_BATCH,
+            limits=solver_limits(reactions),
+        )
+        matrix = compute_matrix(data, partial(context.map_chunks, solve))
+        return encode_json(matrix_content(data, matrix))
+
+    total = data.cells()
+    return JOB_QUEUE.submit("run_matrix", data, total, run)
+
+
+@app.post("/api/jobs/sweep", status_code=202, responses={404: {}})
+async def submit_sweep_job(data: Sweep) -> Job:
+    """Solve a sweep in the background, see sweep"""
+    solve_chunk = partial(solve_final, reactions=reaction_set(data.reaction_set))
+
+    def run(context: JobContext) -> bytes:
+        def solve(initial: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+            return np.array(context.map_chunks(solve_chunk, initial))
+
+        return encode_json(sweep_content(compute_sweep(data, solve)))
+
+    return JOB_QUEUE.submit("sweep", data, data.solved_points(), run)
+
+
+@app.get("/api/jobs/{job_id}", responses={404: {}})
+async def get_job(job_id: str) -> Job:
+    if (job := JOB_QUEUE.store.get(job_id)) is None:
+        raise HTTPException(404, "No such job")
+    return job
+
+
+@app.get(
+    "/api/jobs/{job_id}/result",
+    response_class=Response,
+    responses={200: {"content": {"application/json": {}}}, 404: {}, 409: {}},
+)
+async def get_job_result(job_id: str) -> Response:
+    """The stored result of a finished job, in the form of its endpoint"""
+    if (job := JOB_QUEUE.store.get(job_id)) is None:
+        raise HTTPException(404, "No such job")
+    if job.status != JobStatus.DONE:
+        raise HTTPException(409, f"Job is {job.status}")
+    return Response(JOB_QUEUE.store.result(job_id), media_type="application/json")
+
+
+@app.delete("/api/jobs/{job_id}", responses={404: {}})
+async def cancel_job(job_id: str) -> Job:
+    """
+    Cancel a job. Running jobs stop after the chunk they are solving, so the
+    returned status may still be running.
+    """
+    if (job := JOB_QUEUE.cancel(job_id)) is None:
+        raise HTTPException(404, "No such job")
+    return job
 
 
 @app.get("/")
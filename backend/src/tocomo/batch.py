@@ -0,0 +1,213 @@
+"""Batched reaction engine evaluating many initial conditions at once."""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    DEFAULT_LIMITS,
+    MOLECULE_INDEX,
+    MOLECULES,
+    CompiledReactions,
+    Molecule,
+    Result,
+    SolverLimits,
+    SolverStatus,
+    to_dict,
+)
+from tocomo.trace import Tracer
+
+
+@dataclass
+class BatchResult:
+    """
+    Outcome of running the reaction model on a batch of N initial conditions.
+    Concentration arrays have shape (N, len(MOLECULES)) and are ordered by
+    MOLECULES. Step arrays have one entry per solver iteration, where rows that
+    had already settled are marked with a reaction index of -1. `status` holds
+    the SolverStatus of each row. Concentrations after each step are not kept,
+    see Result.posteriors.
+    """
+
+    initial: npt.NDArray[np.float64]
+    final: npt.NDArray[np.float64]
+    aggregated: npt.NDArray[np.float64]
+    reaction_indices: npt.NDArray[np.int64]
+    multipliers: npt.NDArray[np.float64]
+    reactions: CompiledReactions
+    status: list[SolverStatus]
+
+    def __len__(self) -> int:
+        return len(self.initial)
+
+    @classmethod
+    def concatenate(cls, results: list[BatchResult]) -> BatchResult:
+        """
+        Join batches of the same reactions along the scenario axis. Batches
+        that settled in fewer iterations are padded as if their rows had been
+        idle.
+        """
+        iterations = max((len(r.reaction_indices) for r in results), default=0)
+
+        def pad(
+            array: npt.NDArray[np.generic], fill: npt.ArrayLike
+        ) -> npt.NDArray[np.generic]:
+            padding = np.broadcast_to(
+                fill, (iterations - len(array), *array.shape[1:])
+            ).astype(array.dtype)
+            return np.concatenate([array, padding])
+
+        return cls(
+            initial=np.concatenate([r.initial for r in results]),
+            final=np.concatenate([r.final for r in results]),
+            aggregated=np.concatenate([r.aggregated for r in results]),
+            reaction_indices=np.concatenate(
+                [pad(r.reaction_indices, -1) for r in results], axis=1
+            ),
+            multipliers=np.concatenate(
+                [pad(r.multipliers, 0.0) for r in results], axis=1
+            ),
+            reactions=results[0].reactions if results else COMPILED_REACTIONS,
+            status=[status for r in results for status in r.status],
+        )
+
+    def result(self, row: int) -> Result:
+        """Build the per-scenario Result for a single row of the batch"""
+        fired = np.flatnonzero(self.reaction_indices[:, row] >= 0)
+        # Copies, so that cached results do not keep the whole batch alive
+        return Result(
+            initial_vector=self.initial[row].copy(),
+            final_vector=self.final[row].copy(),
+            aggregated_vector=self.aggregated[row].copy(),
+            reaction_indices=self.reaction_indices[fired, row],
+            multipliers=self.multipliers[fired, row],
+            reactions=self.reactions,
+            status=self.status[row],
+        )
+
+
+def to_array(
+    concentrations: list[dict[Molecule, float]],
+) -> npt.NDArray[np.float64]:
+    """Convert a list of concentration dicts into a batch input array"""
+    initial = np.zeros((len(concentrations), len(MOLECULES)), dtype=np.float64)
+    for row, c in enumerate(concentrations):
+        for m, v in c.items():
+            initial[row, MOLECULE_INDEX[m]] = v
+    return initial
+
+
+def run_model_sm1_batch(
+    initial: npt.ArrayLike,
+    reactions: CompiledReactions = COMPILED_REACTIONS,
+    tracer: Tracer | None = None,
+    limits: SolverLimits = DEFAULT_LIMITS,
+    deadline: float | None = None,
+) -> BatchResult:
+    """
+    Vectorised equivalent of run_model_sm1 for an (N, len(MOLECULES)) array of
+    initial concentrations. Every iteration applies, for each row that has not
+    settled yet, the first active reaction in priority order with a multiplier
+    of at least the tolerance, exactly like the scalar solver does. Rows that
+    are still running when a limit is reached get that as their status. The
+    time budget runs out at `deadline`, a time.monotonic(), if given, so that
+    the parts of a batch solved separately share it.
+
+    A `tracer` is called for every row a reaction was applied to, in row order.
+    """
+    lhs, rhs = reactions.lhs, reactions.rhs
+    consumed = lhs > 0
+    divisor = np.where(consumed, lhs, 1.0)
+
+    concentrations = np.array(initial, dtype=np.float64, ndmin=2)
+    if concentrations.shape[1:] != (len(MOLECULES),):
+        raise ValueError(
+            f"Expected initial concentrations of shape (N, {len(MOLECULES)}), "
+            f"got {concentrations.shape}"
+        )
+    initial_copy = concentrations.copy()
+    aggregated = concentrations.copy()
+    # Rows that have not settled yet, in order. A row's concentrations only
+    # change when a reaction is applied to it, so a settled row stays settled
+    # and is dropped from later iterations.
+    active = np.arange(len(concentrations))
+
+    # Rows stopped by an infinite or NaN multiplier or concentration
+    diverged = np.zeros(len(concentrations), dtype=np.bool_)
+
+    reaction_indices: list[npt.NDArray[np.int64]] = []
+    multipliers: list[npt.NDArray[np.float64]] = []
+    stopped = SolverStatus.CONVERGED
+    max_steps = limits.max_steps or math.inf
+    if deadline is None:
+        deadline = limits.deadline()
+    while len(reactions.reactions) > 0:
+        current = concentrations[active]
+        # (active, R) multiplier each reaction would be applied with
+        ratios = current[:, None, :] / divisor[None, :, :]
+        mults = np.where(consumed[None, :, :], ratios, np.inf).min(axis=2)
+        # NaN multipliers are chosen like the scalar solver does, and stop
+        # their row below
+        fires = ~(mults < limits.tolerance)
+        first = fires.argmax(axis=1)
+        finite = np.isfinite(current).all(axis=1) & np.isfinite(
+            mults[np.arange(len(active)), first]
+        )
+        diverged[active[~finite]] = True
+        running = fires.any(axis=1) & finite
+        active, mults = active[running], mults[running]
+        if len(active) == 0:
+            break
+        # Every running row has taken one step per iteration
+        if len(reaction_indices) >= max_steps:
+            stopped = SolverStatus.MAX_STEPS
+            break
+        if time.monotonic() >= deadline:
+            stopped = SolverStatus.TIME_BUDGET
+            break
+
+        first = first[running]
+        mult = mults[np.arange(len(active)), first]
+        produced = mult[:, None] * rhs[first]
+        concentrations[active] = (
+            current[running] - mult[:, None] * lhs[first] + produced
+        )
+        aggregated[active] += produced
+
+        step_indices = np.full(len(concentrations), -1, dtype=np.int64)
+        step_indices[active] = reactions.indices[first]
+        step_multipliers = np.zeros(len(concentrations), dtype=np.float64)
+        step_multipliers[active] = mult
+        reaction_indices.append(step_indices)
+        multipliers.append(step_multipliers)
+
+        if tracer is not None:
+            for i, row in enumerate(active.tolist()):
+                tracer.step(
+                    reactions.reactions[first[i]].reaction,
+                    float(mult[i]),
+                    to_dict(concentrations[row].tolist()),
+                )
+
+    shape = (len(reaction_indices), len(concentrations))
+    return BatchResult(
+        initial=initial_copy,
+        final=concentrations,
+        aggregated=aggregated,
+        reaction_indices=np.array(reaction_indices, dtype=np.int64).reshape(shape),
+        multipliers=np.array(multipliers, dtype=np.float64).reshape(shape),
+        reactions=reactions,
+        status=[
+            (SolverStatus.DIVERGED if d else stopped if r else SolverStatus.CONVERGED)
+            for d, r in zip(
+                diverged.tolist(),
+                np.isin(np.arange(len(concentrations)), active).tolist(),
+            )
+        ],
+    )
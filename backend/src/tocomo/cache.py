@@ -0,0 +1,166 @@
+"""Bounded LRU cache in front of the reaction solvers."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel
+
+from tocomo.batch import BatchResult, run_model_sm1_batch
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    DEFAULT_LIMITS,
+    MOLECULE_INDEX,
+    CompiledReactions,
+    Molecule,
+    Result,
+    SolverLimits,
+    SolverStatus,
+    run_model_sm1,
+    to_vector,
+)
+from tocomo.trace import Tracer
+
+Solver = Callable[
+    [dict[Molecule, float], Tracer | None, CompiledReactions, SolverLimits], Result
+]
+# Solves a batch, stopping at a deadline as a time.monotonic() if it is given
+BatchSolver = Callable[
+    [npt.ArrayLike, CompiledReactions, Tracer | None, SolverLimits, float | None],
+    BatchResult,
+]
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+    ttl: float | None
+
+
+class ResultCache:
+    """
+    Results of run_model_sm1 keyed on the reaction set, the solver limits and
+    the initial concentrations rounded to `decimals`. The solver is run on the
+    rounded concentrations, so that a cached result is exactly what a fresh run
+    would return. Entries older than `ttl` seconds are discarded, and a
+    `maxsize` of zero disables caching. Results cut short by the time budget
+    depend on the machine's load and are never cached.
+    """
+
+    def __init__(
+        self, maxsize: int = 4096, ttl: float | None = None, decimals: int = 6
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Result]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> ResultCache:
+        """
+        Configure from TOCOMO_CACHE_SIZE, TOCOMO_CACHE_TTL (seconds, unset or
+        0 for no expiry) and TOCOMO_CACHE_DECIMALS
+        """
+        ttl = float(os.environ.get("TOCOMO_CACHE_TTL", 0))
+        return cls(
+            maxsize=int(os.environ.get("TOCOMO_CACHE_SIZE", 4096)),
+            ttl=ttl or None,
+            decimals=int(os.environ.get("TOCOMO_CACHE_DECIMALS", 6)),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self),
+            maxsize=self.maxsize,
+            ttl=self.ttl,
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def get(self, key: Hashable) -> Result | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                self.ttl is None or time.monotonic() - entry[0] < self.ttl
+            ):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, result: Result) -> None:
+        if self.maxsize <= 0 or result.status == SolverStatus.TIME_BUDGET:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def quantize(self, initial: npt.ArrayLike) -> npt.NDArray[np.float64]:
+        values = np.asarray(initial, dtype=np.float64)
+        return np.asarray(np.round(values, self.decimals), dtype=np.float64)
+
+    def run_model_sm1(
+        self,
+        initial_concentrations: dict[Molecule, float],
+        tracer: Tracer | None = None,
+        reactions: CompiledReactions = COMPILED_REACTIONS,
+        solver: Solver = run_model_sm1,
+        limits: SolverLimits = DEFAULT_LIMITS,
+    ) -> Result:
+        """Cached run_model_sm1, calling `solver` on a cache miss"""
+        vector = self.quantize(to_vector(initial_concentrations)).tolist()
+        key = (reactions.key, limits, *vector)
+        if (result := self.get(key)) is None:
+            quantized = {m: vector[MOLECULE_INDEX[m]] for m in initial_concentrations}
+            result = solver(quantized, tracer, reactions, limits)
+            self.put(key, result)
+        return result
+
+    def run_model_sm1_batch(
+        self,
+        initial: npt.ArrayLike,
+        tracer: Tracer | None = None,
+        reactions: CompiledReactions = COMPILED_REACTIONS,
+        solver: BatchSolver = run_model_sm1_batch,
+        limits: SolverLimits = DEFAULT_LIMITS,
+    ) -> list[Result]:
+        """
+        Cached results for each row of an (N, len(MOLECULES)) array of initial
+        concentrations, solving all cache misses as a single batch with `solver`
+        """
+        rows = self.quantize(initial)
+        keys = [(reactions.key, limits, *row) for row in rows.tolist()]
+        cached = [self.get(key) for key in keys]
+
+        missing = [i for i, result in enumerate(cached) if result is None]
+        solved: dict[int, Result] = {}
+        if missing:
+            batch = solver(rows[missing], reactions, tracer, limits, None)
+            for row, i in enumerate(missing):
+                solved[i] = batch.result(row)
+                self.put(keys[i], solved[i])
+        return [result or solved[i] for i, result in enumerate(cached)]
@@ -0,0 +1,210 @@
+"""Compressing responses with the content coding the client prefers."""
+
+from __future__ import annotations
+
+import gzip
+import importlib
+import logging
+import os
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from tocomo.scenarios import PARQUET
+
+logger = logging.getLogger(__name__)
+
+# Media types of responses that are compressed already
+INCOMPRESSIBLE = (PARQUET,)
+
+
+@dataclass(frozen=True)
+class Codec:
+    """A content coding, with the level it compresses at unless told otherwise"""
+
+    name: str
+    default_level: int
+    compress: Callable[[bytes, int], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _module(name: str) -> Any | None:
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def available_codecs() -> dict[str, Codec]:
+    """
+    The codings that can be used, by name: gzip, and br and zstd if the
+    brotli and zstandard packages are installed
+    """
+    codecs = [
+        Codec(
+            "gzip",
+            6,
+            lambda data, level: gzip.compress(data, compresslevel=level, mtime=0),
+            gzip.decompress,
+        )
+    ]
+    if (brotli := _module("brotli")) is not None:
+        codecs.append(
+            Codec(
+                "br",
+                4,
+                lambda data, level: brotli.compress(data, quality=level),
+                brotli.decompress,
+            )
+        )
+    if (zstandard := _module("zstandard")) is not None:
+        codecs.append(
+            Codec(
+                "zstd",
+                3,
+                lambda data, level: zstandard.compress(data, level),
+                zstandard.decompress,
+            )
+        )
+    return {codec.name: codec for codec in codecs}
+
+
+CODECS = available_codecs()
+
+# Codings that may be asked for, whether or not they are available
+CODINGS = ("gzip", "br", "zstd")
+
+
+@dataclass(frozen=True)
+class CompressionSettings:
+    """
+    The codings to compress responses with, in order of preference, and the
+    level of each. Responses smaller than `min_size` bytes are not compressed,
+    and nothing is without any `levels`.
+    """
+
+    levels: dict[str, int] = field(default_factory=dict)
+    min_size: int = 1024
+
+    @classmethod
+    def from_env(cls) -> CompressionSettings:
+        """
+        Configure from TOCOMO_COMPRESSION, a comma-separated list of codings
+        that may each be given a level, as in "br:5,gzip", and
+        TOCOMO_COMPRESSION_MIN_SIZE (bytes). Codings that are not available
+        are left out with a warning.
+        """
+        levels = {}
+        for item in filter(None, os.environ.get("TOCOMO_COMPRESSION", "").split(",")):
+            name, _, level = item.strip().partition(":")
+            if name not in CODINGS:
+                raise ValueError(f"Unknown content coding {name!r}")
+            if (codec := CODECS.get(name)) is None:
+                logger.warning("Not compressing with %s, as it is not installed", name)
+                continue
+            levels[name] = int(level) if level else codec.default_level
+        return cls(
+            levels=levels,
+            min_size=int(os.environ.get("TOCOMO_COMPRESSION_MIN_SIZE", 1024)),
+        )
+
+    def negotiate(self, accept_encoding: str) -> str | None:
+        """
+        The coding to compress with for a request with the given
+        Accept-Encoding: the one with the highest quality value, or our
+        preferred one among equals. None if the client accepts none of them.
+        """
+        qualities: dict[str, float] = {}
+        for item in accept_encoding.split(","):
+            name, *parameters = (part.strip() for part in item.split(";"))
+            quality = 1.0
+            for parameter in parameters:
+                key, _, value = parameter.partition("=")
+                if key.strip() == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            qualities[name.lower()] = quality
+        wildcard = qualities.get("*", 0.0)
+        best, best_quality = None, 0.0
+        for name in self.levels:
+            if (quality := qualities.get(name, wildcard)) > best_quality:
+                best, best_quality = name, quality
+        return best
+
+
+def _weaken(headers: MutableHeaders) -> None:
+    headers.add_vary_header("Accept-Encoding")
+    if (tag := headers.get("etag")) is not None and not tag.startswith("W/"):
+        headers["ETag"] = f"W/{tag}"
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses, see CompressionSettings. Streamed
+    responses are passed on as they are, so that each part still arrives as
+    soon as it is sent, and so are responses that are small, already encoded
+    or of a type that is compressed already. Entity tags of compressed
+    responses, and of 304 responses to clients that might have gotten them
+    compressed, are made weak, as the bytes differ from those uncompressed.
+    """
+
+    def __init__(self, app: ASGIApp, settings: CompressionSettings) -> None:
+        self.app = app
+        self.settings = settings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        if (coding := self.settings.negotiate(accept)) is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message = {}
+        passing = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passing
+            if passing:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            passing = True
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if start["status"] == 304:
+                # Validates a response that may have been compressed
+                _weaken(headers)
+                await send(start)
+                await send(message)
+                return
+            if (
+                message.get("more_body", False)
+                or len(body) < self.settings.min_size
+                or "content-encoding" in headers
+                or headers.get("content-type", "").startswith(INCOMPRESSIBLE)
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            body = await run_in_threadpool(
+                CODECS[coding].compress, body, self.settings.levels[coding]
+            )
+            headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(body))
+            _weaken(headers)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,6 +1,18 @@
+"""
+Corrosion rates from acid drop-out. Every function accepts Values or numpy
+arrays, which are broadcast against each other, so whole grids of rates and
+pipe parameters can be computed in one call.
+"""
+
 from __future__ import annotations
 
-import math
+from typing import TypeAlias
+
+import numpy as np
+import numpy.typing as npt
+
+# A scalar, or an array broadcast element-wise
+Value: TypeAlias = float | npt.NDArray[np.float64]
 
 # given in  g/mol
 H2O_MOL_WEIGHT = 18
@@ -13,29 +25,29 @@ HNO3_MOL_WEIGHT = 63.01
 FE_DENSITY_S = 7.87
 
 
-def surface_area(inner_diameter: float, drop_out_length: float) -> float:
+def surface_area(inner_diameter: Value, drop_out_length: Value) -> Value:
     # inner diameter in inch
     # drop out length in m
     # returns  cm2
-    return math.pi * inner_diameter * 2.54 * drop_out_length * 100
+    return np.pi * inner_diameter * 2.54 * drop_out_length * 100
 
 
-def corrosion_rate(rate: float, surface_area: float) -> float:
+def corrosion_rate(rate: Value, surface_area: Value) -> Value:
     # rate is given in cm3/hour
     # surface area is given in cm2
     # returns mm/year
     return rate * 8760 * 10 / surface_area
 
 
-def convert_iron_rate(mol_rate: float) -> float:
+def convert_iron_rate(mol_rate: Value) -> Value:
     # rate given in mol/hour
     # returns cm3/hour
     return mol_rate * FE_MOL_WEIGHT / FE_DENSITY_S
 
 
 def corrosion_rate_H2SO4(
-    surface_area: float, flowrate: float, molar_rate_H2SO4: float
-) -> float:
+    surface_area: Value, flowrate: Value, molar_rate_H2SO4: Value
+) -> Value:
     """
     inner surface_area of pipeline
     flowrate of CO2 given in Millon tonnes per year MT/Y
@@ -56,8 +68,8 @@ def corrosion_rate_H2SO4(
 
 
 def corrosion_rate_HNO3(
-    surface_area: float, flowrate: float, molar_rate_HNO3: float
-) -> float:
+    surface_area: Value, flowrate: Value, molar_rate_HNO3: Value
+) -> Value:
     """
     inner surface_area of pipeline
     flowrate of CO2 given in Millon tonnes per year MT/Y
@@ -75,3 +87,22 @@ def corrosion_rate_HNO3(
 
     corr_rate = corrosion_rate(iron_rate, surface_area) / 6
     return corr_rate
+
+
+def corrosion_rates(
+    surface_area: Value,
+    flowrate: Value,
+    molar_rate_H2SO4: Value,
+    molar_rate_HNO3: Value,
+) -> dict[str, Value]:
+    """
+    The corrosion rates from both acids, and their sum, keyed by the names
+    used as matrix values
+    """
+    h2so4_corrosion = corrosion_rate_H2SO4(surface_area, flowrate, molar_rate_H2SO4)
+    hno3_corrosion = corrosion_rate_HNO3(surface_area, flowrate, molar_rate_HNO3)
+    return {
+        "H2SO4_corrosion": h2so4_corrosion,
+        "HNO3_corrosion": hno3_corrosion,
+        "corrosion_rate": h2so4_corrosion + hno3_corrosion,
+    }
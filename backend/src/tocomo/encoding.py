@@ -0,0 +1,95 @@
+"""
+Compact binary encoding of matrix results.
+
+An encoded matrix consists of
+
+    magic      4 bytes   b"TCMX"
+    version    uint32    little-endian, currently 1
+    length     uint32    little-endian, length of the JSON header in bytes
+    header     JSON      padded with spaces to a multiple of 8 bytes
+    arrays     raw       C-ordered arrays, each starting on a multiple of 8
+
+where offsets in the header are relative to the start of the array section.
+Arrays are little-endian float64 unless their dtype says otherwise, so they
+can be read directly with numpy.frombuffer or a JavaScript Float64Array.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+MEDIA_TYPE = "application/vnd.tocomo.matrix"
+MAGIC = b"TCMX"
+VERSION = 1
+
+_PREFIX = struct.Struct("<4sII")
+
+
+def _align(n: int) -> int:
+    return -n % 8
+
+
+def encode(
+    arrays: dict[str, npt.NDArray[Any]], metadata: dict[str, Any] | None = None
+) -> bytes:
+    """Encode named arrays, and JSON-serialisable metadata, to bytes"""
+    converted = {
+        name: np.ascontiguousarray(array).astype(
+            array.dtype.newbyteorder("<"), copy=False
+        )
+        for name, array in arrays.items()
+    }
+
+    entries = []
+    offset = 0
+    for name, array in converted.items():
+        entries.append(
+            {
+                "name": name,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+        )
+        offset += array.nbytes + _align(array.nbytes)
+
+    header = json.dumps({"arrays": entries, "metadata": metadata or {}}).encode()
+    header += b" " * _align(_PREFIX.size + len(header))
+
+    chunks = [_PREFIX.pack(MAGIC, VERSION, len(header)), header]
+    for array in converted.values():
+        chunks.append(array.tobytes())
+        chunks.append(b"\0" * _align(array.nbytes))
+    return b"".join(chunks)
+
+
+def decode(
+    data: bytes,
+) -> tuple[dict[str, npt.NDArray[Any]], dict[str, Any]]:
+    """Decode bytes produced by `encode` into arrays and metadata"""
+    magic, version, length = _PREFIX.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an encoded matrix")
+
+    header = json.loads(data[_PREFIX.size : _PREFIX.size + length])
+    start = _PREFIX.size + length
+    arrays = {}
+    for entry in header["arrays"]:
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        arrays[entry["name"]] = np.frombuffer(
+            data, dtype=dtype, count=count, offset=start + entry["offset"]
+        ).reshape(entry["shape"])
+    return arrays, header["metadata"]
+
+
+def accepts(accept: str | None) -> bool:
+    """Whether an Accept header asks for the binary encoding"""
+    if not accept:
+        return False
+    return any(part.split(";")[0].strip() == MEDIA_TYPE for part in accept.split(","))
@@ -0,0 +1,73 @@
+"""Entity tags and caching headers, so that repeated requests get a 304."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import Request, Response
+
+
+def etag(*parts: object) -> str:
+    """A strong entity tag of the content identified by `parts`"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def source_key() -> str:
+    """
+    Content hash of this package's modules, which changes with the code
+    computing the responses
+    """
+    return etag(
+        *(path.read_bytes() for path in sorted(Path(__file__).parent.glob("*.py")))
+    )
+
+
+def matches(request: Request, tag: str) -> bool:
+    """Whether the request's If-None-Match lists `tag`, using weak comparison"""
+    if (header := request.headers.get("if-none-match")) is None:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or tag in tags
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    Cache-Control of responses with an entity tag. Clients may reuse them for
+    `max_age` seconds, and after that, or always with the default of 0, must
+    ask again with If-None-Match, which is answered with 304 Not Modified and
+    no body while the tag matches.
+    """
+
+    max_age: int = 0
+
+    @classmethod
+    def from_env(cls) -> CachePolicy:
+        """Configure from TOCOMO_HTTP_MAX_AGE (seconds)"""
+        return cls(max_age=int(os.environ.get("TOCOMO_HTTP_MAX_AGE", 0)))
+
+    def headers(self, tag: str | None, public: bool = False) -> dict[str, str]:
+        """
+        Headers of a response with the given tag, which shared caches may
+        only store if `public`. Responses without a tag are not stored.
+        """
+        if tag is None:
+            return {"Cache-Control": "no-store"}
+        scope = "public" if public else "private"
+        age = f"max-age={self.max_age}" if self.max_age > 0 else "no-cache"
+        return {"ETag": tag, "Cache-Control": f"{scope}, {age}"}
+
+    def not_modified(
+        self, tag: str, public: bool = False, vary: str | None = None
+    ) -> Response:
+        headers = self.headers(tag, public)
+        if vary is not None:
+            headers["Vary"] = vary
+        return Response(status_code=304, headers=headers)
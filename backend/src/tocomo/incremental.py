@@ -0,0 +1,251 @@
+"""Recomputing a matrix from a previous one when only some inputs change."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Self
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import Field, model_validator
+
+from tocomo.matrix import (
+    Detail,
+    GridSolver,
+    Matrix,
+    RunMatrix,
+    _solve_points,
+    cell_data,
+    compute_matrix,
+    matrix_values,
+    value_key,
+)
+from tocomo.reactions import (
+    MOLECULES,
+    CompiledReactions,
+    Result,
+    SolverStatus,
+    to_vector,
+)
+
+
+class RunMatrixUpdate(RunMatrix):
+    """
+    A matrix that may be computed from the grid with id `previous_grid`, as
+    returned for an earlier request, instead of from scratch
+    """
+
+    previous_grid: str | None = Field(None, alias="previousGrid")
+
+    @model_validator(mode="after")
+    def check_refine(self) -> Self:
+        if self.refine is not None:
+            raise ValueError("refine is not supported for incremental updates")
+        return self
+
+    def grid_id(self) -> str:
+        """Fingerprint of the request, which identifies the grid it gives"""
+        return hashlib.sha256(
+            self.model_dump_json(by_alias=True, exclude={"previous_grid"}).encode()
+        ).hexdigest()
+
+
+@dataclass
+class Grid:
+    data: RunMatrix
+    matrix: Matrix
+    reactions: str
+
+
+class GridHistory:
+    """
+    The last `maxsize` computed grids by id, so that later requests can be
+    computed from them. The least recently used grid is dropped first.
+    """
+
+    def __init__(self, maxsize: int = 32) -> None:
+        self.maxsize = maxsize
+        self._grids: OrderedDict[str, Grid] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> GridHistory:
+        """Configure from TOCOMO_GRID_HISTORY"""
+        return cls(maxsize=int(os.environ.get("TOCOMO_GRID_HISTORY", 32)))
+
+    def __len__(self) -> int:
+        return len(self._grids)
+
+    def get(self, grid_id: str | None) -> Grid | None:
+        if grid_id is None:
+            return None
+        with self._lock:
+            if (grid := self._grids.get(grid_id)) is not None:
+                self._grids.move_to_end(grid_id)
+            return grid
+
+    def put(
+        self, data: RunMatrixUpdate, matrix: Matrix, reactions: CompiledReactions
+    ) -> str:
+        grid_id = data.grid_id()
+        if self.maxsize <= 0:
+            return grid_id
+        with self._lock:
+            self._grids[grid_id] = Grid(data, matrix, reactions.key)
+            self._grids.move_to_end(grid_id)
+            while len(self._grids) > self.maxsize:
+                self._grids.popitem(last=False)
+        return grid_id
+
+
+def _fixed_inputs(data: RunMatrix) -> list[float]:
+    """Initial concentrations shared by every cell, with 0 for the axes"""
+    inputs = {**data.inputs, data.row: 0.0, data.column: 0.0}
+    return to_vector(inputs)
+
+
+def unaffected(
+    result: Result,
+    changed: list[int],
+    reactions: CompiledReactions,
+    tolerance: float,
+) -> bool:
+    """
+    Whether solving again with other initial concentrations of the molecules
+    at the `changed` positions gives the same steps. This holds if at every
+    state the solver passed through, each reaction consuming a changed
+    molecule was blocked by another of its reactants, and the changed
+    molecules never changed. The solver then picks the same reactions with
+    the same multipliers, and the changed molecules simply keep their new
+    concentrations throughout.
+    """
+    if result.status == SolverStatus.TIME_BUDGET:
+        return False
+    states = np.vstack([result.initial_vector, result.posteriors])
+    if np.any(states[:, changed] != result.initial_vector[changed]):
+        return False
+    for r in reactions.reactions:
+        if not any(i in changed for i, _ in r.lhs):
+            continue
+        blocked = np.zeros(len(states), dtype=np.bool_)
+        for i, n in r.lhs:
+            if i not in changed:
+                blocked |= states[:, i] / n < tolerance
+        if not blocked.all():
+            return False
+    return True
+
+
+def _with_inputs(result: Result, inputs: dict[int, float]) -> Result:
+    """
+    `result` with the concentrations at the positions of `inputs` replaced in
+    every state. Replayed posteriors follow from the new initial ones.
+    """
+    positions, values = list(inputs), list(inputs.values())
+
+    def with_inputs(vector: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        vector = vector.copy()
+        vector[..., positions] = values
+        return vector
+
+    return replace(
+        result,
+        initial_vector=with_inputs(result.initial_vector),
+        final_vector=with_inputs(result.final_vector),
+        aggregated_vector=with_inputs(result.aggregated_vector),
+        recorded=None if result.recorded is None else with_inputs(result.recorded),
+    )
+
+
+def update_matrix(
+    previous: Grid,
+    data: RunMatrix,
+    solve: GridSolver,
+    reactions: CompiledReactions,
+    tolerance: float,
+) -> tuple[Matrix, npt.NDArray[np.bool_]]:
+    """
+    Evaluate the grid of `data`, reusing the results of `previous` for cells
+    that are provably unaffected by the inputs that changed, see `unaffected`.
+    Changes to the plotted value or the pipe inputs need no solving at all.
+    Returns the matrix and which cells were reused.
+    """
+    x = data.column_range.values()
+    y = data.row_range.values()
+    old = previous.matrix
+    results = old.results
+    if (
+        previous.reactions != reactions.key
+        or (previous.data.row, previous.data.column) != (data.row, data.column)
+        or not np.array_equal(old.x, x)
+        or not np.array_equal(old.y, y)
+        or any(r is None for row in results for r in row)
+    ):
+        return compute_matrix(data, solve), np.zeros((len(y), len(x)), dtype=np.bool_)
+
+    before, after = _fixed_inputs(previous.data), _fixed_inputs(data)
+    changed = [i for i in range(len(MOLECULES)) if before[i] != after[i]]
+    inputs = {i: after[i] for i in changed}
+
+    reused = np.zeros((len(y), len(x)), dtype=np.bool_)
+    final = np.zeros((len(y), len(x), len(MOLECULES)), dtype=np.float64)
+    cells: list[list[Result | None]] = [[None] * len(x) for _ in y]
+    for row, column in np.ndindex(len(y), len(x)):
+        result = results[row][column]
+        if result is not None and unaffected(result, changed, reactions, tolerance):
+            if changed:
+                result = _with_inputs(result, inputs)
+            reused[row, column] = True
+            cells[row][column] = result
+            final[row, column] = result.final_vector
+
+    rows, columns = np.nonzero(~reused)
+    if len(rows):
+        final[rows, columns], _, solved = _solve_points(
+            data, solve, x, y, rows, columns
+        )
+        for row, column, result in zip(rows.tolist(), columns.tolist(), solved):
+            cells[row][column] = result
+
+    matrix = Matrix(
+        x=x,
+        y=y,
+        values=matrix_values(final, value_key(data.value), data.pipe_inputs),
+        final=final,
+        results=cells,
+        computed=np.ones((len(y), len(x)), dtype=np.bool_),
+    )
+    return matrix, reused
+
+
+def matrix_changes(
+    previous: Matrix, matrix: Matrix, detail: Detail
+) -> dict[str, Any] | None:
+    """
+    The cells whose value, or final concentrations unless only the values
+    are asked for, differ from `previous`. None if the grids have different
+    axes.
+    """
+    if not (
+        np.array_equal(previous.x, matrix.x) and np.array_equal(previous.y, matrix.y)
+    ):
+        return None
+    different = previous.values != matrix.values
+    if detail != Detail.VALUES:
+        different |= np.any(previous.final != matrix.final, axis=2)
+    rows, columns = np.nonzero(different)
+    changes: dict[str, Any] = {
+        "rows": rows.tolist(),
+        "columns": columns.tolist(),
+        "z": matrix.values[rows, columns].tolist(),
+    }
+    if detail != Detail.VALUES:
+        changes["resultData"] = [
+            cell_data(matrix.results[row][column], detail)
+            for row, column in zip(rows.tolist(), columns.tolist())
+        ]
+    return changes
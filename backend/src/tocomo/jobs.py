@@ -0,0 +1,374 @@
+"""Background jobs for long-running solves, stored in SQLite."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import uuid
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from enum import StrEnum, auto
+from typing import Any, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class JobStatus(StrEnum):
+    PENDING = auto()
+    RUNNING = auto()
+    DONE = auto()
+    FAILED = auto()
+    CANCELLED = auto()
+
+
+FINISHED = (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: JobStatus
+    # Fraction of points solved, between 0 and 1
+    progress: float
+    error: str | None
+    created: datetime
+    updated: datetime
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    """
+    Jobs and their results in an SQLite database at `path`, which is only kept
+    in memory by default. Jobs left unfinished by a previous process are
+    marked as failed. Several processes may share a database file, as long as
+    each process that forks after opening the store calls `reopen`.
+
+    Finished jobs are deleted `retention` seconds after they finished, and
+    the oldest beyond the latest `max_finished`, whenever a job is created.
+    None keeps them.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        retention: float | None = 86400,
+        max_finished: int | None = 1000,
+    ) -> None:
+        self.path = path
+        self.retention = retention
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._db = self._connect()
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ? WHERE status IN (?, ?)",
+                (
+                    JobStatus.FAILED,
+                    "interrupted by a restart",
+                    JobStatus.PENDING,
+                    JobStatus.RUNNING,
+                ),
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        with db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    request_hash TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    error TEXT,
+                    result BLOB,
+                    created TEXT NOT NULL,
+                    updated TEXT NOT NULL
+                )
+                """)
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_request_hash ON jobs (request_hash)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status_updated"
+                " ON jobs (status, updated)"
+            )
+        return db
+
+    def reopen(self) -> None:
+        """
+        Connect to the database again in a forked process, which must not use
+        the connection it inherited. Unfinished jobs are left alone, as other
+        processes may be running them.
+        """
+        with self._lock:
+            self._db = self._connect()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def prune(self) -> None:
+        """Delete the finished jobs that are no longer kept, see JobStore"""
+        finished = ", ".join("?" for _ in FINISHED)
+        with self._lock, self._db:
+            if self.retention is not None:
+                expired = datetime.now(timezone.utc) - timedelta(seconds=self.retention)
+                self._db.execute(
+                    f"DELETE FROM jobs WHERE status IN ({finished}) AND updated < ?",
+                    (*FINISHED, expired.isoformat()),
+                )
+            if self.max_finished is not None:
+                self._db.execute(
+                    "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs"
+                    f" WHERE status IN ({finished})"
+                    " ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                    (*FINISHED, self.max_finished),
+                )
+
+    def create(self, kind: str, request_hash: str) -> Job:
+        self.prune()
+        now = datetime.now(timezone.utc)
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            status=JobStatus.PENDING,
+            progress=0.0,
+            error=None,
+            created=now,
+            updated=now,
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?)",
+                (
+                    job.id,
+                    job.kind,
+                    request_hash,
+                    job.status,
+                    job.progress,
+                    job.error,
+                    job.created.isoformat(),
+                    job.updated.isoformat(),
+                ),
+            )
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._one("WHERE id = ?", (job_id,))
+
+    def find(self, kind: str, request_hash: str) -> Job | None:
+        """The latest job for the same request that has not failed"""
+        return self._one(
+            "WHERE kind = ? AND request_hash = ? AND status IN (?, ?, ?)"
+            " ORDER BY created DESC LIMIT 1",
+            (
+                kind,
+                request_hash,
+                JobStatus.PENDING,
+                JobStatus.RUNNING,
+                JobStatus.DONE,
+            ),
+        )
+
+    def result(self, job_id: str) -> bytes | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def update(
+        self,
+        job_id: str,
+        *,
+        status: JobStatus | None = None,
+        progress: float | None = None,
+        error: str | None = None,
+        result: bytes | None = None,
+        unless: tuple[JobStatus, ...] = FINISHED,
+    ) -> None:
+        """Update the given fields, unless the job's status is in `unless`"""
+        fields: dict[str, Any] = {
+            "status": status,
+            "progress": progress,
+            "error": error,
+            "result": result,
+        }
+        fields = {k: v for k, v in fields.items() if v is not None}
+        fields["updated"] = datetime.now(timezone.utc).isoformat()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        placeholders = ", ".join("?" for _ in unless)
+        with self._lock, self._db:
+            self._db.execute(
+                f"UPDATE jobs SET {assignments}"
+                f" WHERE id = ? AND status NOT IN ({placeholders})",
+                (*fields.values(), job_id, *unless),
+            )
+
+    def _one(self, where: str, parameters: tuple[Any, ...]) -> Job | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, progress, error, created, updated"
+                f" FROM jobs {where}",
+                parameters,
+            ).fetchone()
+        if row is None:
+            return None
+        return Job.model_validate(dict(zip(Job.model_fields, row)))
+
+
+class JobContext:
+    """
+    Passed to a running job to report progress. Solving in chunks through
+    `map_chunks` updates the progress and stops the job, by raising
+    JobCancelled, between chunks once it has been cancelled, either through
+    `cancelled` or, by another process sharing the store, in the store.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        job_id: str,
+        cancelled: threading.Event,
+        total: int,
+        chunk_size: int,
+    ) -> None:
+        self.store = store
+        self.job_id = job_id
+        self.cancelled = cancelled
+        self.total = max(1, total)
+        self.chunk_size = chunk_size
+        self.done = 0
+
+    def check(self) -> None:
+        if self.cancelled.is_set() or (
+            (job := self.store.get(self.job_id)) is not None
+            and job.status == JobStatus.CANCELLED
+        ):
+            raise JobCancelled()
+
+    def advance(self, count: int) -> None:
+        self.done += count
+        self.store.update(self.job_id, progress=min(1.0, self.done / self.total))
+
+    def map_chunks(
+        self,
+        solve: Callable[[npt.NDArray[np.float64]], Iterable[T]],
+        initial: npt.NDArray[np.float64],
+    ) -> list[T]:
+        results: list[T] = []
+        for start in range(0, len(initial), self.chunk_size):
+            self.check()
+            chunk = initial[start : start + self.chunk_size]
+            results.extend(solve(chunk))
+            self.advance(len(chunk))
+        return results
+
+
+class JobQueue:
+    """
+    Runs jobs on `workers` threads, which in turn hand the solving to the
+    solver pool, and keeps their results in `store`. Submitting a request
+    identical to a pending, running or finished job returns that job instead
+    of solving it again.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 2, chunk_size: int = 500):
+        self.store = store
+        self.chunk_size = max(1, chunk_size)
+        self._executor = ThreadPoolExecutor(max(1, workers), "tocomo-job")
+        self._lock = threading.Lock()
+        self._running: dict[str, tuple[Future[None], threading.Event]] = {}
+
+    @classmethod
+    def from_env(cls) -> JobQueue:
+        """
+        Configure from TOCOMO_JOB_DB (kept in memory if unset),
+        TOCOMO_JOB_RETENTION (seconds) and TOCOMO_JOB_MAX_FINISHED, where 0
+        keeps finished jobs, TOCOMO_JOB_WORKERS and TOCOMO_JOB_CHUNK_SIZE
+        """
+        retention = float(os.environ.get("TOCOMO_JOB_RETENTION", 86400))
+        max_finished = int(os.environ.get("TOCOMO_JOB_MAX_FINISHED", 1000))
+        return cls(
+            JobStore(
+                os.environ.get("TOCOMO_JOB_DB", ":memory:"),
+                retention=retention or None,
+                max_finished=max_finished or None,
+            ),
+            workers=int(os.environ.get("TOCOMO_JOB_WORKERS", 2)),
+            chunk_size=int(os.environ.get("TOCOMO_JOB_CHUNK_SIZE", 500)),
+        )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for _, cancelled in self._running.values():
+                cancelled.set()
+        self._executor.shutdown(cancel_futures=True)
+        self.store.close()
+
+    def submit(
+        self,
+        kind: str,
+        request: BaseModel,
+        total: int,
+        run: Callable[[JobContext], bytes],
+    ) -> Job:
+        """
+        Queue `run`, which solves `total` points for `request` and returns the
+        encoded result
+        """
+        request_hash = hashlib.sha256(
+            request.model_dump_json(by_alias=True).encode()
+        ).hexdigest()
+        with self._lock:
+            if (job := self.store.find(kind, request_hash)) is not None:
+                return job
+            job = self.store.create(kind, request_hash)
+            cancelled = threading.Event()
+            context = JobContext(self.store, job.id, cancelled, total, self.chunk_size)
+            future = self._executor.submit(self._run, context, run)
+            self._running[job.id] = (future, cancelled)
+        return job
+
+    def cancel(self, job_id: str) -> Job | None:
+        with self._lock:
+            if (running := self._running.get(job_id)) is not None:
+                future, cancelled = running
+                cancelled.set()
+                if future.cancel():
+                    self._running.pop(job_id)
+                    self.store.update(job_id, status=JobStatus.CANCELLED)
+            else:
+                # Queued by another process sharing the store, which stops the
+                # job at its next check
+                self.store.update(job_id, status=JobStatus.CANCELLED)
+        return self.store.get(job_id)
+
+    def _run(self, context: JobContext, run: Callable[[JobContext], bytes]) -> None:
+        job_id = context.job_id
+        try:
+            context.check()
+            self.store.update(job_id, status=JobStatus.RUNNING)
+            result = run(context)
+            context.check()
+            self.store.update(
+                job_id, status=JobStatus.DONE, progress=1.0, result=result
+            )
+        except JobCancelled:
+            self.store.update(job_id, status=JobStatus.CANCELLED)
+        except Exception as e:
+            self.store.update(job_id, status=JobStatus.FAILED, error=repr(e))
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
@@ -0,0 +1,295 @@
+"""Precomputed tables of final concentrations, served by interpolation."""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+from tocomo.matrix import AxisRange, Detail, Matrix, RunMatrix, matrix_values, value_key
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    DEFAULT_LIMITS,
+    MOLECULE_INDEX,
+    MOLECULES,
+    CompiledReactions,
+    Molecule,
+    SolverLimits,
+)
+from tocomo.sweep import SWEEP_CHUNK_SIZE, FinalSolver
+
+M = Molecule
+
+logger = logging.getLogger(__name__)
+
+# Files making up a table in its directory
+FINAL_FILE = "final.npy"
+METADATA_FILE = "table.json"
+
+
+@dataclass
+class LookupTable:
+    """
+    Final concentrations, ordered by MOLECULES, on the grid spanned by `x`
+    (the `column` molecule) and `y` (the `row` molecule) with the other
+    molecules fixed at `inputs`. `reactions` and `limits` are the key of the
+    reaction set and the solver limits the table was computed with.
+    """
+
+    row: Molecule
+    column: Molecule
+    inputs: dict[Molecule, float]
+    x: npt.NDArray[np.float64]
+    y: npt.NDArray[np.float64]
+    final: npt.NDArray[np.float64]
+    reactions: str
+    limits: SolverLimits
+
+    @classmethod
+    def from_env(
+        cls,
+        reactions: CompiledReactions = COMPILED_REACTIONS,
+        limits: SolverLimits = DEFAULT_LIMITS,
+    ) -> LookupTable | None:
+        """
+        Load the table in the directory TOCOMO_LOOKUP_TABLE, if set. Tables
+        computed with other reactions or solver limits are ignored, as they
+        would not match what the solver returns.
+        """
+        if not (path := os.environ.get("TOCOMO_LOOKUP_TABLE")):
+            return None
+        table = cls.load(path)
+        if table.reactions != reactions.key or not _same_limits(table.limits, limits):
+            logger.warning("Ignoring lookup table %s computed for other solver", path)
+            return None
+        return table
+
+    @classmethod
+    def load(cls, path: str | Path) -> LookupTable:
+        """Load a table saved with `save`, memory-mapping the concentrations"""
+        path = Path(path)
+        metadata = json.loads((path / METADATA_FILE).read_text())
+        return cls(
+            row=Molecule(metadata["row"]),
+            column=Molecule(metadata["column"]),
+            inputs={Molecule(m): v for m, v in metadata["inputs"].items()},
+            x=np.array(metadata["x"], dtype=np.float64),
+            y=np.array(metadata["y"], dtype=np.float64),
+            final=np.load(path / FINAL_FILE, mmap_mode="r"),
+            reactions=metadata["reactions"],
+            limits=SolverLimits(**metadata["limits"]),
+        )
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / FINAL_FILE, self.final)
+        metadata = {
+            "row": self.row,
+            "column": self.column,
+            "inputs": self.inputs,
+            "x": self.x.tolist(),
+            "y": self.y.tolist(),
+            "reactions": self.reactions,
+            "limits": {
+                "tolerance": self.limits.tolerance,
+                "max_steps": self.limits.max_steps,
+            },
+        }
+        (path / METADATA_FILE).write_text(json.dumps(metadata))
+
+    def key(self) -> str:
+        """
+        Content hash of the grid the table was computed on, which together
+        with its reactions and limits determines the table
+        """
+        return hashlib.sha256(
+            b"".join(
+                [
+                    json.dumps([self.row, self.column, self.inputs]).encode(),
+                    self.x.tobytes(),
+                    self.y.tobytes(),
+                ]
+            )
+        ).hexdigest()
+
+    def covers(self, data: RunMatrix) -> bool:
+        """
+        Whether the grid of `data` can be interpolated from the table: it
+        sweeps the same molecules within the table's ranges, with the same
+        fixed inputs, and only asks for the plotted values
+        """
+        x = data.column_range.values()
+        y = data.row_range.values()
+        return (
+            data.detail == Detail.VALUES
+            and data.row == self.row
+            and data.column == self.column
+            and _fixed_inputs(data.inputs, self.row, self.column) == self.inputs
+            and self.x[0] <= x[0]
+            and x[-1] <= self.x[-1]
+            and self.y[0] <= y[0]
+            and y[-1] <= self.y[-1]
+        )
+
+    def interpolate(
+        self, x: npt.NDArray[np.float64], y: npt.NDArray[np.float64]
+    ) -> npt.NDArray[np.float64]:
+        """
+        Bilinearly interpolated final concentrations of shape
+        (len(y), len(x), len(MOLECULES)). Points on the table's grid are
+        returned exactly as they were solved.
+        """
+        columns, tx = _bracket(self.x, x)
+        rows, ty = _bracket(self.y, y)
+        tx = tx[None, :, None]
+        ty = ty[:, None, None]
+        rows, columns = rows[:, None], columns[None, :]
+        f = self.final
+        upper = (1 - tx) * f[rows, columns] + tx * f[rows, columns + 1]
+        lower = (1 - tx) * f[rows + 1, columns] + tx * f[rows + 1, columns + 1]
+        return np.asarray((1 - ty) * upper + ty * lower, dtype=np.float64)
+
+    def matrix(self, data: RunMatrix) -> Matrix:
+        """The matrix of `data`, interpolated from the table, see `covers`"""
+        x = data.column_range.values()
+        y = data.row_range.values()
+        final = self.interpolate(x, y)
+        return Matrix(
+            x=x,
+            y=y,
+            values=matrix_values(final, value_key(data.value), data.pipe_inputs),
+            final=final,
+            results=[[None] * len(x) for _ in y],
+            computed=np.zeros((len(y), len(x)), dtype=np.bool_),
+        )
+
+
+def precompute(
+    row: Molecule,
+    column: Molecule,
+    inputs: dict[Molecule, float],
+    row_range: AxisRange,
+    column_range: AxisRange,
+    solve: FinalSolver,
+    reactions: CompiledReactions = COMPILED_REACTIONS,
+    limits: SolverLimits = DEFAULT_LIMITS,
+) -> LookupTable:
+    """
+    Tabulate the final concentrations over the grid of `row_range` and
+    `column_range`, calling `solve`, which must use `reactions` and `limits`,
+    on a few rows at a time
+    """
+    if len(row_range) < 2 or len(column_range) < 2:
+        raise ValueError("a lookup table needs at least two points along each axis")
+    x = column_range.values()
+    y = row_range.values()
+    inputs = _fixed_inputs(inputs, row, column)
+
+    initial = np.zeros((len(x), len(MOLECULES)), dtype=np.float64)
+    for m, v in inputs.items():
+        initial[:, MOLECULE_INDEX[m]] = v
+    initial[:, MOLECULE_INDEX[column]] = x
+
+    final = np.empty((len(y), len(x), len(MOLECULES)), dtype=np.float64)
+    step = max(1, SWEEP_CHUNK_SIZE // len(x))
+    for start in range(0, len(y), step):
+        rows = y[start : start + step]
+        chunk = np.tile(initial, (len(rows), 1))
+        chunk[:, MOLECULE_INDEX[row]] = np.repeat(rows, len(x))
+        final[start : start + len(rows)] = solve(chunk).reshape(
+            len(rows), len(x), len(MOLECULES)
+        )
+
+    return LookupTable(
+        row=row,
+        column=column,
+        inputs=inputs,
+        x=x,
+        y=y,
+        final=final,
+        reactions=reactions.key,
+        limits=limits,
+    )
+
+
+def _fixed_inputs(
+    inputs: dict[Molecule, float], row: Molecule, column: Molecule
+) -> dict[Molecule, float]:
+    """Concentrations of every molecule other than `row` and `column`"""
+    return {m: float(inputs.get(m, 0.0)) for m in MOLECULES if m not in (row, column)}
+
+
+def _same_limits(a: SolverLimits, b: SolverLimits) -> bool:
+    """Whether the limits give the same results, the time budget aside"""
+    return a.tolerance == b.tolerance and a.max_steps == b.max_steps
+
+
+def _bracket(
+    axis: npt.NDArray[np.float64], points: npt.NDArray[np.float64]
+) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.float64]]:
+    """
+    Index of the table interval each point falls in, and the fraction of the
+    way along that interval
+    """
+    index = np.clip(np.searchsorted(axis, points, side="right") - 1, 0, len(axis) - 2)
+    fraction = (points - axis[index]) / (axis[index + 1] - axis[index])
+    return index, fraction
+
+
+def _molecule(name: str) -> Molecule:
+    return Molecule(name.lower())
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Precompute a table for the default scenario of the form"""
+    from tocomo.pool import SolverPool
+
+    parser = argparse.ArgumentParser(
+        prog="python -m tocomo.lookup", description=main.__doc__
+    )
+    parser.add_argument("path", help="directory to save the table in")
+    parser.add_argument("--row", type=_molecule, default=M.NO2)
+    parser.add_argument("--column", type=_molecule, default=M.O2)
+    parser.add_argument(
+        "--input",
+        action="append",
+        default=[],
+        metavar="MOLECULE=VALUE",
+        help="fixed concentration, default H2O=30, SO2=10 and H2S=0",
+    )
+    parser.add_argument("--min", type=float, default=0.0)
+    parser.add_argument("--max", type=float, default=20.0)
+    parser.add_argument("--count", type=int, default=401)
+    args = parser.parse_args(argv)
+
+    inputs = {M.H2O: 30.0, M.SO2: 10.0, M.H2S: 0.0}
+    for pair in args.input:
+        molecule, value = pair.split("=")
+        inputs[_molecule(molecule)] = float(value)
+    axis = AxisRange(min=args.min, max=args.max, count=args.count)
+
+    limits = SolverLimits.from_env()
+    pool = SolverPool.from_env()
+
+    def solve(initial: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        return pool.run_model_sm1_batch(initial, COMPILED_REACTIONS, None, limits).final
+
+    try:
+        table = precompute(
+            args.row, args.column, inputs, axis, axis, solve, limits=limits
+        )
+    finally:
+        pool.shutdown()
+    table.save(args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""Concentration grids sweeping two molecules, as shown in the heatmap."""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from enum import StrEnum, auto
+from typing import Annotated, Any, Self
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel, Field, model_validator
+
+from tocomo.corrosion_calc import corrosion_rates, surface_area
+from tocomo.reactions import MOLECULE_INDEX, MOLECULES, Molecule, Result, SolverStatus
+
+M = Molecule
+
+# Upper bound on the number of points along a single axis
+MAX_AXIS_POINTS = 1000
+
+# Upper bounds on the number of cells of a grid solved within a request, and
+# of one whose response includes every step. Larger grids are solved as
+# background jobs.
+MAX_REQUEST_CELLS = 100_000
+MAX_REQUEST_STEPS_CELLS = 10_000
+
+# Least number of points solved at a time by iter_matrix_rows
+STREAM_CHUNK_CELLS = 200
+
+# Solves each row of an (N, len(MOLECULES)) array of initial concentrations
+GridSolver = Callable[[npt.NDArray[np.float64]], list[Result]]
+
+
+class AxisRange(BaseModel):
+    """
+    Points along one axis of the grid, from `min` to `max` (inclusive) either
+    `step` apart or as `count` evenly spaced points
+    """
+
+    min: float = 0.5
+    max: float = 10.0
+    step: Annotated[float | None, Field(gt=0)] = None
+    count: Annotated[int | None, Field(ge=1, le=MAX_AXIS_POINTS)] = None
+
+    @model_validator(mode="after")
+    def check_points(self) -> Self:
+        if self.max < self.min:
+            raise ValueError("max must not be less than min")
+        if self.step is not None and self.count is not None:
+            raise ValueError("only one of step and count may be given")
+        if self.count is None and len(self) > MAX_AXIS_POINTS:
+            raise ValueError(f"axis has more than {MAX_AXIS_POINTS} points")
+        return self
+
+    def __len__(self) -> int:
+        if self.count is not None:
+            return self.count
+        step = self.step or 0.5
+        return math.floor((self.max - self.min) / step + 1e-9) + 1
+
+    def values(self) -> npt.NDArray[np.float64]:
+        if self.count is not None:
+            return np.linspace(self.min, self.max, self.count)
+        return self.min + (self.step or 0.5) * np.arange(len(self), dtype=np.float64)
+
+
+class Refinement(BaseModel):
+    """
+    Adaptive evaluation of the grid. Only every 2**levels-th point along each
+    axis is solved at first, and cells whose corner values differ by more than
+    `threshold` are subdivided until neighbouring points are reached. Points
+    in cells that are not subdivided are interpolated bilinearly.
+    """
+
+    levels: Annotated[int, Field(ge=1, le=8)] = 2
+    threshold: Annotated[float, Field(ge=0)] = 0.1
+
+
+class Detail(StrEnum):
+    # Only the plotted values
+    VALUES = auto()
+    # Initial, final and aggregated concentrations of every cell
+    FINAL = auto()
+    # Complete results including every reaction step
+    STEPS = auto()
+
+
+class RunMatrix(BaseModel):
+    row: Molecule = Field(alias="rowValue")
+    column: Molecule = Field(alias="columnValue")
+    value: str = Field(alias="valueValue")
+    inputs: dict[Molecule, float]
+    pipe_inputs: dict[str, float] = Field(default_factory=dict, alias="pipeInputs")
+    row_range: AxisRange = Field(default_factory=AxisRange, alias="rowRange")
+    column_range: AxisRange = Field(default_factory=AxisRange, alias="columnRange")
+    refine: Refinement | None = None
+    detail: Detail = Detail.VALUES
+    # Key of a reaction set added through the API, the default reactions if None
+    reaction_set: str | None = Field(None, alias="reactionSet")
+
+    def cells(self) -> int:
+        """Number of cells of the grid"""
+        return len(self.row_range) * len(self.column_range)
+
+    def check_request_size(self) -> None:
+        """
+        Raise ValueError if the grid is too large to be solved within a
+        request, rather than as a background job
+        """
+        if self.detail == Detail.STEPS and self.cells() > MAX_REQUEST_STEPS_CELLS:
+            raise ValueError(
+                f"grid has more than {MAX_REQUEST_STEPS_CELLS} cells with detail"
+                " steps, submit it to /api/jobs/run_matrix instead"
+            )
+        if self.cells() > MAX_REQUEST_CELLS:
+            raise ValueError(
+                f"grid has more than {MAX_REQUEST_CELLS} cells,"
+                " submit it to /api/jobs/run_matrix instead"
+            )
+
+    def cell_concentrations(self, row: int, column: int) -> dict[Molecule, float]:
+        """Initial concentrations of the cell at (row, column)"""
+        return {
+            **{m: 0.0 for m in MOLECULES},
+            **self.inputs,
+            self.row: float(self.row_range.values()[row]),
+            self.column: float(self.column_range.values()[column]),
+        }
+
+
+class RunMatrixCell(RunMatrix):
+    """A single cell of a matrix, identified by its row and column index"""
+
+    row_index: Annotated[int, Field(alias="rowIndex", ge=0)]
+    column_index: Annotated[int, Field(alias="columnIndex", ge=0)]
+
+    @model_validator(mode="after")
+    def check_indices(self) -> Self:
+        if self.row_index >= len(self.row_range):
+            raise ValueError("rowIndex is outside of the row range")
+        if self.column_index >= len(self.column_range):
+            raise ValueError("columnIndex is outside of the column range")
+        return self
+
+
+class RunMatrixStream(RunMatrix):
+    """A matrix computed row by row, see `iter_matrix_rows`"""
+
+    @model_validator(mode="after")
+    def check_refine(self) -> Self:
+        if self.refine is not None:
+            raise ValueError("refine is not supported when streaming")
+        return self
+
+
+@dataclass
+class Matrix:
+    """
+    Values on the grid spanned by `x` (columns) and `y` (rows), along with the
+    final concentrations ordered by MOLECULES. `results` is None, `final` NaN
+    and `computed` False for points that were interpolated.
+    """
+
+    x: npt.NDArray[np.float64]
+    y: npt.NDArray[np.float64]
+    values: npt.NDArray[np.float64]
+    final: npt.NDArray[np.float64]
+    results: list[list[Result | None]]
+    computed: npt.NDArray[np.bool_]
+
+    def result_data(self, detail: Detail) -> list[list[Any]] | None:
+        """Per-cell results to include in a response at the given detail"""
+        if detail == Detail.VALUES:
+            return None
+        return [[cell_data(r, detail) for r in row] for row in self.results]
+
+    @property
+    def partial(self) -> npt.NDArray[np.bool_]:
+        """Whether each point was solved, but stopped at a limit"""
+        return np.array(
+            [[is_partial(r) for r in row] for row in self.results], dtype=np.bool_
+        ).reshape(self.values.shape)
+
+
+@dataclass
+class MatrixRow:
+    """One row of a matrix, as produced by `iter_matrix_rows`"""
+
+    index: int
+    values: npt.NDArray[np.float64]
+    results: list[Result]
+
+    def result_data(self, detail: Detail) -> list[Any] | None:
+        if detail == Detail.VALUES:
+            return None
+        return [cell_data(r, detail) for r in self.results]
+
+    @property
+    def partial(self) -> npt.NDArray[np.bool_]:
+        return np.array([is_partial(r) for r in self.results], dtype=np.bool_)
+
+
+def is_partial(result: Result | None) -> bool:
+    """
+    Whether a solve stopped at the step or time limit before converging, so
+    that its values are those it reached so far
+    """
+    return result is not None and result.status != SolverStatus.CONVERGED
+
+
+def cell_data(result: Result | None, detail: Detail) -> Any:
+    """The part of a cell's result included in a response at the given detail"""
+    if result is None:
+        return None
+    return result.content(steps=detail == Detail.STEPS)
+
+
+def value_key(value: str) -> Molecule | str:
+    """The molecule named by `value`, or `value` itself for corrosion rates"""
+    for m in Molecule.__members__.values():
+        if m.value == value:
+            return m
+    return value
+
+
+def matrix_values(
+    final: npt.NDArray[np.float64],
+    key: Molecule | str,
+    pipe_inputs: dict[str, float],
+) -> npt.NDArray[np.float64]:
+    """
+    The plotted value for final concentrations of shape (..., len(MOLECULES))
+    """
+    if isinstance(key, Molecule):
+        return final[..., MOLECULE_INDEX[key]]
+
+    rates = corrosion_rates(
+        surface_area(pipe_inputs["inner_diameter"], pipe_inputs["drop_out_length"]),
+        pipe_inputs["flowrate"],
+        final[..., MOLECULE_INDEX[M.H2SO4]],
+        final[..., MOLECULE_INDEX[M.HNO3]],
+    )
+    return np.asarray(rates[key], dtype=np.float64)
+
+
+def _solve_points(
+    data: RunMatrix,
+    solve: GridSolver,
+    x: npt.NDArray[np.float64],
+    y: npt.NDArray[np.float64],
+    rows: npt.NDArray[np.intp],
+    columns: npt.NDArray[np.intp],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], list[Result]]:
+    """Final concentrations, values and results at the given grid points"""
+    initial = np.zeros((len(rows), len(MOLECULES)), dtype=np.float64)
+    for m, v in data.inputs.items():
+        initial[:, MOLECULE_INDEX[m]] = v
+    initial[:, MOLECULE_INDEX[data.row]] = y[rows]
+    initial[:, MOLECULE_INDEX[data.column]] = x[columns]
+
+    solved = solve(initial)
+    final = np.array(
+        [[r.final[m] for m in MOLECULES] for r in solved], dtype=np.float64
+    ).reshape(len(rows), len(MOLECULES))
+    values = matrix_values(final, value_key(data.value), data.pipe_inputs)
+    return final, values, solved
+
+
+def iter_matrix_rows(
+    data: RunMatrix, solve: GridSolver, chunk_cells: int = STREAM_CHUNK_CELLS
+) -> Iterator[MatrixRow]:
+    """
+    Evaluate the grid described by `data` a few rows at a time, solving at
+    least `chunk_cells` points per call to `solve`, and yield each row once it
+    is done. Refinement is not supported, as it needs the whole grid.
+    """
+    x = data.column_range.values()
+    y = data.row_range.values()
+    step = max(1, chunk_cells // len(x))
+    for start in range(0, len(y), step):
+        stop = min(start + step, len(y))
+        rows = np.repeat(np.arange(start, stop), len(x))
+        columns = np.tile(np.arange(len(x)), stop - start)
+        _, values, results = _solve_points(data, solve, x, y, rows, columns)
+        for i, row in enumerate(range(start, stop)):
+            cells = slice(i * len(x), (i + 1) * len(x))
+            yield MatrixRow(index=row, values=values[cells], results=results[cells])
+
+
+def compute_matrix(data: RunMatrix, solve: GridSolver) -> Matrix:
+    """Evaluate the grid described by `data`, solving points with `solve`"""
+    x = data.column_range.values()
+    y = data.row_range.values()
+
+    values = np.zeros((len(y), len(x)), dtype=np.float64)
+    computed = np.zeros((len(y), len(x)), dtype=np.bool_)
+    final = np.full((len(y), len(x), len(MOLECULES)), np.nan, dtype=np.float64)
+    results: list[list[Result | None]] = [[None] * len(x) for _ in y]
+
+    def evaluate(points: list[tuple[int, int]]) -> None:
+        points = [p for p in dict.fromkeys(points) if not computed[p]]
+        if not points:
+            return
+        rows, columns = np.array(points).T
+        (
+            final[rows, columns],
+            values[rows, columns],
+            solved,
+        ) = _solve_points(data, solve, x, y, rows, columns)
+        computed[rows, columns] = True
+        for (row, column), result in zip(points, solved):
+            results[row][column] = result
+
+    if data.refine is None:
+        evaluate([(row, column) for row in range(len(y)) for column in range(len(x))])
+    else:
+        _refine(data.refine, x, y, values, computed, evaluate)
+
+    return Matrix(
+        x=x, y=y, values=values, final=final, results=results, computed=computed
+    )
+
+
+def _refine(
+    refine: Refinement,
+    x: npt.NDArray[np.float64],
+    y: npt.NDArray[np.float64],
+    values: npt.NDArray[np.float64],
+    computed: npt.NDArray[np.bool_],
+    evaluate: Callable[[list[tuple[int, int]]], None],
+) -> None:
+    stride = 2**refine.levels
+    rows = sorted({*range(0, len(y), stride), len(y) - 1})
+    columns = sorted({*range(0, len(x), stride), len(x) - 1})
+    evaluate([(row, column) for row in rows for column in columns])
+
+    # Cells are (top, bottom, left, right) indices of computed corners
+    cells = [
+        (top, bottom, left, right)
+        for top, bottom in zip(rows, rows[1:] or rows)
+        for left, right in zip(columns, columns[1:] or columns)
+    ]
+    smooth: list[tuple[int, int, int, int]] = []
+    while cells:
+        split = []
+        for cell in cells:
+            top, bottom, left, right = cell
+            if bottom - top <= 1 and right - left <= 1:
+                continue
+            corners = values[[top, top, bottom, bottom], [left, right, left, right]]
+            if np.ptp(corners) <= refine.threshold:
+                smooth.append(cell)
+            else:
+                split.append(cell)
+
+        cells = []
+        points: list[tuple[int, int]] = []
+        for top, bottom, left, right in split:
+            row_bounds = _halve(top, bottom)
+            column_bounds = _halve(left, right)
+            points.extend(
+                (row, column)
+                for row in sorted({i for bounds in row_bounds for i in bounds})
+                for column in sorted({i for bounds in column_bounds for i in bounds})
+            )
+            cells.extend(
+                (*row_range, *column_range)
+                for row_range in row_bounds
+                for column_range in column_bounds
+            )
+        evaluate(points)
+
+    for top, bottom, left, right in smooth:
+        _interpolate(x, y, values, computed, top, bottom, left, right)
+
+
+def _halve(start: int, stop: int) -> list[tuple[int, int]]:
+    if stop - start <= 1:
+        return [(start, stop)]
+    middle = (start + stop) // 2
+    return [(start, middle), (middle, stop)]
+
+
+def _interpolate(
+    x: npt.NDArray[np.float64],
+    y: npt.NDArray[np.float64],
+    values: npt.NDArray[np.float64],
+    computed: npt.NDArray[np.bool_],
+    top: int,
+    bottom: int,
+    left: int,
+    right: int,
+) -> None:
+    """Bilinearly interpolate the points in a cell that were not solved"""
+    ty = (y[top : bottom + 1] - y[top]) / ((y[bottom] - y[top]) or 1.0)
+    tx = (x[left : right + 1] - x[left]) / ((x[right] - x[left]) or 1.0)
+    upper = values[top, left] + tx * (values[top, right] - values[top, left])
+    lower = values[bottom, left] + tx * (values[bottom, right] - values[bottom, left])
+    interpolated = upper[None, :] + ty[:, None] * (lower - upper)[None, :]
+
+    cell = (slice(top, bottom + 1), slice(left, right + 1))
+    values[cell] = np.where(computed[cell], values[cell], interpolated)
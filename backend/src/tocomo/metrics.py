@@ -0,0 +1,331 @@
+"""Solver and request metrics in the Prometheus text format."""
+
+from __future__ import annotations
+
+import abc
+import bisect
+import logging
+import math
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import TypeVar
+
+import numpy as np
+import numpy.typing as npt
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from tocomo.batch import BatchResult
+from tocomo.cache import BatchSolver, Solver
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    DEFAULT_LIMITS,
+    CompiledReactions,
+    Molecule,
+    Result,
+    SolverLimits,
+)
+from tocomo.trace import Tracer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("tocomo.metrics")
+
+LabelValues = tuple[str, ...]
+M = TypeVar("M", bound="Metric")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric(abc.ABC):
+    """A metric rendered with its help and type, and the samples of subclasses"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[str]:
+        """The metric's lines in the text format, one per label values"""
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """A value read by calling `read` whenever the metrics are rendered"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]) -> None:
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {_format_value(self.read())}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: Iterable[float],
+        labels: Iterable[str] = (),
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        # Per label values: count in each bucket (the last is +Inf), and sum
+        self._values: dict[LabelValues, tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        self.observe_many([value], **labels)
+
+    def observe_many(self, values: Iterable[float], **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for value in values:
+                counts[bisect.bisect_left(self.buckets, value)] += 1
+                total += value
+            self._values[key] = (counts, total)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0))
+        return sum(counts)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], counts):
+                cumulative += count
+                labels = _format_labels(
+                    (*self.labels, "le"), (*key, _format_value(bound))
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(
+            f"{line}\n" for metric in self.metrics for line in metric.render()
+        )
+
+
+class SolverMetrics:
+    """
+    Number of solves, reaction steps per reaction and per solve, and solver
+    wall time. Wrap solvers with `solver` and `batch_solver` to record them.
+    The app wraps the solvers every endpoint and background job solves with,
+    behind the result cache, so cached results are not counted. Wall time is
+    that of the whole call, including waiting for the solver pool.
+    Solves taking more than `slow_steps` steps are logged with their initial
+    concentrations on the "tocomo.metrics" logger, to find the inputs that
+    keep the solver iterating.
+    """
+
+    def __init__(self, registry: Registry, slow_steps: int = 100) -> None:
+        self.slow_steps = slow_steps
+        self.solves = registry.register(
+            Counter("tocomo_solver_solves_total", "Concentrations solved", ["solver"])
+        )
+        self.reaction_steps = registry.register(
+            Counter(
+                "tocomo_solver_reaction_steps_total",
+                "Reaction steps taken, by reaction index",
+                ["reaction"],
+            )
+        )
+        self.steps = registry.register(
+            Histogram(
+                "tocomo_solver_steps",
+                "Reaction steps taken to solve one set of concentrations",
+                [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000],
+            )
+        )
+        self.seconds = registry.register(
+            Histogram(
+                "tocomo_solver_seconds",
+                "Wall time of a call to the solver",
+                [0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10],
+                ["solver"],
+            )
+        )
+
+    def observe(
+        self,
+        reaction_indices: npt.NDArray[np.int64],
+        initial: npt.NDArray[np.float64],
+        solver: str,
+        seconds: float,
+    ) -> None:
+        """
+        Record a call to `solver` taking `seconds`, given the (steps, solves)
+        reaction index of every step, where -1 is no step, and the (solves,
+        molecules) initial concentrations
+        """
+        taken = reaction_indices >= 0
+        steps = taken.sum(axis=0)
+        self.solves.inc(len(steps), solver=solver)
+        self.seconds.observe(seconds, solver=solver)
+        self.steps.observe_many(steps.tolist())
+        indices, counts = np.unique(reaction_indices[taken], return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.reaction_steps.inc(count, reaction=str(index))
+        for row in np.flatnonzero(steps > self.slow_steps).tolist():
+            logger.info(
+                "Slow solve of %d steps from %s",
+                steps[row],
+                initial[row].tolist(),
+            )
+
+    def solver(self, solve: Solver) -> Solver:
+        def solver(
+            initial_concentrations: dict[Molecule, float],
+            tracer: Tracer | None = None,
+            reactions: CompiledReactions = COMPILED_REACTIONS,
+            limits: SolverLimits = DEFAULT_LIMITS,
+        ) -> Result:
+            start = time.perf_counter()
+            result = solve(initial_concentrations, tracer, reactions, limits)
+            self.observe(
+                result.reaction_indices.reshape(-1, 1),
+                result.initial_vector.reshape(1, -1),
+                "single",
+                time.perf_counter() - start,
+            )
+            return result
+
+        return solver
+
+    def batch_solver(self, solve: BatchSolver) -> BatchSolver:
+        def solver(
+            initial: npt.ArrayLike,
+            reactions: CompiledReactions = COMPILED_REACTIONS,
+            tracer: Tracer | None = None,
+            limits: SolverLimits = DEFAULT_LIMITS,
+            deadline: float | None = None,
+        ) -> BatchResult:
+            start = time.perf_counter()
+            result = solve(initial, reactions, tracer, limits, deadline)
+            self.observe(
+                result.reaction_indices,
+                result.initial,
+                "batch",
+                time.perf_counter() - start,
+            )
+            return result
+
+        return solver
+
+
+class RequestMetrics:
+    """Latency of HTTP requests by method, route and status code"""
+
+    def __init__(self, registry: Registry) -> None:
+        self.seconds = registry.register(
+            Histogram(
+                "tocomo_http_request_duration_seconds",
+                "Time taken to respond to HTTP requests",
+                [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],
+                ["method", "route", "status"],
+            )
+        )
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        self.seconds.observe(seconds, method=method, route=route, status=str(status))
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording the latency of every HTTP request"""
+
+    def __init__(self, app: ASGIApp, metrics: RequestMetrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Routes are labelled by their path template, to keep the number
+            # of label values bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.observe(
+                scope["method"], route, status, time.perf_counter() - start
+            )
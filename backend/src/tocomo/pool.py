@@ -0,0 +1,176 @@
+"""Process pool running the reaction solvers off the web server's process."""
+
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+
+from tocomo.batch import BatchResult, run_model_sm1_batch
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    DEFAULT_LIMITS,
+    CompiledReactions,
+    Molecule,
+    Result,
+    SolverLimits,
+    run_model_sm1,
+)
+from tocomo.trace import Tracer
+
+T = TypeVar("T")
+
+
+def available_cpus(cgroup: str = "/sys/fs/cgroup") -> int:
+    """
+    The number of CPUs this process may use: those it is allowed to run on,
+    limited by the CPU quota of its cgroup (v2 or v1), rounded up. Containers
+    see every CPU of their node, but may only use their quota of them.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open(os.path.join(cgroup, "cpu.max")) as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open(os.path.join(cgroup, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = f.read().strip()
+            with open(os.path.join(cgroup, "cpu", "cpu.cfs_period_us")) as f:
+                period = f.read().strip()
+        except OSError:
+            return cpus
+    if quota in ("max", "-1"):
+        return cpus
+    try:
+        return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+    except (ValueError, ZeroDivisionError):
+        return cpus
+
+
+class SolverPool:
+    """
+    Dispatches solver calls to a ProcessPoolExecutor with `workers` processes,
+    splitting batches into at most one chunk per worker of at least
+    `chunk_size` rows. With zero workers, or when tracing, the solvers run in
+    the calling process instead.
+
+    Calls block until the results are available, so async code should call
+    them through a thread pool. The executor is only started on first use,
+    which keeps it out of processes that fork after importing the app. If a
+    worker process dies, which breaks the executor, it is replaced and the
+    call is tried once more.
+    """
+
+    def __init__(self, workers: int, chunk_size: int = 50) -> None:
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> SolverPool:
+        """
+        Configure from TOCOMO_SOLVER_WORKERS (defaults to the number of
+        available CPUs, see available_cpus) and TOCOMO_SOLVER_CHUNK_SIZE
+        """
+        return cls(
+            workers=int(os.environ.get("TOCOMO_SOLVER_WORKERS", available_cpus())),
+            chunk_size=int(os.environ.get("TOCOMO_SOLVER_CHUNK_SIZE", 50)),
+        )
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a broken executor, unless another call has replaced it already"""
+        with self._lock:
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _run(self, fn: Callable[..., T], calls: list[tuple[Any, ...]]) -> list[T]:
+        """
+        The results of calling `fn` with each of `calls` in the executor, in
+        a new one if a worker process died
+        """
+        try:
+            return self._gather(fn, calls)
+        except BrokenProcessPool:
+            return self._gather(fn, calls)
+
+    def _gather(self, fn: Callable[..., T], calls: list[tuple[Any, ...]]) -> list[T]:
+        executor = self.executor
+        try:
+            futures = [executor.submit(fn, *args) for args in calls]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def run_model_sm1(
+        self,
+        initial_concentrations: dict[Molecule, float],
+        tracer: Tracer | None = None,
+        reactions: CompiledReactions = COMPILED_REACTIONS,
+        limits: SolverLimits = DEFAULT_LIMITS,
+    ) -> Result:
+        if self.workers <= 0 or tracer is not None:
+            return run_model_sm1(initial_concentrations, tracer, reactions, limits)
+        [result] = self._run(
+            run_model_sm1, [(initial_concentrations, None, reactions, limits)]
+        )
+        return result
+
+    def run_model_sm1_batch(
+        self,
+        initial: npt.ArrayLike,
+        reactions: CompiledReactions = COMPILED_REACTIONS,
+        tracer: Tracer | None = None,
+        limits: SolverLimits = DEFAULT_LIMITS,
+        deadline: float | None = None,
+    ) -> BatchResult:
+        """
+        The time budget of `limits` applies to the whole batch, as every
+        chunk stops at the same deadline, or at `deadline` if given.
+        time.monotonic() is system-wide, so the worker processes can compare
+        against it.
+        """
+        rows = np.asarray(initial, dtype=np.float64)
+        chunks = min(self.workers, math.ceil(len(rows) / self.chunk_size))
+        if chunks <= 0 or tracer is not None:
+            return run_model_sm1_batch(rows, reactions, tracer, limits, deadline)
+
+        if deadline is None:
+            deadline = limits.deadline()
+        return BatchResult.concatenate(
+            self._run(
+                run_model_sm1_batch,
+                [
+                    (chunk, reactions, None, limits, deadline)
+                    for chunk in np.array_split(rows, chunks)
+                ],
+            )
+        )
@@ -0,0 +1,142 @@
+"""User-defined reaction sets, compiled once and kept by content hash."""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Annotated, Self
+
+from pydantic import BaseModel, Field, model_validator
+
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    CompiledReactions,
+    Reaction,
+    reactions_key,
+)
+
+# Upper bound on the number of reactions in a submitted set
+MAX_REACTIONS = 100
+
+
+class ReactionSet(BaseModel):
+    """
+    Reactions in priority order, where the first active reaction that can be
+    applied is applied first. Inactive reactions are kept for reference only.
+    """
+
+    reactions: Annotated[list[Reaction], Field(min_length=1, max_length=MAX_REACTIONS)]
+
+    @model_validator(mode="after")
+    def check_reactions(self) -> Self:
+        indices = [r.index for r in self.reactions]
+        if len(set(indices)) != len(indices):
+            raise ValueError("reaction indices must be unique")
+        for r in self.reactions:
+            if not r.lhs or not r.rhs:
+                raise ValueError(f"reaction {r.index} needs reactants and products")
+            for side in (r.lhs, r.rhs):
+                if any(n <= 0 for n, _ in side):
+                    raise ValueError(f"reaction {r.index} has a non-positive count")
+                if len({m for _, m in side}) != len(side):
+                    raise ValueError(f"reaction {r.index} repeats a molecule")
+            # Such a reaction can feed itself without end
+            if {m for _, m in r.lhs} & {m for _, m in r.rhs}:
+                raise ValueError(f"reaction {r.index} produces one of its reactants")
+        return self
+
+
+class ReactionSetInfo(BaseModel):
+    id: str
+    reactions: dict[int, str]
+    reaction_order: list[int]
+
+    @classmethod
+    def of(cls, reactions: CompiledReactions) -> ReactionSetInfo:
+        return cls(
+            id=reactions.key,
+            reactions={r.index: str(r.reaction) for r in reactions.reactions},
+            reaction_order=[r.index for r in reactions.reactions],
+        )
+
+
+class ReactionSets:
+    """
+    Compiled reaction sets by their key, a hash of the active reactions and
+    their order. Adding a set that is already known returns the compiled set
+    instead of compiling it again. Apart from the default reactions, which are
+    always available, at most `maxsize` sets are kept and the least recently
+    used set is dropped first.
+
+    If `path` is given, added sets are also saved in that directory, and sets
+    that are not kept are loaded from it. This lets several server processes
+    share the sets added through any one of them.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 64,
+        default: CompiledReactions = COMPILED_REACTIONS,
+        path: str | Path | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.default = default
+        self.path = None if path is None else Path(path)
+        self._sets: OrderedDict[str, CompiledReactions] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> ReactionSets:
+        """Configure from TOCOMO_REACTION_SETS and TOCOMO_REACTION_SET_DIR"""
+        return cls(
+            maxsize=int(os.environ.get("TOCOMO_REACTION_SETS", 64)),
+            path=os.environ.get("TOCOMO_REACTION_SET_DIR") or None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def all(self) -> list[CompiledReactions]:
+        """The default reactions followed by the added sets, least recent first"""
+        with self._lock:
+            return [self.default, *self._sets.values()]
+
+    def add(self, reaction_set: ReactionSet) -> CompiledReactions:
+        key = reactions_key(reaction_set.reactions)
+        if (compiled := self.get(key)) is not None:
+            return compiled
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so that other processes never
+            # load a partially written set
+            temporary = self.path / f".{key}.{os.getpid()}.json"
+            temporary.write_text(reaction_set.model_dump_json())
+            temporary.replace(self.path / f"{key}.json")
+        return self._keep(key, CompiledReactions(reaction_set.reactions))
+
+    def get(self, key: str | None) -> CompiledReactions | None:
+        """The set with the given key, or the default reactions for None"""
+        if key is None or key == self.default.key:
+            return self.default
+        with self._lock:
+            if (compiled := self._sets.get(key)) is not None:
+                self._sets.move_to_end(key)
+                return compiled
+        if self.path is None or not re.fullmatch("[0-9a-f]{64}", key):
+            return None
+        try:
+            text = (self.path / f"{key}.json").read_text()
+        except FileNotFoundError:
+            return None
+        reaction_set = ReactionSet.model_validate_json(text)
+        return self._keep(key, CompiledReactions(reaction_set.reactions))
+
+    def _keep(self, key: str, compiled: CompiledReactions) -> CompiledReactions:
+        with self._lock:
+            self._sets[key] = compiled
+            while len(self._sets) > self.maxsize:
+                self._sets.popitem(last=False)
+        return compiled
@@ -2,11 +2,21 @@
 
 from __future__ import annotations
 
-from collections import defaultdict
+import hashlib
+import json
+import math
+import os
+import time
+import weakref
 from dataclasses import dataclass
 from enum import StrEnum, auto
-from typing import Annotated
-from pydantic import BaseModel, Field
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel
+
+from tocomo.trace import Tracer
 
 
 class Molecule(StrEnum):
@@ -24,6 +34,12 @@ class Molecule(StrEnum):
 
 M = Molecule
 
+# Fixed order of molecules in compiled concentration vectors
+MOLECULES: tuple[Molecule, ...] = tuple(Molecule)
+MOLECULE_INDEX: dict[Molecule, int] = {m: i for i, m in enumerate(MOLECULES)}
+# Names of MOLECULES, for keys of JSON objects
+MOLECULE_NAMES: tuple[str, ...] = tuple(m.value for m in MOLECULES)
+
 
 MOLECULE_TEXT = {
     M.H2SO4: "H₂SO₄",
@@ -49,9 +65,11 @@ class Reaction(BaseModel):
         self,
         concentrations: dict[Molecule, float],
         aggregated_concentrations: dict[Molecule, float] | None = None,
+        tracer: Tracer | None = None,
+        tolerance: float = 0.001,
     ) -> float:
         mult = min(concentrations[m] / n for n, m in self.lhs)
-        if mult < 0.001:
+        if mult < tolerance:
             return 0.0
 
         for n, m in self.lhs:
@@ -61,11 +79,8 @@ class Reaction(BaseModel):
             if aggregated_concentrations:
                 aggregated_concentrations[m] += mult * n
 
-        substances = sorted(concentrations.keys())
-        for s in substances:
-            v = concentrations[s]
-            print(f"{v:8.1f}", end="")
-        print(f"    ### after applying eq {self.index} * {mult:.3f} : {self}")
+        if tracer is not None:
+            tracer.step(self, mult, concentrations)
         return mult
 
     def __str__(self) -> str:
@@ -114,42 +129,528 @@ REACTIONS = [
 ]
 
 
+class SolverMode(StrEnum):
+    # Apply one reaction at a time, restarting the scan after every step
+    ITERATIVE = auto()
+    # Like ITERATIVE, but repeating two-reaction cycles are detected and
+    # jumped over analytically
+    EVENT_JUMP = auto()
+
+
+class SolverStatus(StrEnum):
+    # No reaction can be applied with a multiplier of at least the tolerance
+    CONVERGED = auto()
+    # Stopped after the maximum number of steps, the result is partial
+    MAX_STEPS = auto()
+    # Stopped when the time budget ran out, the result is partial
+    TIME_BUDGET = auto()
+    # Stopped when a multiplier or concentration became infinite or NaN, as
+    # happens with reactions that produce more of what they consume
+    DIVERGED = auto()
+
+
+@dataclass(frozen=True)
+class SolverLimits:
+    """
+    Reactions are applied until none has a multiplier of at least `tolerance`,
+    or stop early after `max_steps` steps or `time_budget` seconds, whichever
+    comes first. None means unbounded. The steps a solve needs grow with the
+    ratio of its largest to smallest concentration, to hundreds of thousands
+    within the form's ranges, so the default step limit is well above that
+    while still bounding the time any solve takes to a few seconds. The
+    batch solver applies the time budget to the whole batch and counts steps
+    per row.
+    """
+
+    tolerance: float = 0.001
+    max_steps: int | None = 1_000_000
+    time_budget: float | None = None
+
+    @classmethod
+    def from_env(cls) -> SolverLimits:
+        """
+        Configure from TOCOMO_SOLVER_TOLERANCE, TOCOMO_SOLVER_MAX_STEPS and
+        TOCOMO_SOLVER_TIME_BUDGET (seconds), where 0 disables the bound
+        """
+        max_steps = int(os.environ.get("TOCOMO_SOLVER_MAX_STEPS", 1_000_000))
+        time_budget = float(os.environ.get("TOCOMO_SOLVER_TIME_BUDGET", 0))
+        return cls(
+            tolerance=float(os.environ.get("TOCOMO_SOLVER_TOLERANCE", 0.001)),
+            max_steps=max_steps or None,
+            time_budget=time_budget or None,
+        )
+
+    def deadline(self) -> float:
+        """The time.monotonic() at which the time budget of a solve runs out"""
+        if self.time_budget is None:
+            return math.inf
+        return time.monotonic() + self.time_budget
+
+
+DEFAULT_LIMITS = SolverLimits()
+
+# Concentrations below this are considered fully consumed when jumping cycles
+_EPS = 1e-9
+
+
+class CompiledReaction:
+    """
+    Index-based form of a Reaction. `lhs` and `rhs` hold (position, coefficient)
+    pairs, where position refers to MOLECULES. `delta` and `produced` are the
+    dense net change and production per unit multiplier.
+    """
+
+    __slots__ = ("reaction", "index", "lhs", "rhs", "delta", "produced")
+
+    def __init__(self, reaction: Reaction) -> None:
+        self.reaction = reaction
+        self.index = reaction.index
+        self.lhs = tuple((MOLECULE_INDEX[m], n) for n, m in reaction.lhs)
+        self.rhs = tuple((MOLECULE_INDEX[m], n) for n, m in reaction.rhs)
+
+        delta = [0.0] * len(MOLECULES)
+        produced = [0.0] * len(MOLECULES)
+        for i, n in self.lhs:
+            delta[i] -= n
+        for i, n in self.rhs:
+            delta[i] += n
+            produced[i] += n
+        self.delta = tuple(delta)
+        self.produced = tuple(produced)
+
+    def multiplier(self, concentrations: list[float]) -> tuple[float, int]:
+        """Largest multiplier this reaction can be applied with, and the
+        position of the limiting molecule"""
+        mult, limiting = float("inf"), -1
+        for i, n in self.lhs:
+            if (ratio := concentrations[i] / n) < mult:
+                mult, limiting = ratio, i
+        return mult, limiting
+
+
+def reactions_key(reactions: list[Reaction]) -> str:
+    """
+    Content hash of the active reactions and their order, which is the `key`
+    of their CompiledReactions without having to compile them
+    """
+    terms = [
+        [
+            r.index,
+            [[MOLECULE_INDEX[m], n] for n, m in r.lhs],
+            [[MOLECULE_INDEX[m], n] for n, m in r.rhs],
+        ]
+        for r in reactions
+        if r.active
+    ]
+    return hashlib.sha256(json.dumps(terms).encode()).hexdigest()
+
+
+class CompiledReactions:
+    """
+    The active reactions of a reaction set in priority order, compiled into
+    index-based reactions for the scalar solver and dense (R, len(MOLECULES))
+    stoichiometry matrices for the batch solver. `key` is a content hash
+    identifying the active reactions and their order.
+
+    Sets are pickled as their reactions, and unpickling a set that is already
+    compiled in the receiving process gives that set, so that results sent
+    back from a solver process share it.
+    """
+
+    __slots__ = ("reactions", "indices", "rows", "lhs", "rhs", "key", "__weakref__")
+
+    def __init__(self, reactions: list[Reaction]) -> None:
+        self.reactions = tuple(CompiledReaction(r) for r in reactions if r.active)
+        self.key = reactions_key(reactions)
+        self.indices = np.array([r.index for r in self.reactions], dtype=np.int64)
+        self.rows = {r.index: row for row, r in enumerate(self.reactions)}
+        self.lhs = self._matrix([r.lhs for r in self.reactions])
+        self.rhs = self._matrix([r.rhs for r in self.reactions])
+        _COMPILED.setdefault(self.key, self)
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return _compiled, (self.key, [r.reaction for r in self.reactions])
+
+    @staticmethod
+    def _matrix(
+        terms: list[tuple[tuple[int, int], ...]],
+    ) -> npt.NDArray[np.float64]:
+        matrix = np.zeros((len(terms), len(MOLECULES)), dtype=np.float64)
+        for row, pairs in enumerate(terms):
+            for i, n in pairs:
+                matrix[row, i] += n
+        return matrix
+
+    def replay(
+        self,
+        initial: npt.NDArray[np.float64],
+        reaction_indices: npt.NDArray[np.int64],
+        multipliers: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.float64]:
+        """
+        The concentrations after each step from `initial`, of shape
+        (len(multipliers), len(MOLECULES)). Steps are applied with the same
+        floating point operations as both solvers, so the concentrations are
+        exactly those they passed through, except after event jumps.
+        """
+        posteriors = np.empty((len(multipliers), len(MOLECULES)), dtype=np.float64)
+        c = initial
+        for step, (index, mult) in enumerate(
+            zip(reaction_indices.tolist(), multipliers.tolist())
+        ):
+            row = self.rows[index]
+            c = c - mult * self.lhs[row]
+            c = c + mult * self.rhs[row]
+            posteriors[step] = c
+        return posteriors
+
+    def solve(
+        self,
+        concentrations: list[float],
+        aggregated: list[float],
+        tracer: Tracer | None = None,
+        mode: SolverMode = SolverMode.ITERATIVE,
+        limits: SolverLimits = DEFAULT_LIMITS,
+        posteriors: list[list[float]] | None = None,
+    ) -> tuple[list[tuple[CompiledReaction, float]], SolverStatus]:
+        """
+        Apply reactions in place on the concentration vectors until none of
+        them can be applied with a multiplier of at least the tolerance, or a
+        limit is reached. Returns the applied reactions with their multiplier,
+        and why the solver stopped. The concentrations after each step are
+        appended to `posteriors` if given.
+
+        With SolverMode.EVENT_JUMP, a jump over k cycles of reactions a and b
+        is recorded as a single step of a, whose multiplier is the sum of the
+        multipliers a would have been applied with.
+        """
+        jump = mode == SolverMode.EVENT_JUMP
+        tolerance = limits.tolerance
+        max_steps = limits.max_steps or math.inf
+        deadline = limits.deadline()
+        steps: list[tuple[CompiledReaction, float]] = []
+        if not all(map(math.isfinite, concentrations)):
+            return steps, SolverStatus.DIVERGED
+        while True:
+            if len(steps) >= max_steps:
+                return steps, SolverStatus.MAX_STEPS
+            if time.monotonic() >= deadline:
+                return steps, SolverStatus.TIME_BUDGET
+            if (
+                jump
+                and len(steps) >= 4
+                and steps[-1][0] is steps[-3][0]
+                and steps[-2][0] is steps[-4][0]
+                and steps[-1][0] is not steps[-2][0]
+                and (
+                    total := self._jump_cycles(
+                        steps[-2][0],
+                        steps[-1][0],
+                        concentrations,
+                        aggregated,
+                        tolerance,
+                    )
+                )
+            ):
+                steps.append((steps[-2][0], total))
+                if posteriors is not None:
+                    posteriors.append(concentrations.copy())
+                if tracer is not None:
+                    tracer.step(steps[-1][0].reaction, total, to_dict(concentrations))
+
+            for r in self.reactions:
+                mult = float("inf")
+                for i, n in r.lhs:
+                    if (ratio := concentrations[i] / n) < mult:
+                        mult = ratio
+                if mult < tolerance:
+                    continue
+                if not math.isfinite(mult):
+                    return steps, SolverStatus.DIVERGED
+
+                for i, n in r.lhs:
+                    concentrations[i] = concentrations[i] - mult * n
+                finite = True
+                for i, n in r.rhs:
+                    concentrations[i] = c = concentrations[i] + mult * n
+                    aggregated[i] = aggregated[i] + mult * n
+                    finite = finite and math.isfinite(c)
+
+                steps.append((r, mult))
+                if posteriors is not None:
+                    posteriors.append(concentrations.copy())
+                if tracer is not None:
+                    tracer.step(r.reaction, mult, to_dict(concentrations))
+                if not finite:
+                    return steps, SolverStatus.DIVERGED
+                break
+            else:
+                return steps, SolverStatus.CONVERGED
+
+    def _jump_cycles(
+        self,
+        a: CompiledReaction,
+        b: CompiledReaction,
+        concentrations: list[float],
+        aggregated: list[float],
+        tolerance: float = 0.001,
+    ) -> float:
+        """
+        Apply, in closed form, as many repetitions of "a then b" as the
+        iterative solver would, given that b regenerates (part of) what a
+        consumes. Per cycle the multiplier of a scales by a constant factor q,
+        giving a geometric (q < 1) or arithmetic (q == 1) series. Each
+        constraint is only checked at the ends of the jump, which is
+        conservative as all concentrations change monotonically. Returns the
+        summed multiplier of a, or 0 if no jump of two or more cycles is
+        possible.
+        """
+        c = concentrations
+        m_a, limiting = a.multiplier(c)
+        if m_a < tolerance:
+            return 0.0
+        n_l = next(n for i, n in a.lhs if i == limiting)
+
+        # b must be limited by a molecule that is produced by a and is fully
+        # consumed at the start of each cycle
+        regenerating = [(i, n) for i, n in b.lhs if a.delta[i] > 0 and abs(c[i]) < _EPS]
+        if len(regenerating) != 1:
+            return 0.0
+        p, n_p = regenerating[0]
+        r = a.delta[p] / n_p
+        if a.delta[p] + r * b.delta[p] != 0:
+            return 0.0
+
+        v = [da + r * db for da, db in zip(a.delta, b.delta)]
+        q = 1 + v[limiting] / n_l
+        if not 0 < q <= 1:
+            return 0.0
+
+        # Reactions with higher priority than a or b must stay blocked by a
+        # molecule that neither the cycle nor its intermediate state increases
+        position_a, position_b = self.reactions.index(a), self.reactions.index(b)
+        for h in self.reactions[: max(position_a, position_b)]:
+            if (
+                h is not a
+                and h is not b
+                and not any(
+                    c[i] / n < tolerance and v[i] <= 0 and a.delta[i] <= 0
+                    for i, n in h.lhs
+                )
+            ):
+                return 0.0
+        if position_a < position_b and a.produced[limiting]:
+            return 0.0
+
+        def total(k: int) -> float:
+            return m_a * k if q == 1 else m_a * (1 - q**k) / (1 - q)
+
+        def valid(k: int) -> bool:
+            """Whether the k-th cycle still applies a and then b"""
+            if m_a * q ** (k - 1) * min(1.0, r) < tolerance:
+                return False
+            before_last = total(k - 1)
+            for i, n in a.lhs:
+                lowest = min(c[i], c[i] + before_last * v[i])
+                if i != limiting and lowest < n * m_a:
+                    return False
+            for i, n in b.lhs:
+                lowest = min(c[i], c[i] + before_last * v[i])
+                lowest += m_a * min(0.0, a.delta[i])
+                if i != p and lowest < n * r * m_a:
+                    return False
+            return True
+
+        if q < 1:
+            upper = 1 + int(math.log(tolerance / (m_a * min(1.0, r))) / math.log(q))
+        else:
+            decreasing = [c[i] / -(m_a * d) for i, d in enumerate(v) if d < 0]
+            if not decreasing:
+                return 0.0
+            upper = 1 + int(min(decreasing))
+
+        lower = 1
+        while lower < upper:
+            k = (lower + upper + 1) // 2
+            if valid(k):
+                lower = k
+            else:
+                upper = k - 1
+        if lower < 2 or not valid(lower):
+            return 0.0
+
+        t = total(lower)
+        for i in range(len(c)):
+            c[i] += t * v[i]
+            aggregated[i] += t * (a.produced[i] + r * b.produced[i])
+        return t
+
+
+# Compiled reaction sets by key, see CompiledReactions
+_COMPILED: weakref.WeakValueDictionary[str, CompiledReactions] = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _compiled(key: str, reactions: list[Reaction]) -> CompiledReactions:
+    if (compiled := _COMPILED.get(key)) is None:
+        compiled = CompiledReactions(reactions)
+    return compiled
+
+
+COMPILED_REACTIONS = CompiledReactions(REACTIONS)
+
+
+def to_vector(concentrations: dict[Molecule, float]) -> list[float]:
+    """Convert a concentration dict to a vector ordered by MOLECULES"""
+    return [float(concentrations.get(m, 0.0)) for m in MOLECULES]
+
+
+def to_dict(concentrations: list[float]) -> dict[Molecule, float]:
+    """Convert a vector ordered by MOLECULES to a concentration dict"""
+    return dict(zip(MOLECULES, concentrations))
+
+
 @dataclass
 class _Step:
     posterior: dict[Molecule, float]
     multiplier: float
-    reaction_index: Annotated[int, Field(serialization_alias="reactionIndex")]
+    reaction_index: int
+
 
+@dataclass(eq=False, slots=True)
+class Result:
+    """
+    Outcome of a single solve, with concentrations as vectors ordered by
+    MOLECULES. Step i applied reaction `reaction_indices[i]` of `reactions`
+    with `multipliers[i]`, giving the concentrations `posteriors[i]`.
+
+    Only the reactions and multipliers of the steps are kept, and posteriors
+    are replayed from the initial concentrations when accessed, unless the
+    solver `recorded` them because replaying would not give them back. The
+    concentration dicts and `steps` are also built when accessed, and
+    `content` is the JSON form sent by the API.
+    """
 
-class Result(BaseModel):
-    initial: dict[Molecule, float]
-    final: dict[Molecule, float]
-    aggregated: dict[Molecule, float]
-    steps: list[_Step]
+    initial_vector: npt.NDArray[np.float64]
+    final_vector: npt.NDArray[np.float64]
+    aggregated_vector: npt.NDArray[np.float64]
+    reaction_indices: npt.NDArray[np.int64]
+    multipliers: npt.NDArray[np.float64]
+    reactions: CompiledReactions
+    status: SolverStatus = SolverStatus.CONVERGED
+    recorded: npt.NDArray[np.float64] | None = None
 
+    @property
+    def posteriors(self) -> npt.NDArray[np.float64]:
+        """Concentrations after each step, of shape (len(steps), len(MOLECULES))"""
+        if self.recorded is not None:
+            return self.recorded
+        return self.reactions.replay(
+            self.initial_vector, self.reaction_indices, self.multipliers
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Result):
+            return NotImplemented
+        return self.status == other.status and all(
+            np.array_equal(getattr(self, name), getattr(other, name))
+            for name in (
+                "initial_vector",
+                "final_vector",
+                "aggregated_vector",
+                "reaction_indices",
+                "multipliers",
+                "posteriors",
+            )
+        )
 
-def run_model_sm1(initial_concentrations: dict[Molecule, float]) -> Result:
+    @property
+    def initial(self) -> dict[Molecule, float]:
+        return to_dict(self.initial_vector.tolist())
+
+    @property
+    def final(self) -> dict[Molecule, float]:
+        return to_dict(self.final_vector.tolist())
+
+    @property
+    def aggregated(self) -> dict[Molecule, float]:
+        return to_dict(self.aggregated_vector.tolist())
+
+    @property
+    def steps(self) -> list[_Step]:
+        return [
+            _Step(to_dict(posterior), multiplier, index)
+            for posterior, multiplier, index in zip(
+                self.posteriors.tolist(),
+                self.multipliers.tolist(),
+                self.reaction_indices.tolist(),
+            )
+        ]
+
+    def content(self, steps: bool = True) -> dict[str, Any]:
+        """
+        The result as plain JSON types, or only its concentrations if not
+        `steps`
+        """
+        content: dict[str, Any] = {
+            "initial": dict(zip(MOLECULE_NAMES, self.initial_vector.tolist())),
+            "final": dict(zip(MOLECULE_NAMES, self.final_vector.tolist())),
+            "aggregated": dict(zip(MOLECULE_NAMES, self.aggregated_vector.tolist())),
+        }
+        if steps:
+            content["steps"] = [
+                {
+                    "posterior": dict(zip(MOLECULE_NAMES, posterior)),
+                    "multiplier": multiplier,
+                    "reactionIndex": index,
+                }
+                for posterior, multiplier, index in zip(
+                    self.posteriors.tolist(),
+                    self.multipliers.tolist(),
+                    self.reaction_indices.tolist(),
+                )
+            ]
+            content["status"] = self.status.value
+        return content
+
+
+def run_model_sm1(
+    initial_concentrations: dict[Molecule, float],
+    tracer: Tracer | None = None,
+    reactions: CompiledReactions = COMPILED_REACTIONS,
+    limits: SolverLimits = DEFAULT_LIMITS,
+    mode: SolverMode = SolverMode.ITERATIVE,
+) -> Result:
     """
     Run reaction model as discussed with Sven Morten June 18.
     Updated with two more equations (5 and 6)
-    """
 
-    # Clone input
-    concentrations = defaultdict(lambda: 0, initial_concentrations)
-    aggregated_concentrations = defaultdict(lambda: 0, initial_concentrations)
+    Pass a `tracer` from tocomo.trace to observe every applied step. If the
+    solver stops at one of the `limits`, the result is partial and its status
+    says which. Event jumps cannot be replayed, so with SolverMode.EVENT_JUMP
+    the concentrations after every step are recorded.
+    """
 
-    steps: list[_Step] = []
-    while True:
-        for r in REACTIONS:
-            if r.active and (mult := r.do(concentrations, aggregated_concentrations)):
-                steps.append(_Step({**concentrations}, mult, r.index))
-                break
-        else:
-            break
+    initial = to_vector(initial_concentrations)
+    concentrations = initial.copy()
+    aggregated = initial.copy()
+    posteriors: list[list[float]] | None = [] if mode == SolverMode.EVENT_JUMP else None
+    steps, status = reactions.solve(
+        concentrations, aggregated, tracer, mode, limits, posteriors
+    )
 
     return Result(
-        initial=initial_concentrations,
-        final=concentrations,
-        aggregated=aggregated_concentrations,
-        steps=steps,
+        initial_vector=np.array(initial, dtype=np.float64),
+        final_vector=np.array(concentrations, dtype=np.float64),
+        aggregated_vector=np.array(aggregated, dtype=np.float64),
+        reaction_indices=np.array([r.index for r, _ in steps], dtype=np.int64),
+        multipliers=np.array([mult for _, mult in steps], dtype=np.float64),
+        reactions=reactions,
+        status=status,
+        recorded=(
+            None
+            if posteriors is None
+            else np.array(posteriors, dtype=np.float64).reshape(-1, len(MOLECULES))
+        ),
     )
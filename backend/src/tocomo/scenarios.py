@@ -0,0 +1,140 @@
+"""Many independent scenarios solved in one request, as a table."""
+
+from __future__ import annotations
+
+import io
+import math
+from collections.abc import Callable
+from typing import Annotated, Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from tocomo.batch import BatchResult
+from tocomo.corrosion_calc import corrosion_rates, surface_area
+from tocomo.reactions import MOLECULE_INDEX, MOLECULES, Molecule
+from tocomo.sweep import PIPE_INPUTS, SWEEP_CHUNK_SIZE, PipeInput
+
+M = Molecule
+
+# Upper bound on the number of scenarios in a single request
+MAX_SCENARIOS = 100_000
+
+# Media types of the tables that can be uploaded and returned besides JSON
+CSV = "text/csv"
+PARQUET = "application/vnd.apache.parquet"
+
+# Solves an (N, len(MOLECULES)) array of initial concentrations
+ScenarioSolver = Callable[[npt.NDArray[np.float64]], BatchResult]
+
+
+class ReactionBatch(BaseModel):
+    """
+    Scenarios by molecule and pipe input name. Molecules left out of a
+    scenario start at 0, and pipe inputs left out are taken from
+    `pipe_inputs`.
+    """
+
+    scenarios: Annotated[
+        list[dict[Molecule | PipeInput, float]],
+        Field(min_length=1, max_length=MAX_SCENARIOS),
+    ]
+    pipe_inputs: dict[PipeInput, float] = Field(
+        default_factory=dict, alias="pipeInputs"
+    )
+    reaction_set: str | None = Field(None, alias="reactionSet")
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame.from_records(self.scenarios)
+
+
+def read_table(content: bytes, media_type: str) -> pd.DataFrame:
+    """
+    Read scenarios from CSV or Parquet, with a column per molecule or pipe
+    input. Reading Parquet needs pyarrow, and raises ImportError without it.
+    """
+    if media_type == PARQUET:
+        return pd.read_parquet(io.BytesIO(content))
+    return pd.read_csv(io.BytesIO(content))
+
+
+def write_table(table: dict[str, npt.NDArray[Any]], media_type: str) -> bytes:
+    """The table as CSV or Parquet, see read_table"""
+    frame = pd.DataFrame(table)
+    if media_type == PARQUET:
+        return frame.to_parquet(index=False)
+    return frame.to_csv(index=False).encode()
+
+
+def solve_scenarios(
+    frame: pd.DataFrame,
+    solve: ScenarioSolver,
+    pipe_inputs: dict[PipeInput, float] | None = None,
+) -> dict[str, npt.NDArray[Any]]:
+    """
+    Solve every row of `frame`, see ReactionBatch, giving a column of
+    solver statuses, the final concentration and change of each molecule,
+    and the corrosion rates. Rates are NaN for scenarios lacking a pipe input.
+    Rows are passed to `solve` in chunks of SWEEP_CHUNK_SIZE, which should
+    share a single time budget.
+    """
+    names = {m.value: m for m in MOLECULES}
+    unknown = set(map(str, frame.columns)) - set(names) - set(PIPE_INPUTS)
+    if unknown:
+        raise ValueError(f"unknown columns {sorted(unknown)}")
+    if len(frame) > MAX_SCENARIOS:
+        raise ValueError(f"more than {MAX_SCENARIOS} scenarios")
+    try:
+        frame = frame.astype(np.float64)
+    except ValueError:
+        raise ValueError("every column must be numeric") from None
+
+    initial = np.zeros((len(frame), len(MOLECULES)), dtype=np.float64)
+    for column in frame.columns:
+        if (m := names.get(str(column))) is not None:
+            initial[:, MOLECULE_INDEX[m]] = frame[column].fillna(0.0).to_numpy()
+
+    final = np.empty_like(initial)
+    status = np.empty(len(frame), dtype=object)
+    for start in range(0, len(initial), SWEEP_CHUNK_SIZE):
+        result = solve(initial[start : start + SWEEP_CHUNK_SIZE])
+        final[start : start + len(result)] = result.final
+        status[start : start + len(result)] = [str(s) for s in result.status]
+
+    pipe = {
+        name: (
+            frame[name].fillna((pipe_inputs or {}).get(name, math.nan)).to_numpy()
+            if name in frame.columns
+            else np.full(len(frame), (pipe_inputs or {}).get(name, math.nan))
+        )
+        for name in PIPE_INPUTS
+    }
+    rates = corrosion_rates(
+        surface_area(pipe["inner_diameter"], pipe["drop_out_length"]),
+        pipe["flowrate"],
+        final[:, MOLECULE_INDEX[M.H2SO4]],
+        final[:, MOLECULE_INDEX[M.HNO3]],
+    )
+    return {
+        "status": status,
+        **{f"final_{m.value}": final[:, MOLECULE_INDEX[m]] for m in MOLECULES},
+        **{
+            f"change_{m.value}": final[:, MOLECULE_INDEX[m]]
+            - initial[:, MOLECULE_INDEX[m]]
+            for m in MOLECULES
+        },
+        **{name: np.asarray(value, dtype=np.float64) for name, value in rates.items()},
+    }
+
+
+def table_content(table: dict[str, npt.NDArray[Any]]) -> dict[str, list[Any]]:
+    """The table's columns as lists, with None for NaN which JSON lacks"""
+    return {
+        name: [
+            None if isinstance(v, float) and math.isnan(v) else v
+            for v in values.tolist()
+        ]
+        for name, values in table.items()
+    }
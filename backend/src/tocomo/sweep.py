@@ -0,0 +1,211 @@
+"""Sweeps over any number of molecules and pipe inputs at once."""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Callable
+from dataclasses import dataclass
+from enum import StrEnum, auto
+from typing import Annotated, Literal, Self
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel, Field, model_validator
+
+from tocomo.corrosion_calc import Value, corrosion_rates, surface_area
+from tocomo.matrix import AxisRange
+from tocomo.reactions import MOLECULE_INDEX, MOLECULES, Molecule
+
+M = Molecule
+
+# Upper bound on the number of points in a single sweep
+MAX_SWEEP_POINTS = 100_000
+
+# Number of points handed to the solver at a time
+SWEEP_CHUNK_SIZE = 4096
+
+PipeInput = Literal["inner_diameter", "drop_out_length", "flowrate"]
+CorrosionValue = Literal["H2SO4_corrosion", "HNO3_corrosion", "corrosion_rate"]
+
+PIPE_INPUTS: tuple[PipeInput, ...] = ("inner_diameter", "drop_out_length", "flowrate")
+
+# Final concentrations, ordered by MOLECULES, for each row of an
+# (N, len(MOLECULES)) array of initial concentrations
+FinalSolver = Callable[[npt.NDArray[np.float64]], npt.NDArray[np.float64]]
+
+
+class Sampling(StrEnum):
+    # Every combination of the points along each axis
+    GRID = auto()
+    # `samples` points spread over the ranges by Latin hypercube sampling
+    LATIN_HYPERCUBE = auto()
+
+
+class SweepAxis(AxisRange):
+    """
+    A molecule concentration or pipe input to vary. Latin hypercube sampling
+    only uses `min` and `max`.
+    """
+
+    name: Molecule | PipeInput
+
+
+class Sweep(BaseModel):
+    axes: Annotated[list[SweepAxis], Field(min_length=1)]
+    outputs: Annotated[list[Molecule | CorrosionValue], Field(min_length=1)]
+    inputs: dict[Molecule, float] = Field(default_factory=dict)
+    pipe_inputs: dict[PipeInput, float] = Field(
+        default_factory=dict, alias="pipeInputs"
+    )
+    sampling: Sampling = Sampling.GRID
+    samples: Annotated[int, Field(ge=1, le=MAX_SWEEP_POINTS)] = 100
+    seed: int | None = None
+    reaction_set: str | None = Field(None, alias="reactionSet")
+
+    @model_validator(mode="after")
+    def check_axes(self) -> Self:
+        names = [axis.name for axis in self.axes]
+        if len(set(names)) != len(names):
+            raise ValueError("each axis must be swept at most once")
+        if len(self) > MAX_SWEEP_POINTS:
+            raise ValueError(f"sweep has more than {MAX_SWEEP_POINTS} points")
+        if any(not isinstance(output, Molecule) for output in self.outputs):
+            missing = set(PIPE_INPUTS) - set(self.pipe_inputs) - set(names)
+            if missing:
+                raise ValueError(
+                    f"corrosion outputs need pipe inputs {sorted(missing)}"
+                )
+        return self
+
+    def __len__(self) -> int:
+        if self.sampling == Sampling.LATIN_HYPERCUBE:
+            return self.samples
+        return math.prod(len(axis) for axis in self.axes)
+
+    def solved_points(self) -> int:
+        """Number of points passed to the solver, see compute_sweep"""
+        if self.sampling == Sampling.LATIN_HYPERCUBE:
+            return self.samples
+        return math.prod(
+            len(axis) for axis in self.axes if isinstance(axis.name, Molecule)
+        )
+
+
+@dataclass
+class SweepResult:
+    """
+    For grid sampling, `axes` holds the points along each axis and every
+    output has one dimension per axis. For Latin hypercube sampling, `axes`
+    holds the coordinates of each sample and outputs are one-dimensional.
+    """
+
+    sampling: Sampling
+    axes: dict[str, npt.NDArray[np.float64]]
+    outputs: dict[str, npt.NDArray[np.float64]]
+
+
+def latin_hypercube(
+    dimensions: int, samples: int, rng: np.random.Generator
+) -> npt.NDArray[np.float64]:
+    """
+    An array of shape (samples, dimensions) in [0, 1), with exactly one sample
+    in each of `samples` equal intervals along every dimension
+    """
+    strata = np.argsort(rng.random((dimensions, samples)), axis=1).T
+    return (strata + rng.random((samples, dimensions))) / samples
+
+
+def compute_sweep(data: Sweep, solve: FinalSolver) -> SweepResult:
+    """
+    Evaluate the sweep described by `data`, solving points with `solve` in
+    chunks of SWEEP_CHUNK_SIZE, which should share a single time budget
+    """
+    base = np.zeros(len(MOLECULES), dtype=np.float64)
+    for m, v in data.inputs.items():
+        base[MOLECULE_INDEX[m]] = v
+
+    if data.sampling == Sampling.LATIN_HYPERCUBE:
+        unit = latin_hypercube(
+            len(data.axes), data.samples, np.random.default_rng(data.seed)
+        )
+        coordinates = {
+            str(axis.name): axis.min + unit[:, i] * (axis.max - axis.min)
+            for i, axis in enumerate(data.axes)
+        }
+        initial = np.repeat(base[None, :], data.samples, axis=0)
+        for axis in data.axes:
+            if isinstance(axis.name, Molecule):
+                initial[:, MOLECULE_INDEX[axis.name]] = coordinates[axis.name]
+        final = _solve(solve, initial)
+        pipe: dict[PipeInput, Value] = {
+            name: coordinates.get(name, data.pipe_inputs.get(name, math.nan))
+            for name in PIPE_INPUTS
+        }
+        return SweepResult(
+            sampling=data.sampling,
+            axes=coordinates,
+            outputs=_outputs(data, final, pipe, (data.samples,)),
+        )
+
+    # Pipe inputs do not affect the reactions, so only the molecule axes are
+    # solved and the final concentrations are broadcast along the pipe axes
+    points = {str(axis.name): axis.values() for axis in data.axes}
+    shape = tuple(len(values) for values in points.values())
+    molecules = [a.name for a in data.axes if isinstance(a.name, Molecule)]
+    grids = np.meshgrid(*(points[m] for m in molecules), indexing="ij")
+    initial = np.repeat(base[None, :], grids[0].size if grids else 1, axis=0)
+    for m, grid in zip(molecules, grids):
+        initial[:, MOLECULE_INDEX[m]] = grid.ravel()
+
+    final = _solve(solve, initial).reshape(
+        *(n if isinstance(a.name, Molecule) else 1 for a, n in zip(data.axes, shape)),
+        len(MOLECULES),
+    )
+    pipe = {}
+    for name in PIPE_INPUTS:
+        if name in points:
+            position = list(points).index(name)
+            pipe[name] = points[name].reshape(
+                [-1 if i == position else 1 for i in range(len(shape))]
+            )
+        else:
+            pipe[name] = np.float64(data.pipe_inputs.get(name, math.nan))
+    return SweepResult(
+        sampling=data.sampling,
+        axes=points,
+        outputs=_outputs(data, final, pipe, shape),
+    )
+
+
+def _solve(
+    solve: FinalSolver, initial: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    chunks = [
+        solve(initial[start : start + SWEEP_CHUNK_SIZE])
+        for start in range(0, len(initial), SWEEP_CHUNK_SIZE)
+    ]
+    return np.concatenate(chunks)
+
+
+def _outputs(
+    data: Sweep,
+    final: npt.NDArray[np.float64],
+    pipe: dict[PipeInput, Value],
+    shape: tuple[int, ...],
+) -> dict[str, npt.NDArray[np.float64]]:
+    rates = None
+    outputs = {}
+    for output in data.outputs:
+        if isinstance(output, Molecule):
+            value = final[..., MOLECULE_INDEX[output]]
+        else:
+            if rates is None:
+                rates = corrosion_rates(
+                    surface_area(pipe["inner_diameter"], pipe["drop_out_length"]),
+                    pipe["flowrate"],
+                    final[..., MOLECULE_INDEX[M.H2SO4]],
+                    final[..., MOLECULE_INDEX[M.HNO3]],
+                )
+            value = np.asarray(rates[output], dtype=np.float64)
+        outputs[str(output)] = np.broadcast_to(value, shape)
+    return outputs
@@ -0,0 +1,73 @@
+"""Opt-in tracing of the individual reaction steps taken by the solvers."""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Protocol
+
+if TYPE_CHECKING:
+    from tocomo.reactions import Molecule, Reaction
+
+
+logger = logging.getLogger(__name__)
+
+
+class Tracer(Protocol):
+    def step(
+        self,
+        reaction: Reaction,
+        multiplier: float,
+        concentrations: Mapping[Molecule, float],
+    ) -> None:
+        """Called after `reaction` has been applied with `multiplier`"""
+
+
+class LoggingTracer:
+    """Emit every step as a DEBUG record on the `tocomo.trace` logger"""
+
+    def __init__(self, logger: logging.Logger = logger) -> None:
+        self.logger = logger
+
+    def step(
+        self,
+        reaction: Reaction,
+        multiplier: float,
+        concentrations: Mapping[Molecule, float],
+    ) -> None:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self.logger.debug(
+            "applied eq %d * %.3f : %s",
+            reaction.index,
+            multiplier,
+            reaction,
+            extra={
+                "reaction_index": reaction.index,
+                "multiplier": multiplier,
+                "concentrations": {str(m): c for m, c in concentrations.items()},
+            },
+        )
+
+
+@dataclass
+class TraceEntry:
+    reaction_index: int
+    multiplier: float
+    concentrations: dict[Molecule, float]
+
+
+@dataclass
+class CollectingTracer:
+    """Keep every step in memory, mostly useful for tests and debugging"""
+
+    entries: list[TraceEntry] = field(default_factory=list)
+
+    def step(
+        self,
+        reaction: Reaction,
+        multiplier: float,
+        concentrations: Mapping[Molecule, float],
+    ) -> None:
+        self.entries.append(TraceEntry(reaction.index, multiplier, {**concentrations}))
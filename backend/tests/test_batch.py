@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+import pytest
+
+from tocomo.batch import run_model_sm1_batch, to_array
+from tocomo.reactions import (
+    MOLECULES,
+    M,
+    SolverLimits,
+    SolverStatus,
+    run_model_sm1,
+)
+
+
+def random_scenarios(count, seed=0):
+    rng = np.random.default_rng(seed)
+    scenarios = []
+    for _ in range(count):
+        scenarios.append(
+            {
+                M.H2O: rng.uniform(0, 40),
+                M.O2: rng.uniform(0, 40),
+                M.SO2: rng.uniform(0, 20),
+                M.NO2: rng.uniform(0, 30),
+                M.H2S: rng.choice([0.0, rng.uniform(0, 10)]),
+                M.NO: rng.choice([0.0, rng.uniform(0, 5)]),
+            }
+        )
+    return scenarios
+
+
+def test_batch_matches_scalar_solver():
+    scenarios = random_scenarios(50)
+    batch = run_model_sm1_batch(to_array(scenarios))
+
+    assert len(batch) == len(scenarios)
+    for row, initial in enumerate(scenarios):
+        expected = run_model_sm1(initial)
+        actual = batch.result(row)
+        for m in MOLECULES:
+            assert actual.final[m] == expected.final.get(m, 0)
+            assert actual.aggregated[m] == expected.aggregated.get(m, 0)
+        assert [s.reaction_index for s in actual.steps] == [
+            s.reaction_index for s in expected.steps
+        ]
+        assert [s.multiplier for s in actual.steps] == [
+            s.multiplier for s in expected.steps
+        ]
+
+
+def test_batch_settled_rows_are_untouched():
+    batch = run_model_sm1_batch(to_array([{M.H2O: 1.0}, {M.NO: 4.0, M.O2: 2.0}]))
+    assert batch.result(0).steps == []
+    assert batch.result(0).final[M.H2O] == 1.0
+    assert [s.reaction_index for s in batch.result(1).steps] == [2]
+
+
+def test_batch_empty():
+    batch = run_model_sm1_batch(np.empty((0, len(MOLECULES))))
+    assert len(batch) == 0
+    assert batch.final.shape == (0, len(MOLECULES))
+
+
+def test_batch_rejects_wrong_shape():
+    with pytest.raises(ValueError):
+        run_model_sm1_batch(np.zeros((3, 2)))
+
+
+def test_batch_limits_match_scalar_solver():
+    scenarios = [{M.H2O: 1.0}, {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1}]
+    for limits in [SolverLimits(max_steps=10), SolverLimits(tolerance=0.01)]:
+        batch = run_model_sm1_batch(to_array(scenarios), limits=limits)
+        for row, initial in enumerate(scenarios):
+            expected = run_model_sm1(initial, limits=limits)
+            actual = batch.result(row)
+            assert actual.status == expected.status
+            assert [s.multiplier for s in actual.steps] == [
+                s.multiplier for s in expected.steps
+            ]
+    assert batch.status == [SolverStatus.CONVERGED, SolverStatus.CONVERGED]
+
+
+def test_batch_time_budget():
+    scenarios = [{M.H2O: 1.0}, {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1}]
+    batch = run_model_sm1_batch(
+        to_array(scenarios), limits=SolverLimits(time_budget=1e-9)
+    )
+    assert batch.status == [SolverStatus.CONVERGED, SolverStatus.TIME_BUDGET]
+
+    # A given deadline takes the place of the budget
+    batch = run_model_sm1_batch(
+        to_array(scenarios),
+        limits=SolverLimits(time_budget=3600),
+        deadline=time.monotonic(),
+    )
+    assert batch.status == [SolverStatus.CONVERGED, SolverStatus.TIME_BUDGET]
@@ -0,0 +1,99 @@
+import numpy as np
+
+from tocomo.batch import to_array
+from tocomo.cache import ResultCache
+from tocomo.reactions import (
+    M,
+    REACTIONS,
+    CompiledReactions,
+    SolverLimits,
+    run_model_sm1,
+)
+
+DEFAULTS = {M.H2O: 30.0, M.O2: 30.0, M.SO2: 10.0, M.NO2: 20.0, M.H2S: 0.0}
+
+
+def test_cache_hit_returns_same_result():
+    cache = ResultCache()
+    first = cache.run_model_sm1(DEFAULTS)
+    second = cache.run_model_sm1({**DEFAULTS})
+    assert first is second
+    assert first.final == run_model_sm1(DEFAULTS).final
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_quantizes_inputs():
+    cache = ResultCache(decimals=3)
+    first = cache.run_model_sm1({**DEFAULTS, M.O2: 30.0001})
+    second = cache.run_model_sm1({**DEFAULTS, M.O2: 29.9999})
+    assert first is second
+    assert first.initial[M.O2] == 30.0
+
+
+def test_cache_keyed_on_reaction_set():
+    cache = ResultCache()
+    without_eq1 = CompiledReactions([r for r in REACTIONS if r.index != 1])
+    first = cache.run_model_sm1(DEFAULTS)
+    second = cache.run_model_sm1(DEFAULTS, reactions=without_eq1)
+    assert first is not second
+    assert first.final[M.H2SO4] > 0
+    assert second.final[M.H2SO4] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResultCache(maxsize=2)
+    a = cache.run_model_sm1({M.NO: 1.0, M.O2: 1.0})
+    cache.run_model_sm1({M.NO: 2.0, M.O2: 1.0})
+    cache.run_model_sm1({M.NO: 1.0, M.O2: 1.0})
+    cache.run_model_sm1({M.NO: 3.0, M.O2: 1.0})
+    assert len(cache) == 2
+    assert cache.run_model_sm1({M.NO: 1.0, M.O2: 1.0}) is a
+    assert cache.stats().hits == 2
+
+
+def test_cache_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("tocomo.cache.time.monotonic", lambda: now)
+    cache = ResultCache(ttl=10)
+    first = cache.run_model_sm1(DEFAULTS)
+    now += 11
+    assert cache.run_model_sm1(DEFAULTS) is not first
+    assert cache.misses == 2
+
+
+def test_cache_disabled():
+    cache = ResultCache(maxsize=0)
+    cache.run_model_sm1(DEFAULTS)
+    cache.run_model_sm1(DEFAULTS)
+    assert len(cache) == 0
+    assert cache.misses == 2
+
+
+def test_cache_keys_on_limits_and_skips_time_budget():
+    cache = ResultCache()
+    full = cache.run_model_sm1(DEFAULTS)
+    partial = cache.run_model_sm1(DEFAULTS, limits=SolverLimits(max_steps=1))
+    assert len(partial.steps) == 1 < len(full.steps)
+    assert len(cache) == 2
+    cache.run_model_sm1(DEFAULTS, limits=SolverLimits(time_budget=1e-9))
+    assert len(cache) == 2
+
+
+def test_cache_batch_only_solves_misses():
+    cache = ResultCache()
+    rows = [{**DEFAULTS, M.NO2: float(x)} for x in range(1, 5)]
+    cached = cache.run_model_sm1(rows[1])
+    results = cache.run_model_sm1_batch(to_array(rows))
+    assert results[1] is cached
+    assert (cache.hits, cache.misses) == (1, 4)
+    for row, result in zip(rows, results):
+        assert result.final == run_model_sm1(row).final
+
+
+def test_cache_from_env(monkeypatch):
+    monkeypatch.setenv("TOCOMO_CACHE_SIZE", "10")
+    monkeypatch.setenv("TOCOMO_CACHE_TTL", "60")
+    monkeypatch.setenv("TOCOMO_CACHE_DECIMALS", "2")
+    cache = ResultCache.from_env()
+    assert (cache.maxsize, cache.ttl, cache.decimals) == (10, 60.0, 2)
+    assert np.array_equal(cache.quantize([1.234]), [1.23])
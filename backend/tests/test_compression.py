@@ -0,0 +1,99 @@
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from tocomo.compression import (
+    CODECS,
+    CompressionMiddleware,
+    CompressionSettings,
+)
+from tocomo.scenarios import PARQUET
+
+LARGE = [{"h2so4": i / 7, "status": "converged"} for i in range(200)]
+
+
+def client(settings):
+    app = FastAPI()
+
+    @app.get("/large")
+    async def large(request: Request, response: Response):
+        if request.headers.get("if-none-match") == 'W/"tag"':
+            return Response(status_code=304, headers={"ETag": '"tag"'})
+        response.headers["ETag"] = '"tag"'
+        return LARGE
+
+    @app.get("/small")
+    async def small():
+        return {"h2so4": 1.0}
+
+    @app.get("/parquet")
+    async def parquet():
+        return Response(b"PAR1" * 1000, media_type=PARQUET)
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"x" * 2000, b"y" * 2000]))
+
+    app.add_middleware(CompressionMiddleware, settings=settings)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("coding", list(CODECS))
+def test_compresses_large_responses(coding):
+    test_client = client(CompressionSettings({coding: CODECS[coding].default_level}))
+    response = test_client.get("/large", headers={"Accept-Encoding": coding})
+    assert response.headers["content-encoding"] == coding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"tag"'
+    assert int(response.headers["content-length"]) < len(response.content) / 4
+    assert response.json() == LARGE
+
+    response = test_client.get(
+        "/large",
+        headers={"Accept-Encoding": coding, "If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == 'W/"tag"'
+
+    codec = CODECS[coding]
+    assert codec.decompress(codec.compress(response.content, 1)) == response.content
+
+
+@pytest.mark.parametrize("path", ["/small", "/parquet", "/stream"])
+def test_passes_other_responses_on(path):
+    test_client = client(CompressionSettings({"gzip": 6}))
+    response = test_client.get(path, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_passes_responses_on_without_accepted_coding():
+    test_client = client(CompressionSettings({"gzip": 6}))
+    response = test_client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"tag"'
+
+
+def test_negotiate():
+    settings = CompressionSettings({"zstd": 3, "br": 4, "gzip": 6})
+    assert settings.negotiate("gzip, deflate, br, zstd") == "zstd"
+    assert settings.negotiate("gzip;q=1.0, br;q=0.8") == "gzip"
+    assert settings.negotiate("br;q=0.5, *;q=0.1") == "br"
+    assert settings.negotiate("*") == "zstd"
+    assert settings.negotiate("zstd;q=0, *") == "br"
+    assert settings.negotiate("deflate") is None
+    assert settings.negotiate("") is None
+    assert CompressionSettings().negotiate("gzip") is None
+
+
+def test_compression_settings_from_env(monkeypatch):
+    assert CompressionSettings.from_env() == CompressionSettings()
+
+    monkeypatch.setenv("TOCOMO_COMPRESSION", " gzip:9")
+    monkeypatch.setenv("TOCOMO_COMPRESSION_MIN_SIZE", "100")
+    assert CompressionSettings.from_env() == CompressionSettings({"gzip": 9}, 100)
+
+    monkeypatch.setenv("TOCOMO_COMPRESSION", "gzip:9,deflate")
+    with pytest.raises(ValueError, match="deflate"):
+        CompressionSettings.from_env()
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from tocomo.encoding import MEDIA_TYPE, accepts, decode, encode
+
+
+def test_round_trip():
+    arrays = {
+        "x": np.linspace(0.5, 10, 20),
+        "z": np.arange(15, dtype=np.float64).reshape(5, 3),
+        "computed": np.array([[True, False, True]]),
+        "final": np.full((2, 2, 3), np.nan),
+    }
+    data = encode(arrays, {"molecules": ["h2o", "o2"]})
+    assert len(data) % 8 == 0
+
+    decoded, metadata = decode(data)
+    assert metadata == {"molecules": ["h2o", "o2"]}
+    assert list(decoded) == list(arrays)
+    for name, array in arrays.items():
+        assert decoded[name].dtype == array.dtype
+        np.testing.assert_array_equal(decoded[name], array)
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode(b"\0" * 16)
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, False),
+        ("application/json", False),
+        ("*/*", False),
+        (MEDIA_TYPE, True),
+        (f"application/json;q=0.5, {MEDIA_TYPE};q=1", True),
+    ],
+)
+def test_accepts(accept, expected):
+    assert accepts(accept) is expected
@@ -1,7 +1,17 @@
+import json
+import time
+
+import numpy as np
+import pytest
 from fastapi.testclient import TestClient
 
+from tocomo import app as app_module
+from tocomo import encoding, scenarios, sweep
 from tocomo.app import app, Concentrations
-from tocomo.reactions import Molecule
+from tocomo.batch import run_model_sm1_batch
+from tocomo.lookup import LookupTable, precompute
+from tocomo.matrix import AxisRange
+from tocomo.reactions import Molecule, SolverLimits
 
 
 def test_all_molecule_should_be_in_concentrations():
@@ -67,4 +77,699 @@ def test_run_matrix():
     assert response.status_code == 200
     assert "plot" in response.json()
     assert "layout" in response.json()
-    assert "resultData" in response.json()
+    assert "resultData" not in response.json()
+
+
+@pytest.mark.parametrize("detail", ["final", "steps"])
+def test_run_matrix_detail(detail):
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "detail": detail,
+    }
+
+    response = test_client.post("/api/run_matrix", json=input_data)
+    assert response.status_code == 200
+    cell = response.json()["resultData"][5][7]
+    assert cell["initial"]["no2"] == response.json()["plot"]["y"][5]
+    assert cell["initial"]["o2"] == response.json()["plot"]["x"][7]
+    assert cell["final"]["h2so4"] == response.json()["plot"]["z"][5][7]
+    assert ("steps" in cell) == (detail == "steps")
+
+
+def test_run_matrix_cell():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+    }
+    matrix = test_client.post(
+        "/api/run_matrix", json={**input_data, "detail": "steps"}
+    ).json()
+
+    response = test_client.post(
+        "/api/run_matrix/cell", json={**input_data, "rowIndex": 5, "columnIndex": 7}
+    )
+    assert response.status_code == 200
+    assert response.json() == matrix["resultData"][5][7]
+    assert response.json()["steps"][0]["reactionIndex"] == 1
+
+    response = test_client.post(
+        "/api/run_matrix/cell", json={**input_data, "rowIndex": 20, "columnIndex": 0}
+    )
+    assert response.status_code == 422
+
+
+def test_form_config_not_modified():
+    test_client = TestClient(app)
+    response = test_client.get("/api/form_config")
+    assert response.status_code == 200
+    assert response.json()["pipeInputs"][0]["name"] == "inner_diameter"
+    assert response.headers["cache-control"] == "public, no-cache"
+
+    tag = response.headers["etag"]
+    response = test_client.get("/api/form_config", headers={"If-None-Match": tag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == tag
+
+
+def test_run_matrix_not_modified(monkeypatch):
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+    }
+    response = test_client.post("/api/run_matrix", json=input_data)
+    tag = response.headers["etag"]
+    assert response.headers["vary"] == "Accept"
+
+    response = test_client.post(
+        "/api/run_matrix", json=input_data, headers={"If-None-Match": f'"x", {tag}'}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # Other representations and requests have other tags
+    response = test_client.post(
+        "/api/run_matrix",
+        json=input_data,
+        headers={"If-None-Match": tag, "Accept": encoding.MEDIA_TYPE},
+    )
+    assert response.status_code == 200
+    response = test_client.post(
+        "/api/run_matrix",
+        json={**input_data, "valueValue": "hno3"},
+        headers={"If-None-Match": tag},
+    )
+    assert response.status_code == 200
+
+    # Partial results depend on the machine's load
+    monkeypatch.setattr(
+        app_module, "SOLVER_LIMITS", SolverLimits(time_budget=float("-inf"))
+    )
+    response = test_client.post("/api/run_matrix", json=input_data)
+    assert "etag" not in response.headers
+    assert response.headers["cache-control"] == "no-store"
+
+
+def test_solver_get_variants():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+    }
+    cell_data = {**input_data, "rowIndex": 5, "columnIndex": 7}
+    concentrations = input_data["inputs"]
+    for path, body in [
+        ("/api/run_reaction", concentrations),
+        ("/api/run_matrix", input_data),
+        ("/api/run_matrix/stream", input_data),
+        ("/api/run_matrix/cell", cell_data),
+    ]:
+        posted = test_client.post(path, json=body)
+        response = test_client.get(path, params={"data": json.dumps(body)})
+        assert response.status_code == 200
+        assert response.content == posted.content
+        assert response.headers["etag"] == posted.headers["etag"]
+        assert response.headers["cache-control"] == "public, no-cache"
+        assert posted.headers["cache-control"] == "private, no-cache"
+
+        response = test_client.get(
+            path,
+            params={"data": json.dumps(body)},
+            headers={"If-None-Match": response.headers["etag"]},
+        )
+        assert response.status_code == 304
+        assert response.headers["cache-control"] == "public, no-cache"
+
+    response = test_client.get("/api/run_matrix", params={"data": "{"})
+    assert response.status_code == 422
+    response = test_client.get(
+        "/api/run_matrix/cell",
+        params={"data": json.dumps({**cell_data, "rowIndex": 20})},
+    )
+    assert response.status_code == 422
+    response = test_client.get(
+        "/api/run_reaction",
+        params={"data": json.dumps(concentrations), "reactionSet": "missing"},
+    )
+    assert response.status_code == 404
+
+
+def test_run_matrix_partial(monkeypatch):
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "rowRange": {"min": 0, "max": 2, "count": 3},
+        "columnRange": {"min": 0, "max": 2, "count": 3},
+    }
+    data = test_client.post("/api/run_matrix", json=input_data).json()
+    assert "partial" not in data
+
+    # Cells without NO2 or O2 converge within a step, the others do not
+    monkeypatch.setattr(app_module, "SOLVER_LIMITS", SolverLimits(max_steps=1))
+    cells = [[row, column] for row in (1, 2) for column in (1, 2)]
+    data = test_client.post("/api/run_matrix", json=input_data).json()
+    assert data["partial"] == cells
+
+    response = test_client.post(
+        "/api/run_matrix", json=input_data, headers={"Accept": encoding.MEDIA_TYPE}
+    )
+    arrays, _ = encoding.decode(response.content)
+    assert np.argwhere(arrays["partial"]).tolist() == cells
+
+    response = test_client.post("/api/run_matrix/stream", json=input_data)
+    _, *rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row.get("partial") for row in rows] == [None, [1, 2], [1, 2]]
+
+
+def test_cache_stats():
+    test_client = TestClient(app)
+    response = test_client.get("/api/cache_stats")
+    assert response.status_code == 200
+    assert set(response.json()) == {"hits", "misses", "size", "maxsize", "ttl"}
+
+
+def test_run_matrix_ranges_and_refinement():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "pipeInputs": {"inner_diameter": 30, "drop_out_length": 1000, "flowrate": 20},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "rowRange": {"min": 1, "max": 20, "count": 40},
+        "columnRange": {"min": 1, "max": 20, "step": 1},
+        "refine": {"levels": 3, "threshold": 0.1},
+        "detail": "final",
+    }
+
+    response = test_client.post("/api/run_matrix", json=input_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["plot"]["y"]) == 40
+    assert len(data["plot"]["x"]) == 20
+    assert len(data["computed"]) == 40
+    assert data["resultData"][0][0] is not None
+
+
+def test_run_matrix_invalid_range():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "rowRange": {"min": 10, "max": 1},
+    }
+    response = test_client.post("/api/run_matrix", json=input_data)
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "path", ["/api/run_matrix", "/api/run_matrix/stream", "/api/run_matrix/incremental"]
+)
+def test_run_matrix_too_many_cells(path):
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "rowRange": {"min": 1, "max": 2, "count": 1000},
+        "columnRange": {"min": 1, "max": 2, "count": 101},
+    }
+    response = test_client.post(path, json=input_data)
+    assert response.status_code == 422
+    assert "/api/jobs/run_matrix" in response.json()["detail"]
+
+    input_data["columnRange"]["count"] = 11
+    input_data["detail"] = "steps"
+    response = test_client.post(path, json=input_data)
+    assert response.status_code == 422
+    assert "steps" in response.json()["detail"]
+
+
+def test_run_matrix_binary():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "detail": "final",
+    }
+    expected = test_client.post("/api/run_matrix", json=input_data).json()
+
+    response = test_client.post(
+        "/api/run_matrix",
+        json=input_data,
+        headers={"Accept": encoding.MEDIA_TYPE},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == encoding.MEDIA_TYPE
+    assert response.headers["vary"] == "Accept"
+
+    arrays, metadata = encoding.decode(response.content)
+    assert arrays["z"].tolist() == expected["plot"]["z"]
+    assert arrays["x"].tolist() == expected["plot"]["x"]
+    h2so4 = metadata["molecules"].index("h2so4")
+    assert (
+        arrays["final"][0, 0, h2so4] == expected["resultData"][0][0]["final"]["h2so4"]
+    )
+
+
+def test_sweep():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "pipeInputs": {"inner_diameter": 30, "drop_out_length": 1000},
+        "axes": [
+            {"name": "no2", "min": 1, "max": 5, "count": 3},
+            {"name": "flowrate", "min": 10, "max": 20, "count": 2},
+        ],
+        "outputs": ["h2so4", "corrosion_rate"],
+    }
+    response = test_client.post("/api/sweep", json=input_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["sampling"] == "grid"
+    assert data["axes"]["flowrate"] == [10, 20]
+    assert np.shape(data["outputs"]["corrosion_rate"]) == (3, 2)
+
+    response = test_client.post(
+        "/api/sweep", json=input_data, headers={"Accept": encoding.MEDIA_TYPE}
+    )
+    arrays, metadata = encoding.decode(response.content)
+    assert metadata == {"sampling": "grid"}
+    assert arrays["outputs/h2so4"].tolist() == data["outputs"]["h2so4"]
+
+
+def test_run_reaction_batch():
+    test_client = TestClient(app)
+    input_data = {
+        "scenarios": [{"h2o": 1, "o2": 2, "so2": 3, "no2": 4}, {"h2o": 30, "no2": 20}],
+        "pipeInputs": {"inner_diameter": 30, "drop_out_length": 1000, "flowrate": 20},
+    }
+    response = test_client.post("/api/run_reaction/batch", json=input_data)
+    assert response.status_code == 200
+    table = response.json()
+    single = test_client.post("/api/run_reaction", json=input_data["scenarios"][0])
+    assert table["final_hno3"][0] == single.json()["final"]["hno3"]
+    assert table["status"] == ["converged", "converged"]
+    assert len(table["corrosion_rate"]) == 2
+
+    response = test_client.post(
+        "/api/run_reaction/batch", json=input_data, headers={"Accept": "text/csv"}
+    )
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines()[0].startswith("status,final_h2so4,")
+
+    response = test_client.post(
+        "/api/run_reaction/batch/upload",
+        files={"file": ("cases.csv", b"h2o,o2,so2,no2\n1,2,3,4\n", "text/csv")},
+    )
+    assert response.json()["final_hno3"] == table["final_hno3"][:1]
+    assert response.json()["corrosion_rate"] == [None]
+
+    response = test_client.post(
+        "/api/run_reaction/batch/upload",
+        files={"file": ("cases.csv", b"h2o,co2\n1,2\n", "text/csv")},
+    )
+    assert response.status_code == 422
+
+
+def test_chunks_share_time_budget(monkeypatch):
+    deadlines = []
+    solve_batch = app_module.SOLVE_BATCH
+
+    def record(initial, reactions, tracer, limits, deadline):
+        deadlines.append(deadline)
+        return solve_batch(initial, reactions, tracer, limits, deadline)
+
+    monkeypatch.setattr(app_module, "SOLVE_BATCH", record)
+    monkeypatch.setattr(app_module, "SOLVER_LIMITS", SolverLimits(time_budget=60))
+    monkeypatch.setattr(scenarios, "SWEEP_CHUNK_SIZE", 1)
+    monkeypatch.setattr(sweep, "SWEEP_CHUNK_SIZE", 1)
+    test_client = TestClient(app)
+
+    input_data = {"scenarios": [{"h2o": 1, "no2": 4}, {"h2o": 30, "no2": 20}]}
+    response = test_client.post("/api/run_reaction/batch", json=input_data)
+    assert response.status_code == 200
+    assert len(deadlines) == 2
+    assert deadlines[0] is not None and deadlines[0] == deadlines[1]
+
+    deadlines.clear()
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30},
+        "axes": [{"name": "no2", "min": 1, "max": 5, "count": 3}],
+        "outputs": ["h2so4"],
+    }
+    response = test_client.post("/api/sweep", json=input_data)
+    assert response.status_code == 200
+    assert len(deadlines) == 3
+    assert deadlines[0] is not None and len(set(deadlines)) == 1
+
+
+def test_run_matrix_stream():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "detail": "final",
+    }
+    expected = test_client.post("/api/run_matrix", json=input_data).json()
+
+    response = test_client.post("/api/run_matrix/stream", json=input_data)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["x-accel-buffering"] == "no"
+    grid, *rows = [json.loads(line) for line in response.text.splitlines()]
+    assert grid["type"] == "grid"
+    assert grid["x"] == expected["plot"]["x"]
+    assert [row["row"] for row in rows] == list(range(len(grid["y"])))
+    assert [row["z"] for row in rows] == expected["plot"]["z"]
+    assert [row["resultData"] for row in rows] == expected["resultData"]
+
+    response = test_client.post(
+        "/api/run_matrix/stream",
+        json=input_data,
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
+
+
+def test_run_matrix_stream_events():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "rowRange": {"min": 1, "max": 2, "count": 2},
+    }
+    response = test_client.post(
+        "/api/run_matrix/stream",
+        json=input_data,
+        headers={"Accept": "text/event-stream"},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = response.text.strip().split("\n\n")
+    assert [event.splitlines()[0] for event in events] == [
+        "event: grid",
+        "event: row",
+        "event: row",
+    ]
+    assert "resultData" not in events[1]
+
+
+def test_run_matrix_stream_rejects_refine():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "refine": {},
+    }
+    response = test_client.post("/api/run_matrix/stream", json=input_data)
+    assert response.status_code == 422
+
+
+def test_jobs():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "hno3",
+        "rowRange": {"min": 1, "max": 3, "count": 3},
+    }
+    response = test_client.post("/api/jobs/run_matrix", json=input_data)
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    for _ in range(500):
+        job = test_client.get(f"/api/jobs/{job_id}").json()
+        if job["status"] != "pending" and job["status"] != "running":
+            break
+        time.sleep(0.01)
+    assert job["status"] == "done"
+    assert job["progress"] == 1.0
+
+    response = test_client.get(f"/api/jobs/{job_id}/result")
+    assert (
+        response.json() == test_client.post("/api/run_matrix", json=input_data).json()
+    )
+
+    assert test_client.get("/api/jobs/unknown").status_code == 404
+    assert test_client.get("/api/jobs/unknown/result").status_code == 404
+    assert test_client.delete("/api/jobs/unknown").status_code == 404
+
+
+def test_sweep_job():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10},
+        "axes": [{"name": "no2", "min": 1, "max": 5, "count": 3}],
+        "outputs": ["h2so4"],
+    }
+    job_id = test_client.post("/api/jobs/sweep", json=input_data).json()["id"]
+    for _ in range(500):
+        response = test_client.get(f"/api/jobs/{job_id}/result")
+        if response.status_code != 409:
+            break
+        time.sleep(0.01)
+    assert response.json() == test_client.post("/api/sweep", json=input_data).json()
+
+
+def test_metrics():
+    test_client = TestClient(app)
+    test_client.post(
+        "/api/run_matrix",
+        json={
+            "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20},
+            "columnValue": "o2",
+            "rowValue": "no2",
+            "valueValue": "h2so4",
+            "rowRange": {"min": 100, "max": 101, "count": 2},
+        },
+    )
+    test_client.get("/api/jobs/unknown")
+
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    assert any(
+        line.startswith("tocomo_http_request_duration_seconds_count{")
+        and 'route="/api/run_matrix"' in line
+        and 'status="200"' in line
+        for line in lines
+    )
+    assert any('route="/api/jobs/{job_id}"' in line for line in lines)
+    assert any(
+        line.startswith('tocomo_solver_solves_total{solver="batch"}') for line in lines
+    )
+    assert any(line.startswith("tocomo_result_cache_misses ") for line in lines)
+
+
+def test_metrics_count_every_solve():
+    test_client = TestClient(app)
+    # Inputs no other test solves, so that none are cached
+    inputs = {"h2o": 31.25, "o2": 29.75, "so2": 10.5, "no2": 19.5}
+    solves = app_module.SOLVER_METRICS.solves
+
+    def solved(submit):
+        before = solves.value(solver="batch")
+        submit()
+        return solves.value(solver="batch") - before
+
+    def job(path, data):
+        job_id = test_client.post(path, json=data).json()["id"]
+        for _ in range(500):
+            if test_client.get(f"/api/jobs/{job_id}").json()["status"] == "done":
+                return
+            time.sleep(0.01)
+
+    scenarios = [{**inputs, "h2s": h2s} for h2s in (0.5, 1.5)]
+    matrix = {
+        "inputs": inputs,
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+        "rowRange": {"min": 1.25, "max": 2.25, "count": 2},
+        "columnRange": {"min": 1.25, "max": 3.25, "count": 3},
+    }
+    sweep = {
+        "inputs": inputs,
+        "axes": [{"name": "so2", "min": 1.25, "max": 2.25, "count": 4}],
+        "outputs": ["h2so4"],
+    }
+    assert solved(
+        lambda: test_client.post(
+            "/api/run_reaction/batch", json={"scenarios": scenarios}
+        )
+    ) == len(scenarios)
+    assert solved(lambda: test_client.post("/api/sweep", json=sweep)) == 4
+    assert solved(lambda: job("/api/jobs/run_matrix", matrix)) == 6
+    sweep["inputs"] = {**inputs, "h2s": 2.5}
+    assert solved(lambda: job("/api/jobs/sweep", sweep)) == 4
+
+
+def test_run_matrix_lookup_table(tmp_path, monkeypatch):
+    table = precompute(
+        Molecule.NO2,
+        Molecule.O2,
+        {Molecule.H2O: 30, Molecule.SO2: 10},
+        AxisRange(min=0, max=10),
+        AxisRange(min=0, max=10),
+        lambda initial: run_model_sm1_batch(initial).final,
+    )
+    table.save(tmp_path)
+    monkeypatch.setattr(app_module, "LOOKUP_TABLE", LookupTable.load(tmp_path))
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+    }
+
+    interpolated = test_client.post("/api/run_matrix", json=input_data).json()
+    response = test_client.post("/api/run_matrix/stream", json=input_data)
+    _, *rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["z"] for row in rows] == interpolated["plot"]["z"]
+    assert "etag" in response.headers
+    monkeypatch.setattr(app_module, "LOOKUP_TABLE", None)
+    solved = test_client.post("/api/run_matrix", json=input_data).json()
+    assert np.allclose(interpolated["plot"]["z"], solved["plot"]["z"])
+
+
+def test_reaction_sets():
+    test_client = TestClient(app)
+    reactions = [
+        {
+            "index": 5,
+            "lhs": [[2, "no2"], [1, "h2o"]],
+            "rhs": [[1, "hno3"], [1, "hno2"]],
+        },
+        {"index": 4, "lhs": [[3, "no2"], [1, "h2o"]], "rhs": [[2, "hno3"], [1, "no"]]},
+    ]
+    response = test_client.post("/api/reaction_sets", json={"reactions": reactions})
+    assert response.status_code == 200
+    info = response.json()
+    assert info["reaction_order"] == [5, 4]
+    assert test_client.get(f"/api/reaction_sets/{info['id']}").json() == info
+    assert info in test_client.get("/api/reaction_sets").json()
+
+    response = test_client.post(
+        "/api/run_reaction",
+        params={"reactionSet": info["id"]},
+        json={"h2o": 30, "no2": 20},
+    )
+    assert response.status_code == 200
+    assert [s["Index"] for s in response.json()["steps"]] == ["5"]
+    assert response.json()["steps"][0]["Reaction"] == "2 NO₂ + H₂O → HNO₃ + HNO₂"
+
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "hno2",
+    }
+    default = test_client.post("/api/run_matrix", json=input_data).json()
+    custom = test_client.post(
+        "/api/run_matrix", json={**input_data, "reactionSet": info["id"]}
+    ).json()
+    assert not np.any(default["plot"]["z"])
+    assert np.all(custom["plot"]["z"])
+
+
+def test_reaction_sets_are_always_bounded(monkeypatch):
+    test_client = TestClient(app)
+    monkeypatch.setattr(app_module, "SOLVER_LIMITS", SolverLimits(max_steps=None))
+    monkeypatch.setattr(app_module, "DEFAULT_LIMITS", SolverLimits(max_steps=100))
+    # NO and NO2 turn into each other forever
+    reactions = [
+        {"index": 1, "lhs": [[1, "no"]], "rhs": [[1, "no2"]]},
+        {"index": 2, "lhs": [[1, "no2"]], "rhs": [[1, "no"]]},
+    ]
+    response = test_client.post("/api/reaction_sets", json={"reactions": reactions})
+    response = test_client.post(
+        "/api/run_reaction",
+        params={"reactionSet": response.json()["id"]},
+        json={"no": 1},
+    )
+    assert response.json()["status"] == "max_steps"
+    assert len(response.json()["steps"]) == 100
+
+
+def test_unknown_reaction_set():
+    test_client = TestClient(app)
+    response = test_client.post(
+        "/api/run_reaction", params={"reactionSet": "unknown"}, json={"h2o": 1}
+    )
+    assert response.status_code == 404
+    assert test_client.get("/api/reaction_sets/unknown").status_code == 404
+    response = test_client.post(
+        "/api/sweep",
+        json={
+            "axes": [{"name": "o2", "min": 0, "max": 1}],
+            "outputs": ["h2so4"],
+            "reactionSet": "unknown",
+        },
+    )
+    assert response.status_code == 404
+
+
+def test_run_matrix_incremental():
+    test_client = TestClient(app)
+    input_data = {
+        "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+        "pipeInputs": {"inner_diameter": 30, "drop_out_length": 1000, "flowrate": 20},
+        "columnValue": "o2",
+        "rowValue": "no2",
+        "valueValue": "h2so4",
+    }
+
+    first = test_client.post("/api/run_matrix/incremental", json=input_data).json()
+    assert (
+        first["plot"]
+        == test_client.post("/api/run_matrix", json=input_data).json()["plot"]
+    )
+    assert first["reused"] == 0
+
+    second = test_client.post(
+        "/api/run_matrix/incremental",
+        json={**input_data, "valueValue": "hno3", "previousGrid": first["gridId"]},
+    ).json()
+    assert second["previousGrid"] == first["gridId"]
+    assert second["reused"] == 400
+    z = np.array(first["plot"]["z"])
+    z[second["changes"]["rows"], second["changes"]["columns"]] = second["changes"]["z"]
+    expected = test_client.post(
+        "/api/run_matrix", json={**input_data, "valueValue": "hno3"}
+    ).json()
+    assert z.tolist() == expected["plot"]["z"]
+
+    unknown = test_client.post(
+        "/api/run_matrix/incremental", json={**input_data, "previousGrid": "unknown"}
+    ).json()
+    assert "plot" in unknown
+    assert unknown["gridId"] == first["gridId"]
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from tocomo.batch import run_model_sm1_batch
+from tocomo.incremental import (
+    Grid,
+    GridHistory,
+    RunMatrixUpdate,
+    matrix_changes,
+    update_matrix,
+)
+from tocomo.matrix import compute_matrix
+from tocomo.reactions import COMPILED_REACTIONS
+
+BASE = {
+    "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+    "pipeInputs": {"inner_diameter": 30, "drop_out_length": 1000, "flowrate": 20},
+    "columnValue": "o2",
+    "rowValue": "no2",
+    "valueValue": "h2so4",
+    "detail": "steps",
+}
+
+
+class CountingSolver:
+    def __init__(self):
+        self.points = 0
+
+    def __call__(self, initial):
+        self.points += len(initial)
+        batch = run_model_sm1_batch(initial)
+        return [batch.result(row) for row in range(len(batch))]
+
+
+def request(**kwargs):
+    return RunMatrixUpdate.model_validate({**BASE, **kwargs})
+
+
+def update(previous, data):
+    solve = CountingSolver()
+    grid = Grid(previous, compute_matrix(previous, solve), COMPILED_REACTIONS.key)
+    solve.points = 0
+    matrix, reused = update_matrix(grid, data, solve, COMPILED_REACTIONS, 0.001)
+    return matrix, reused, solve.points
+
+
+@pytest.mark.parametrize(
+    "inputs", [{"h2s": 1}, {"so2": 0}, {"h2o": 1}, {"hno3": 1}, {"s8": 2}]
+)
+def test_update_matches_fresh_computation(inputs):
+    data = request(inputs={**BASE["inputs"], **inputs})
+    matrix, reused, solved = update(request(), data)
+    fresh = compute_matrix(data, CountingSolver())
+    assert solved == (~reused).sum()
+    assert np.array_equal(matrix.final, fresh.final)
+    assert np.array_equal(matrix.values, fresh.values)
+    assert matrix.results == fresh.results
+
+
+def test_unconsumed_inputs_reuse_cells():
+    # S₈ is never consumed nor produced without H₂S
+    matrix, reused, solved = update(
+        request(), request(inputs={**BASE["inputs"], "s8": 2})
+    )
+    assert reused.all()
+    assert solved == 0
+    assert all(r.final["s8"] == 2 for row in matrix.results for r in row)
+
+
+def test_value_and_pipe_changes_need_no_solving():
+    data = request(
+        valueValue="corrosion_rate", pipeInputs={**BASE["pipeInputs"], "flowrate": 5}
+    )
+    matrix, reused, solved = update(request(), data)
+    assert reused.all()
+    assert solved == 0
+    assert np.array_equal(matrix.values, compute_matrix(data, CountingSolver()).values)
+
+
+def test_other_axes_are_computed_from_scratch():
+    matrix, reused, solved = update(request(), request(rowRange={"min": 1, "max": 5}))
+    assert not reused.any()
+    assert solved == matrix.values.size
+
+
+def test_matrix_changes():
+    previous = compute_matrix(request(), CountingSolver())
+    data = request(inputs={**BASE["inputs"], "h2o": 10})
+    matrix = compute_matrix(data, CountingSolver())
+    changes = matrix_changes(previous, matrix, data.detail)
+    assert len(changes["rows"]) == len(changes["z"]) == len(changes["resultData"])
+    for row, column, z in zip(changes["rows"], changes["columns"], changes["z"]):
+        assert z == matrix.values[row, column]
+    assert matrix_changes(previous, previous, data.detail)["rows"] == []
+    other = compute_matrix(request(columnRange={"min": 1, "max": 2}), CountingSolver())
+    assert matrix_changes(previous, other, data.detail) is None
+
+
+def test_grid_history():
+    history = GridHistory(maxsize=1)
+    matrix = compute_matrix(request(), CountingSolver())
+    first = history.put(request(), matrix, COMPILED_REACTIONS)
+    assert first == request(previousGrid="other").grid_id()
+    assert history.get(first).matrix is matrix
+    second = history.put(request(valueValue="hno3"), matrix, COMPILED_REACTIONS)
+    assert second != first
+    assert history.get(first) is None
+    assert history.get(None) is None
+
+
+def test_refine_is_rejected():
+    with pytest.raises(ValueError):
+        request(refine={})
@@ -0,0 +1,176 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from tocomo.jobs import JobCancelled, JobQueue, JobStatus, JobStore
+from tocomo.matrix import AxisRange
+
+
+def wait(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while (job := queue.store.get(job_id)).status not in (
+        JobStatus.DONE,
+        JobStatus.FAILED,
+        JobStatus.CANCELLED,
+    ):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(JobStore(), workers=1, chunk_size=2)
+    yield queue
+    queue.shutdown()
+
+
+def test_job_result_is_stored(queue):
+    def run(context):
+        results = context.map_chunks(lambda rows: rows.sum(axis=1), np.ones((5, 3)))
+        return str(sum(results)).encode()
+
+    job = queue.submit("test", AxisRange(), 5, run)
+    assert job.status == JobStatus.PENDING
+    job = wait(queue, job.id)
+    assert job.status == JobStatus.DONE
+    assert job.progress == 1.0
+    assert queue.store.result(job.id) == b"15.0"
+
+    # Identical requests reuse the job
+    assert queue.submit("test", AxisRange(), 5, run).id == job.id
+    assert queue.submit("test", AxisRange(count=2), 5, run).id != job.id
+
+
+def test_failed_job(queue):
+    def run(context):
+        raise RuntimeError("boom")
+
+    job = wait(queue, queue.submit("test", AxisRange(), 1, run).id)
+    assert job.status == JobStatus.FAILED
+    assert "boom" in job.error
+
+
+def test_cancel_running_job(queue):
+    started = threading.Event()
+    chunks = []
+
+    def solve(rows):
+        started.set()
+        chunks.append(len(rows))
+        time.sleep(0.05)
+        return rows
+
+    def run(context):
+        context.map_chunks(solve, np.zeros((100, 1)))
+        return b""
+
+    job = queue.submit("test", AxisRange(), 100, run)
+    started.wait(5)
+    assert queue.cancel(job.id).status in (JobStatus.RUNNING, JobStatus.CANCELLED)
+    job = wait(queue, job.id)
+    assert job.status == JobStatus.CANCELLED
+    assert 0 < job.progress < 1
+    assert len(chunks) < 50
+
+
+def test_cancel_pending_job(queue):
+    release = threading.Event()
+    blocker = queue.submit("test", AxisRange(), 1, lambda _: release.wait(5) and b"")
+    pending = queue.submit("test", AxisRange(count=3), 1, lambda _: b"")
+    assert queue.cancel(pending.id).status == JobStatus.CANCELLED
+    release.set()
+    assert wait(queue, blocker.id).status == JobStatus.DONE
+    assert queue.store.get(pending.id).status == JobStatus.CANCELLED
+
+
+def test_unfinished_jobs_fail_on_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    job = store.create("test", "hash")
+    store.update(job.id, status=JobStatus.RUNNING)
+    store.close()
+
+    store = JobStore(path)
+    assert store.get(job.id).status == JobStatus.FAILED
+    assert store.get("unknown") is None
+    store.close()
+
+
+@pytest.mark.parametrize("path", [":memory:", "jobs.db"])
+def test_finished_jobs_are_pruned(tmp_path, path):
+    if path != ":memory:":
+        path = str(tmp_path / path)
+    store = JobStore(path, retention=None, max_finished=2)
+    finished = [store.create("test", str(i)) for i in range(3)]
+    for job in finished:
+        store.update(job.id, status=JobStatus.DONE)
+    running = store.create("test", "running")
+    store.update(running.id, status=JobStatus.RUNNING)
+    assert store.get(finished[0].id) is None
+    assert store.get(finished[1].id) is not None
+
+    store.retention = 0
+    store.prune()
+    assert store.get(finished[2].id) is None
+    assert store.get(running.id).status == JobStatus.RUNNING
+    store.close()
+
+
+def test_job_retention_from_env(monkeypatch):
+    monkeypatch.setenv("TOCOMO_JOB_RETENTION", "60")
+    monkeypatch.setenv("TOCOMO_JOB_MAX_FINISHED", "0")
+    queue = JobQueue.from_env()
+    assert queue.store.retention == 60
+    assert queue.store.max_finished is None
+    queue.shutdown()
+
+
+def test_reopen_leaves_unfinished_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job = store.create("test", "hash")
+    store.update(job.id, status=JobStatus.RUNNING)
+    store.reopen()
+    assert store.get(job.id).status == JobStatus.RUNNING
+    store.close()
+
+
+def test_cancel_job_of_other_process(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(JobStore(path), workers=1, chunk_size=2)
+    other = JobQueue(JobStore(path), workers=1, chunk_size=2)
+    started = threading.Event()
+
+    def solve(rows):
+        started.set()
+        time.sleep(0.05)
+        return rows
+
+    def run(context):
+        context.map_chunks(solve, np.zeros((100, 1)))
+        return b""
+
+    try:
+        job = queue.submit("test", AxisRange(), 100, run)
+        started.wait(5)
+        assert other.cancel(job.id).status == JobStatus.CANCELLED
+        job = wait(queue, job.id)
+        assert job.status == JobStatus.CANCELLED
+        assert job.progress < 1
+    finally:
+        queue.shutdown()
+        other.shutdown()
+
+
+def test_context_check_raises_when_cancelled(queue):
+    def run(context):
+        context.cancelled.set()
+        with pytest.raises(JobCancelled):
+            context.check()
+        return b"ok"
+
+    job = wait(queue, queue.submit("test", AxisRange(), 1, run).id)
+    # The result is discarded once the job has been cancelled
+    assert job.status == JobStatus.CANCELLED
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from tocomo.batch import run_model_sm1_batch
+from tocomo.lookup import LookupTable, main, precompute
+from tocomo.matrix import AxisRange, RunMatrix, compute_matrix
+from tocomo.reactions import COMPILED_REACTIONS, M, SolverLimits
+
+
+def solve_final(initial):
+    return run_model_sm1_batch(initial).final
+
+
+def solve(initial):
+    batch = run_model_sm1_batch(initial)
+    return [batch.result(row) for row in range(len(batch))]
+
+
+def request(**kwargs):
+    return RunMatrix.model_validate(
+        {
+            "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+            "pipeInputs": {
+                "inner_diameter": 30,
+                "drop_out_length": 1000,
+                "flowrate": 20,
+            },
+            "columnValue": "o2",
+            "rowValue": "no2",
+            "valueValue": "h2so4",
+            **kwargs,
+        }
+    )
+
+
+@pytest.fixture(scope="module")
+def table(tmp_path_factory):
+    path = tmp_path_factory.mktemp("table")
+    precompute(
+        M.NO2,
+        M.O2,
+        {M.H2O: 30, M.SO2: 10},
+        AxisRange(min=0, max=10, step=0.25),
+        AxisRange(min=0, max=10, step=0.25),
+        solve_final,
+    ).save(path)
+    return LookupTable.load(path)
+
+
+def test_table_is_memory_mapped(table):
+    assert isinstance(table.final, np.memmap)
+    assert table.final.shape == (41, 41, 10)
+    assert table.reactions == COMPILED_REACTIONS.key
+
+
+@pytest.mark.parametrize("value", ["h2so4", "hno3", "corrosion_rate"])
+def test_table_matches_solver_on_its_grid(table, value):
+    data = request(valueValue=value)
+    assert table.covers(data)
+    expected = compute_matrix(data, solve)
+    actual = table.matrix(data)
+    assert np.allclose(actual.values, expected.values, rtol=1e-12, atol=1e-12)
+    assert np.allclose(actual.final, expected.final, rtol=1e-12, atol=1e-12)
+
+
+def test_table_interpolates_between_points(table):
+    data = request(rowRange={"min": 1, "max": 9, "step": 0.1})
+    assert table.covers(data)
+    expected = compute_matrix(data, solve)
+    assert np.allclose(table.matrix(data).values, expected.values, atol=0.2)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"detail": "final"},
+        {"rowValue": "so2"},
+        {"inputs": {"h2o": 30, "so2": 10, "h2s": 1}},
+        {"columnRange": {"min": 5, "max": 12}},
+        {"rowRange": {"min": -1, "max": 2}},
+    ],
+)
+def test_table_does_not_cover(table, kwargs):
+    assert not table.covers(request(**kwargs))
+
+
+def test_table_from_env(table, tmp_path, monkeypatch):
+    table.save(tmp_path)
+    monkeypatch.setenv("TOCOMO_LOOKUP_TABLE", str(tmp_path))
+    assert LookupTable.from_env() is not None
+    assert LookupTable.from_env(limits=SolverLimits(time_budget=1)) is not None
+    assert LookupTable.from_env(limits=SolverLimits(tolerance=0.01)) is None
+    monkeypatch.delenv("TOCOMO_LOOKUP_TABLE")
+    assert LookupTable.from_env() is None
+
+
+def test_precompute_cli(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOCOMO_SOLVER_WORKERS", "0")
+    main([str(tmp_path), "--input", "H2O=20", "--max", "2", "--count", "5"])
+    table = LookupTable.load(tmp_path)
+    assert (table.row, table.column) == (M.NO2, M.O2)
+    assert table.inputs[M.H2O] == 20
+    assert table.inputs[M.SO2] == 10
+    assert np.array_equal(table.x, [0, 0.5, 1, 1.5, 2])
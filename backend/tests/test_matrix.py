@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from tocomo.batch import run_model_sm1_batch
+from tocomo.matrix import AxisRange, RunMatrix, compute_matrix, iter_matrix_rows
+
+
+def solve(initial):
+    batch = run_model_sm1_batch(initial)
+    return [batch.result(row) for row in range(len(batch))]
+
+
+def request(**kwargs):
+    return RunMatrix.model_validate(
+        {
+            "inputs": {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0},
+            "pipeInputs": {
+                "inner_diameter": 30,
+                "drop_out_length": 1000,
+                "flowrate": 20,
+            },
+            "columnValue": "o2",
+            "rowValue": "no2",
+            "valueValue": "h2so4",
+            **kwargs,
+        }
+    )
+
+
+def test_axis_range_default():
+    assert np.array_equal(AxisRange().values(), np.arange(0.5, 10.5, 0.5))
+
+
+def test_axis_range_step_and_count():
+    assert np.allclose(
+        AxisRange(min=0, max=1, step=0.25).values(), [0, 0.25, 0.5, 0.75, 1]
+    )
+    assert np.allclose(AxisRange(min=0, max=1, count=3).values(), [0, 0.5, 1])
+    assert len(AxisRange(min=2, max=2, step=1)) == 1
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"min": 2, "max": 1},
+        {"step": 0},
+        {"count": 0},
+        {"step": 1, "count": 2},
+        {"min": 0, "max": 1e6, "step": 1},
+    ],
+)
+def test_axis_range_invalid(kwargs):
+    with pytest.raises(ValidationError):
+        AxisRange(**kwargs)
+
+
+def test_compute_matrix_ranges():
+    matrix = compute_matrix(
+        request(
+            rowRange={"min": 1, "max": 5, "count": 3},
+            columnRange={"min": 0, "max": 3, "step": 1},
+        ),
+        solve,
+    )
+    assert matrix.values.shape == (3, 4)
+    assert matrix.computed.all()
+    assert matrix.results[2][1].initial["no2"] == 5
+    assert matrix.results[2][1].initial["o2"] == 1
+
+
+def test_compute_matrix_refine_without_threshold():
+    full = compute_matrix(request(), solve)
+    refined = compute_matrix(request(refine={"levels": 2, "threshold": 0}), solve)
+    # H₂SO₄ is piecewise linear, so only cells with regime boundaries are solved
+    assert refined.computed.sum() < refined.computed.size / 2
+    assert np.allclose(refined.values, full.values)
+
+
+@pytest.mark.parametrize("value", ["h2so4", "hno3", "corrosion_rate"])
+def test_compute_matrix_refine_skips_smooth_cells(value):
+    full = compute_matrix(request(valueValue=value), solve)
+    refined = compute_matrix(
+        request(valueValue=value, refine={"levels": 2, "threshold": 0.5}), solve
+    )
+    assert 0 < refined.computed.sum() < refined.computed.size
+    computed = refined.computed
+    assert np.array_equal(refined.values[computed], full.values[computed])
+    assert all(
+        (result is None) == (not computed[row, column])
+        for row, results in enumerate(refined.results)
+        for column, result in enumerate(results)
+    )
+    # Interpolation is only used where corners are within the threshold
+    assert np.abs(refined.values - full.values).max() <= 0.5
+
+
+@pytest.mark.parametrize("chunk_cells", [1, 50, 1000])
+def test_iter_matrix_rows(chunk_cells):
+    data = request(valueValue="corrosion_rate")
+    full = compute_matrix(data, solve)
+    rows = list(iter_matrix_rows(data, solve, chunk_cells))
+    assert [row.index for row in rows] == list(range(len(full.y)))
+    np.testing.assert_array_equal([row.values for row in rows], full.values)
+    assert [row.results for row in rows] == full.results
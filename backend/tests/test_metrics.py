@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+
+from tocomo.batch import run_model_sm1_batch, to_array
+from tocomo.metrics import Counter, Histogram, Metric, Registry, SolverMetrics
+from tocomo.reactions import M, run_model_sm1
+
+
+def test_render_counter_and_histogram():
+    registry = Registry()
+    counter = registry.register(Counter("requests_total", "Requests", ["path"]))
+    histogram = registry.register(Histogram("latency", "Latency", [0.1, 1]))
+    counter.inc(path='/a"b')
+    counter.inc(2, path='/a"b')
+    histogram.observe_many([0.05, 0.1, 0.5, 3])
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a\\"b"} 3.0',
+        "# HELP latency Latency",
+        "# TYPE latency histogram",
+        'latency_bucket{le="0.1"} 2',
+        'latency_bucket{le="1.0"} 3',
+        'latency_bucket{le="+Inf"} 4',
+        "latency_sum 3.65",
+        "latency_count 4",
+    ]
+
+
+def test_labels_must_match():
+    counter = Counter("requests_total", "Requests", ["path"])
+    with pytest.raises(ValueError):
+        counter.inc(method="GET")
+
+
+def test_metrics_need_samples():
+    with pytest.raises(TypeError):
+        Metric("requests_total", "Requests")
+
+
+def test_solver_metrics(caplog):
+    metrics = SolverMetrics(Registry(), slow_steps=20)
+    initial = {M.H2O: 30, M.O2: 30, M.SO2: 10, M.NO2: 20}
+    result = metrics.solver(run_model_sm1)(initial, None)
+    assert result == run_model_sm1(initial)
+
+    with caplog.at_level(logging.INFO, "tocomo.metrics"):
+        batch = metrics.batch_solver(run_model_sm1_batch)(
+            to_array([initial, {**initial, M.H2O: 1000, M.O2: 1000, M.NO2: 1000}])
+        )
+
+    assert metrics.solves.value(solver="single") == 1
+    assert metrics.solves.value(solver="batch") == 2
+    assert metrics.steps.count() == 3
+    assert metrics.seconds.count(solver="batch") == 1
+    steps = 2 * len(result.steps) + len(batch.result(1).steps)
+    assert (
+        sum(metrics.reaction_steps.value(reaction=str(r)) for r in range(1, 7)) == steps
+    )
+    assert len(result.steps) <= 20 < len(batch.result(1).steps)
+    assert [r.message.startswith("Slow solve") for r in caplog.records] == [True]
+    assert metrics.seconds.count(solver="single") == 1
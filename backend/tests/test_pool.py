@@ -0,0 +1,135 @@
+import os
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from tocomo.batch import BatchResult, run_model_sm1_batch, to_array
+from tocomo.pool import SolverPool, available_cpus
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    M,
+    SolverLimits,
+    SolverStatus,
+    run_model_sm1,
+)
+from tocomo.trace import CollectingTracer
+
+
+@pytest.fixture
+def pool():
+    pool = SolverPool(workers=2, chunk_size=3)
+    yield pool
+    pool.shutdown()
+
+
+def scenarios():
+    return to_array(
+        [
+            {M.H2O: 30.0, M.O2: float(o2), M.SO2: 10.0, M.NO2: float(no2)}
+            for o2 in range(0, 10, 2)
+            for no2 in range(0, 10, 3)
+        ]
+    )
+
+
+def assert_batches_equal(actual, expected):
+    for row in range(len(expected)):
+        assert actual.result(row) == expected.result(row)
+
+
+def test_pool_batch_matches_inline(pool):
+    initial = scenarios()
+    assert_batches_equal(
+        pool.run_model_sm1_batch(initial), run_model_sm1_batch(initial)
+    )
+
+
+def test_pool_scalar_matches_inline(pool):
+    initial = {M.H2O: 30.0, M.O2: 30.0, M.SO2: 10.0, M.NO2: 20.0}
+    assert pool.run_model_sm1(initial) == run_model_sm1(initial)
+
+
+def test_pool_results_share_compiled_reactions(pool):
+    result = pool.run_model_sm1({M.H2O: 30.0, M.O2: 30.0, M.SO2: 10.0})
+    assert result.reactions is COMPILED_REACTIONS
+
+
+def test_pool_chunks_share_deadline(pool, monkeypatch):
+    calls = []
+    run = pool._run
+
+    def record(fn, args):
+        calls.extend(args)
+        return run(fn, args)
+
+    monkeypatch.setattr(pool, "_run", record)
+    batch = pool.run_model_sm1_batch(scenarios(), limits=SolverLimits(time_budget=3600))
+    assert len(calls) == 2
+    assert calls[0][-1] == calls[1][-1] <= time.monotonic() + 3600
+    assert set(batch.status) == {SolverStatus.CONVERGED}
+
+
+def test_pool_replaces_broken_executor(pool):
+    initial = {M.H2O: 30.0, M.O2: 30.0, M.SO2: 10.0, M.NO2: 20.0}
+    expected = pool.run_model_sm1(initial)
+    executor = pool._executor
+    for pid in list(executor._processes):
+        os.kill(pid, signal.SIGKILL)
+    assert pool.run_model_sm1(initial) == expected
+    assert pool._executor is not executor
+
+    # Calls that keep killing their worker fail after one retry
+    with pytest.raises(BrokenProcessPool):
+        pool._run(os._exit, [(1,)])
+    assert_batches_equal(
+        pool.run_model_sm1_batch(scenarios()), run_model_sm1_batch(scenarios())
+    )
+
+
+def test_pool_without_workers_runs_inline():
+    pool = SolverPool(workers=0)
+    initial = scenarios()
+    assert_batches_equal(
+        pool.run_model_sm1_batch(initial), run_model_sm1_batch(initial)
+    )
+    assert pool._executor is None
+
+
+def test_pool_traces_inline(pool):
+    tracer = CollectingTracer()
+    pool.run_model_sm1_batch(scenarios(), tracer=tracer)
+    assert tracer.entries
+    assert pool._executor is None
+
+
+def test_concatenate_pads_shorter_batches():
+    short = run_model_sm1_batch(to_array([{M.NO: 4.0, M.O2: 2.0}]))
+    long = run_model_sm1_batch(to_array([{M.H2O: 30.0, M.SO2: 10.0, M.NO2: 5.0}]))
+    joined = BatchResult.concatenate([short, long])
+    assert joined.reaction_indices.shape == (len(long.reaction_indices), 2)
+    assert np.all(joined.reaction_indices[1:, 0] == -1)
+    assert joined.result(0) == short.result(0)
+    assert joined.result(1) == long.result(0)
+
+
+def test_available_cpus(tmp_path):
+    cpus = available_cpus(str(tmp_path))
+    assert cpus >= 1
+
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert available_cpus(str(tmp_path)) == cpus
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert available_cpus(str(tmp_path)) == min(cpus, 2)
+    (tmp_path / "cpu.max").write_text("10000 100000\n")
+    assert available_cpus(str(tmp_path)) == 1
+
+    (tmp_path / "cpu.max").unlink()
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert available_cpus(str(tmp_path)) == cpus
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("100000\n")
+    assert available_cpus(str(tmp_path)) == 1
@@ -0,0 +1,96 @@
+import pytest
+from pydantic import ValidationError
+
+from tocomo.batch import run_model_sm1_batch, to_array
+from tocomo.reaction_sets import ReactionSet, ReactionSetInfo, ReactionSets
+from tocomo.reactions import (
+    COMPILED_REACTIONS,
+    REACTIONS,
+    M,
+    CompiledReactions,
+    run_model_sm1,
+)
+
+
+def all_active():
+    return ReactionSet(
+        reactions=[r.model_copy(update={"active": True}) for r in REACTIONS]
+    )
+
+
+def test_default_reactions_are_always_available():
+    sets = ReactionSets(maxsize=0)
+    assert sets.get(None) is COMPILED_REACTIONS
+    assert sets.get(COMPILED_REACTIONS.key) is COMPILED_REACTIONS
+    assert sets.add(ReactionSet(reactions=REACTIONS)) is COMPILED_REACTIONS
+    assert sets.get("unknown") is None
+
+
+def test_sets_are_compiled_once():
+    sets = ReactionSets()
+    compiled = sets.add(all_active())
+    assert sets.add(all_active()) is compiled
+    assert sets.get(compiled.key) is compiled
+    assert compiled.key == CompiledReactions(all_active().reactions).key
+    assert compiled.key != COMPILED_REACTIONS.key
+    assert [r.index for r in compiled.reactions] == [3, 2, 1, 4, 5, 6]
+
+
+def test_order_changes_the_set():
+    sets = ReactionSets()
+    forward = sets.add(all_active())
+    backward = sets.add(ReactionSet(reactions=all_active().reactions[::-1]))
+    assert forward.key != backward.key
+
+
+def test_least_recently_used_set_is_dropped():
+    sets = ReactionSets(maxsize=1)
+    first = sets.add(all_active())
+    second = sets.add(ReactionSet(reactions=REACTIONS[::-1]))
+    assert sets.get(first.key) is None
+    assert sets.get(second.key) is second
+    assert sets.all() == [COMPILED_REACTIONS, second]
+
+
+def test_sets_are_shared_through_directory(tmp_path):
+    compiled = ReactionSets(path=tmp_path).add(all_active())
+    other = ReactionSets(path=tmp_path)
+    assert other.get(compiled.key).key == compiled.key
+    assert [r.index for r in other.get(compiled.key).reactions] == [3, 2, 1, 4, 5, 6]
+    assert other.get("0" * 64) is None
+    assert other.get("../" + compiled.key) is None
+
+
+def test_custom_set_is_solved():
+    # Reaction 5 takes priority over reaction 4
+    compiled = ReactionSets().add(ReactionSet(reactions=all_active().reactions[::-1]))
+    initial = {M.H2O: 30.0, M.O2: 0.0, M.NO2: 20.0}
+    result = run_model_sm1(initial, reactions=compiled)
+    assert 5 in [s.reaction_index for s in result.steps]
+    batch = run_model_sm1_batch(to_array([initial]), compiled)
+    assert batch.result(0).final == result.final
+
+
+def test_info():
+    info = ReactionSetInfo.of(COMPILED_REACTIONS)
+    assert info.id == COMPILED_REACTIONS.key
+    assert info.reaction_order == [3, 2, 1, 4, 6]
+    assert info.reactions[6] == "8 H₂S + 4 O₂ → 8 H₂O + S₈"
+
+
+@pytest.mark.parametrize(
+    "reactions",
+    [
+        [],
+        [{"index": 1, "lhs": [[1, "no2"]], "rhs": [[1, "no"]]}] * 2,
+        [{"index": 1, "lhs": [], "rhs": [[1, "no"]]}],
+        [{"index": 1, "lhs": [[0, "no2"]], "rhs": [[1, "no"]]}],
+        [{"index": 1, "lhs": [[1, "no2"], [2, "no2"]], "rhs": [[1, "no"]]}],
+        [{"index": 1, "lhs": [[1, "co2"]], "rhs": [[1, "no"]]}],
+        [{"index": 1, "lhs": [[1, "no"]], "rhs": [[2, "no"]]}],
+        [{"index": 1, "lhs": [[1, "no"], [1, "o2"]], "rhs": [[1, "no"]]}],
+    ],
+)
+def test_invalid_sets(reactions):
+    with pytest.raises(ValidationError):
+        ReactionSet.model_validate({"reactions": reactions})
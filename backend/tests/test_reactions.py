@@ -1,8 +1,20 @@
+import logging
+import random
+from collections import defaultdict
+
+import numpy as np
 import pytest
 from tocomo.reactions import (
+    MOLECULES,
     M,
+    REACTIONS,
+    CompiledReactions,
     Reaction,
+    SolverLimits,
+    SolverMode,
+    SolverStatus,
     run_model_sm1,
+    to_vector,
 )
 from tocomo.corrosion_calc import (
     convert_iron_rate,
@@ -11,8 +23,11 @@ from tocomo.corrosion_calc import (
     CO2_MOL_WEIGHT,
     corrosion_rate_H2SO4,
     corrosion_rate_HNO3,
+    corrosion_rates,
     surface_area,
 )
+from tocomo.batch import run_model_sm1_batch, to_array
+from tocomo.trace import CollectingTracer, LoggingTracer
 
 
 def test_react():
@@ -79,6 +94,22 @@ def test_corrosion_rate_HNO3():
     ) == pytest.approx(0.75060813)
 
 
+def test_corrosion_rates_broadcast():
+    diameters = np.array([[24.0], [36.0]])
+    flowrates = np.array([10.0, 20.0, 30.0])
+    area = surface_area(diameters, drop_out_length=1000)
+    rates = corrosion_rates(area, flowrates, molar_rate_H2SO4=3, molar_rate_HNO3=4)
+
+    assert rates["corrosion_rate"].shape == (2, 3)
+    assert rates["H2SO4_corrosion"][1, 1] == corrosion_rate_H2SO4(
+        surface_area(36, 1000), 20, 3
+    )
+    assert rates["HNO3_corrosion"][1, 1] == pytest.approx(0.75060813)
+    np.testing.assert_array_equal(
+        rates["corrosion_rate"], rates["H2SO4_corrosion"] + rates["HNO3_corrosion"]
+    )
+
+
 def normalize(concentrations):
     """Round all values concentrations to 1 decimal precision."""
     for k, v in concentrations.items():
@@ -213,3 +244,159 @@ def test_rhs_reactions_missing():
 
     result = run_model_sm1(concentrations)
     assert M.NO in result.final
+
+
+def test_react_does_not_print(capsys):
+    reaction = Reaction(index=0, lhs=[(2, M.NO), (1, M.O2)], rhs=[(2, M.NO2)])
+    reaction.do({M.NO: 4.0, M.O2: 2.0, M.NO2: 0.0})
+    assert capsys.readouterr().out == ""
+
+
+def test_run_model_sm1_tracer():
+    tracer = CollectingTracer()
+    result = run_model_sm1({M.NO: 4.0, M.O2: 1.0, M.NO2: 0.0}, tracer)
+    assert [(e.reaction_index, e.multiplier) for e in tracer.entries] == [
+        (s.reaction_index, s.multiplier) for s in result.steps
+    ]
+    assert tracer.entries[-1].concentrations.items() <= result.final.items()
+
+
+@pytest.mark.parametrize("mode", list(SolverMode))
+def test_posteriors_are_those_the_solver_passed_through(mode):
+    tracer = CollectingTracer()
+    result = run_model_sm1(
+        {M.H2O: 30.0, M.O2: 30.0, M.SO2: 10.0, M.NO2: 20.0, M.H2S: 5.0},
+        tracer,
+        mode=mode,
+    )
+    assert (result.recorded is not None) == (mode == SolverMode.EVENT_JUMP)
+    assert np.array_equal(
+        result.posteriors, [to_vector(e.concentrations) for e in tracer.entries]
+    )
+
+
+def test_logging_tracer(caplog):
+    with caplog.at_level(logging.DEBUG, logger="tocomo.trace"):
+        run_model_sm1({M.NO: 4.0, M.O2: 1.0, M.NO2: 0.0}, LoggingTracer())
+    assert len(caplog.records) == 1
+    assert caplog.records[0].reaction_index == 2
+    assert caplog.records[0].multiplier == 1.0
+
+
+def run_reference(initial):
+    """Straightforward dict based solver using Reaction.do"""
+    concentrations = defaultdict(lambda: 0, initial)
+    aggregated = defaultdict(lambda: 0, initial)
+    steps = []
+    while True:
+        for r in REACTIONS:
+            if r.active and (mult := r.do(concentrations, aggregated)):
+                steps.append((r.index, mult))
+                break
+        else:
+            return concentrations, aggregated, steps
+
+
+def test_run_model_sm1_matches_reference():
+    rng = random.Random(0)
+    for _ in range(100):
+        initial = {
+            M.H2O: rng.uniform(0, 40),
+            M.O2: rng.uniform(0, 40),
+            M.SO2: rng.uniform(0, 20),
+            M.NO2: rng.uniform(0, 30),
+            M.H2S: rng.choice([0, rng.uniform(0, 10)]),
+        }
+        final, aggregated, steps = run_reference(initial)
+        result = run_model_sm1(initial)
+        assert [(s.reaction_index, s.multiplier) for s in result.steps] == steps
+        for m in MOLECULES:
+            assert result.final[m] == final[m]
+            assert result.aggregated[m] == aggregated[m]
+
+
+@pytest.mark.parametrize(
+    "initial",
+    [
+        {M.H2O: 30, M.O2: 30, M.SO2: 10, M.NO2: 20},
+        {M.H2O: 1000, M.O2: 1000, M.SO2: 10, M.NO2: 1000},
+        {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1},
+        {M.H2O: 40, M.O2: 15, M.NO2: 15, M.H2S: 3},
+        {M.H2O: 20, M.O2: 5, M.NO2: 8, M.H2S: 7},
+        {M.H2O: 5, M.O2: 2, M.SO2: 50, M.NO2: 300, M.NO: 3},
+    ],
+)
+def test_event_jump_matches_iterative(initial):
+    iterative = run_model_sm1(initial)
+    jumped = run_model_sm1(initial, mode=SolverMode.EVENT_JUMP)
+    for m in MOLECULES:
+        assert jumped.final[m] == pytest.approx(iterative.final[m], abs=1e-6)
+        assert jumped.aggregated[m] == pytest.approx(iterative.aggregated[m], abs=1e-6)
+    assert len(jumped.steps) <= len(iterative.steps)
+
+
+def test_event_jump_reduces_steps():
+    # NO₂ is regenerated by eq 2 after each of eq 1 and eq 4
+    initial = {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1}
+    iterative = run_model_sm1(initial)
+    jumped = run_model_sm1(initial, mode=SolverMode.EVENT_JUMP)
+    assert len(iterative.steps) > 200
+    assert len(jumped.steps) < 20
+
+
+def test_max_steps_returns_partial_result():
+    initial = {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1}
+    full = run_model_sm1(initial)
+    partial = run_model_sm1(initial, limits=SolverLimits(max_steps=10))
+    assert full.status == SolverStatus.CONVERGED
+    assert partial.status == SolverStatus.MAX_STEPS
+    assert partial.steps == full.steps[:10]
+    assert partial.final == partial.steps[-1].posterior
+
+
+def test_time_budget_returns_partial_result():
+    initial = {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1}
+    result = run_model_sm1(initial, limits=SolverLimits(time_budget=1e-9))
+    assert result.status == SolverStatus.TIME_BUDGET
+    assert len(result.steps) < len(run_model_sm1(initial).steps)
+
+
+def test_tolerance_stops_small_steps():
+    initial = {M.H2O: 1000, M.O2: 1000, M.SO2: 100, M.NO2: 1}
+    coarse = run_model_sm1(initial, limits=SolverLimits(tolerance=0.01))
+    assert coarse.status == SolverStatus.CONVERGED
+    assert len(coarse.steps) < len(run_model_sm1(initial).steps)
+    assert min(s.multiplier for s in coarse.steps) >= 0.01
+
+
+def test_default_limits_converge():
+    # Needs hundreds of thousands of steps, as NO2 is used up 0.01 at a time
+    result = run_model_sm1({M.O2: 1000, M.NO2: 0.01, M.H2S: 1000})
+    assert result.status == SolverStatus.CONVERGED
+    assert len(result.multipliers) > 100_000
+
+
+def test_default_limits_bound_steps():
+    result = run_model_sm1({M.O2: 1e5, M.H2S: 1e5, M.NO2: 0.01})
+    assert result.status == SolverStatus.MAX_STEPS
+    assert len(result.multipliers) == 1_000_000
+
+
+def test_diverging_reactions_stop():
+    # NO doubles with every step until it overflows
+    doubling = CompiledReactions([Reaction(index=1, lhs=[(1, M.NO)], rhs=[(2, M.NO)])])
+    result = run_model_sm1({M.NO: 1.0}, reactions=doubling)
+    assert result.status == SolverStatus.DIVERGED
+    assert len(result.steps) < 2000
+
+    batch = run_model_sm1_batch(to_array([{M.NO: 1.0}]), reactions=doubling)
+    assert batch.status == [SolverStatus.DIVERGED]
+    assert batch.result(0) == result
+
+
+def test_solver_limits_from_env(monkeypatch):
+    assert SolverLimits.from_env() == SolverLimits(0.001, 1_000_000, None)
+    monkeypatch.setenv("TOCOMO_SOLVER_TOLERANCE", "0.01")
+    monkeypatch.setenv("TOCOMO_SOLVER_MAX_STEPS", "0")
+    monkeypatch.setenv("TOCOMO_SOLVER_TIME_BUDGET", "2.5")
+    assert SolverLimits.from_env() == SolverLimits(0.01, None, 2.5)
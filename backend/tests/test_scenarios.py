@@ -0,0 +1,75 @@
+import io
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tocomo.batch import run_model_sm1_batch
+from tocomo.reactions import M, run_model_sm1
+from tocomo.scenarios import (
+    CSV,
+    PARQUET,
+    ReactionBatch,
+    read_table,
+    solve_scenarios,
+    table_content,
+    write_table,
+)
+
+PIPE = {"inner_diameter": 30.0, "drop_out_length": 1000.0, "flowrate": 20.0}
+
+
+def test_scenarios_match_single_solves():
+    batch = ReactionBatch.model_validate(
+        {
+            "scenarios": [
+                {"h2o": 30, "o2": 30, "so2": 10, "no2": 20},
+                {"h2o": 1, "no2": 4, "flowrate": 10},
+            ],
+            "pipeInputs": PIPE,
+        }
+    )
+    table = solve_scenarios(batch.frame(), run_model_sm1_batch, batch.pipe_inputs)
+    assert table["status"].tolist() == ["converged", "converged"]
+    for i, scenario in enumerate(batch.scenarios):
+        result = run_model_sm1({m: v for m, v in scenario.items() if isinstance(m, M)})
+        assert table["final_hno3"][i] == pytest.approx(result.final[M.HNO3])
+        assert table["change_no2"][i] == pytest.approx(
+            result.final[M.NO2] - result.initial[M.NO2]
+        )
+    # A flowrate in the scenario takes precedence over the one in pipeInputs
+    rates = table["corrosion_rate"]
+    assert rates[0] != rates[1] and not np.isnan(rates).any()
+
+
+def test_missing_pipe_inputs_give_no_rates():
+    table = solve_scenarios(
+        pd.DataFrame({"h2o": [30.0], "so2": [10.0]}), run_model_sm1_batch
+    )
+    assert math.isnan(table["H2SO4_corrosion"][0])
+    assert table_content(table)["corrosion_rate"] == [None]
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [pd.DataFrame({"h2o": [1.0], "co2": [1.0]}), pd.DataFrame({"h2o": ["wet"]})],
+)
+def test_invalid_scenarios(frame):
+    with pytest.raises(ValueError):
+        solve_scenarios(frame, run_model_sm1_batch)
+
+
+def test_csv_round_trip():
+    frame = read_table(b"h2o,no2,flowrate\n30,20,\n1,4,10\n", CSV)
+    table = solve_scenarios(frame, run_model_sm1_batch, PIPE)
+    written = pd.read_csv(io.BytesIO(write_table(table, CSV)))
+    assert list(written.columns) == list(table)
+    assert written["final_h2so4"].tolist() == pytest.approx(table["final_h2so4"])
+
+
+def test_parquet_round_trip():
+    pytest.importorskip("pyarrow")
+    content = write_table({"h2o": np.array([30.0]), "no2": np.array([20.0])}, PARQUET)
+    frame = read_table(content, PARQUET)
+    assert frame.to_dict("list") == {"h2o": [30.0], "no2": [20.0]}
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from tocomo.batch import run_model_sm1_batch
+from tocomo.corrosion_calc import corrosion_rate_H2SO4, surface_area
+from tocomo.matrix import RunMatrix, compute_matrix
+from tocomo.reactions import MOLECULE_INDEX, MOLECULES
+from tocomo.sweep import Sweep, compute_sweep, latin_hypercube
+
+INPUTS = {"h2o": 30, "o2": 30, "so2": 10, "no2": 20, "h2s": 0}
+PIPE_INPUTS = {"inner_diameter": 30, "drop_out_length": 1000, "flowrate": 20}
+
+
+def solve(initial):
+    return run_model_sm1_batch(initial).final
+
+
+def sweep(**kwargs):
+    return Sweep.model_validate({"inputs": INPUTS, "pipeInputs": PIPE_INPUTS, **kwargs})
+
+
+def test_grid_matches_matrix():
+    matrix = compute_matrix(
+        RunMatrix.model_validate(
+            {
+                "inputs": INPUTS,
+                "pipeInputs": PIPE_INPUTS,
+                "rowValue": "no2",
+                "columnValue": "o2",
+                "valueValue": "corrosion_rate",
+            }
+        ),
+        lambda initial: [
+            run_model_sm1_batch(initial).result(i) for i in range(len(initial))
+        ],
+    )
+    result = compute_sweep(
+        sweep(axes=[{"name": "no2"}, {"name": "o2"}], outputs=["corrosion_rate"]),
+        solve,
+    )
+    np.testing.assert_array_equal(result.axes["no2"], matrix.y)
+    np.testing.assert_array_equal(result.axes["o2"], matrix.x)
+    np.testing.assert_array_equal(result.outputs["corrosion_rate"], matrix.values)
+
+
+def test_grid_broadcasts_pipe_inputs():
+    solved = []
+
+    def counting_solve(initial):
+        solved.append(len(initial))
+        return solve(initial)
+
+    result = compute_sweep(
+        sweep(
+            axes=[
+                {"name": "so2", "min": 1, "max": 10, "count": 4},
+                {"name": "flowrate", "min": 10, "max": 30, "count": 3},
+                {"name": "inner_diameter", "min": 20, "max": 40, "count": 5},
+            ],
+            outputs=["h2so4", "H2SO4_corrosion"],
+        ),
+        counting_solve,
+    )
+    assert result.outputs["h2so4"].shape == (4, 3, 5)
+    assert result.outputs["H2SO4_corrosion"].shape == (4, 3, 5)
+    # Only the molecule axis is solved
+    assert solved == [4]
+
+    h2so4 = result.outputs["h2so4"][2, 1, 3]
+    area = surface_area(result.axes["inner_diameter"][3], 1000)
+    assert result.outputs["H2SO4_corrosion"][2, 1, 3] == pytest.approx(
+        corrosion_rate_H2SO4(area, result.axes["flowrate"][1], h2so4)
+    )
+
+
+def test_latin_hypercube_is_stratified():
+    unit = latin_hypercube(3, 50, np.random.default_rng(1))
+    assert unit.shape == (50, 3)
+    for column in unit.T:
+        assert sorted(np.floor(column * 50).astype(int)) == list(range(50))
+
+
+def test_latin_hypercube_sweep():
+    data = sweep(
+        axes=[
+            {"name": "no2", "min": 1, "max": 20},
+            {"name": "flowrate", "min": 10, "max": 30},
+        ],
+        outputs=["hno3", "corrosion_rate"],
+        sampling="latin_hypercube",
+        samples=25,
+        seed=3,
+    )
+    result = compute_sweep(data, solve)
+    assert result.outputs["corrosion_rate"].shape == (25,)
+    assert 1 <= result.axes["no2"].min() <= result.axes["no2"].max() <= 20
+
+    initial = np.zeros((25, len(MOLECULES)))
+    for m, v in INPUTS.items():
+        initial[:, MOLECULE_INDEX[m]] = v
+    initial[:, MOLECULE_INDEX["no2"]] = result.axes["no2"]
+    expected = solve(initial)[:, MOLECULE_INDEX["hno3"]]
+    np.testing.assert_array_equal(result.outputs["hno3"], expected)
+
+    # The same seed gives the same samples
+    again = compute_sweep(data, solve)
+    np.testing.assert_array_equal(again.axes["no2"], result.axes["no2"])
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"axes": [], "outputs": ["h2so4"]},
+        {"axes": [{"name": "o2"}, {"name": "o2"}], "outputs": ["h2so4"]},
+        {"axes": [{"name": "pressure"}], "outputs": ["h2so4"]},
+        {"axes": [{"name": "o2"}], "outputs": ["ph"]},
+        {
+            "axes": [{"name": m, "count": 100} for m in ["o2", "no2", "so2"]],
+            "outputs": ["h2so4"],
+        },
+    ],
+)
+def test_invalid_sweep(kwargs):
+    with pytest.raises(ValidationError):
+        sweep(**kwargs)
+
+
+def test_corrosion_outputs_need_pipe_inputs():
+    with pytest.raises(ValidationError):
+        Sweep.model_validate({"axes": [{"name": "o2"}], "outputs": ["corrosion_rate"]})
+    Sweep.model_validate({"axes": [{"name": "o2"}], "outputs": ["h2so4"]})
@@ -32,7 +32,72 @@ interface StateData {
     y: number[];
     z: number[][];
   };
-  resultData: ResultData[][];
+}
+
+// The solver endpoints take their request as JSON in the data parameter of
+// GET requests, so that the browser and nginx can cache the responses
+function solverUrl(path: string, body: object): string {
+  const params = new URLSearchParams({ data: JSON.stringify(body) });
+  return `${baseUrl}${path}?${params}`;
+}
+
+function getJson<T>(
+  path: string,
+  body: object,
+  signal: AbortSignal,
+): Promise<T> {
+  return fetch(solverUrl(path, body), { signal })
+    .then((resp) => resp.json())
+    .then((json) => {
+      if (json.detail !== undefined) {
+        throw json;
+      } else {
+        return json;
+      }
+    });
+}
+
+interface GridMessage {
+  type: "grid";
+  x: number[];
+  y: number[];
+}
+
+interface RowMessage {
+  type: "row";
+  row: number;
+  z: number[];
+}
+
+// Reads the newline-delimited JSON messages of api/run_matrix/stream as they
+// arrive, so the heatmap can be filled in row by row
+async function streamMatrix(
+  body: object,
+  onMessage: (message: GridMessage | RowMessage) => void,
+  signal: AbortSignal,
+): Promise<void> {
+  const resp = await fetch(solverUrl("api/run_matrix/stream", body), {
+    headers: {
+      Accept: "application/x-ndjson",
+    },
+    signal,
+  });
+  if (!resp.ok || resp.body === null) {
+    throw await resp.json();
+  }
+
+  const reader = resp.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += value;
+    const lines = buffer.split("\n");
+    buffer = lines.pop() ?? "";
+    for (const line of lines) {
+      if (line) onMessage(JSON.parse(line));
+    }
+  }
 }
 
 function formatNumber(n: number): string {
@@ -166,29 +231,67 @@ function Output({ inputs }: OutputProps) {
   const config = useContext(ConfigContext);
   const [state, setState] = useState<StateData | null>(null);
   const [cell, setCell] = useState<number[]>([5, 5]);
+  const [resultData, setResultData] = useState<ResultData | null>(null);
 
   useEffect(() => {
     if (inputs === null) return;
 
-    fetch(`${baseUrl}api/run_matrix`, {
-      method: "POST",
-      body: JSON.stringify(inputs),
-      headers: {
-        "Content-Type": "application/json",
-      },
-    })
-      .then((resp) => resp.json())
-      .then((json) => {
-        if (json.detail !== undefined) {
-          throw json;
+    const controller = new AbortController();
+    streamMatrix(
+      inputs,
+      (message) => {
+        if (message.type === "grid") {
+          setState({
+            plot: {
+              x: message.x,
+              y: message.y,
+              z: message.y.map(() => message.x.map(() => NaN)),
+            },
+          });
         } else {
-          return json;
+          setState(
+            (prev) =>
+              prev && {
+                plot: {
+                  ...prev.plot,
+                  z: prev.plot.z.map((row, i) =>
+                    i === message.row ? message.z : row,
+                  ),
+                },
+              },
+          );
         }
-      })
-      .then(setState)
-      .catch(console.error);
+      },
+      controller.signal,
+    ).catch((error) => {
+      if (!controller.signal.aborted) console.error(error);
+    });
+    return () => controller.abort();
   }, [inputs]);
 
+  useEffect(() => {
+    if (inputs === null) return;
+
+    // Details of a single cell are fetched on demand to keep the matrix small.
+    // A request for a cell that is no longer selected is aborted, so that a
+    // late response cannot replace that of the current cell.
+    const controller = new AbortController();
+    getJson<ResultData>(
+      "api/run_matrix/cell",
+      {
+        ...inputs,
+        rowIndex: cell[0],
+        columnIndex: cell[1],
+      },
+      controller.signal,
+    )
+      .then(setResultData)
+      .catch((error) => {
+        if (!controller.signal.aborted) console.error(error);
+      });
+    return () => controller.abort();
+  }, [inputs, cell]);
+
   if (inputs === null || state === null) return;
 
   const handleClick = (event: Readonly<Plotly.PlotMouseEvent>) => {
@@ -213,6 +316,7 @@ function Output({ inputs }: OutputProps) {
   for (let i = 0; i < state.plot.y.length; i++) {
     for (let j = 0; j < state.plot.x.length; j++) {
       const value = state.plot.z[i][j];
+      if (isNaN(value)) continue;
       const color = value < 5 ? "white" : "black";
 
       layout.annotations?.push({
@@ -231,9 +335,7 @@ function Output({ inputs }: OutputProps) {
   }
 
   let moreInfo = null;
-  if (cell !== null) {
-    const resultData = state.resultData[cell[0]][cell[1]];
-
+  if (resultData !== null) {
     const plotData: Partial<Plotly.PlotData>[] = Object.keys(
       config.molecules,
     ).flatMap((m) => {